@@ -2,48 +2,74 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from collections import namedtuple
+import asyncio
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import logging
 import logging.config
+import multiprocessing
 import os
 from pathlib import Path
+import random
+import shlex
 import sys
+import threading
 import time
 
-from everett.manager import ConfigManager, ConfigEnvFileEnv, ConfigOSEnv, ListOf, parse_class
+from everett.manager import (
+    ConfigManager,
+    ConfigEnvFileEnv,
+    ConfigOSEnv,
+    ListOf,
+    parse_bool,
+    parse_class
+)
 from everett.component import ConfigOptions, RequiredConfigMixin
 import markus
 
-from jansky.crash import Crash
-from jansky.rule import UUIDCorrection, CreateMetadata, SaveMetadata
+from jansky.crash import Crash, CrashBatch
+from jansky.pipeline import Pipeline, ScheduledPipeline
+from jansky.processed_crash import ProcessedCrash
+from jansky.rule import (
+    CreateMetadata,
+    InstrumentedRule,
+    SaveMetadata,
+    UUIDCorrection
+)
+from jansky.rules.breakpad_transform_rules import BreakpadStackwalkerRule
 from jansky.rules.general_transform_rules import (
     CPUInfoRule,
-    IdentifierRule,
+    FieldMappingRule,
+    IDENTIFIER_FIELD_MAPPINGS,
     OSInfoRule
 )
 from jansky.rules.mozilla_transform_rules import (
     AddonsRule,
+    COPY_FIELD_MAPPINGS,
     DatesAndTimesRule,
-    EnvironmentRule,
     ESRVersionRewrite,
     ExploitabilityRule,
     FennecBetaError20150430,
     FlashVersionRule,
-    JavaProcessRule,
     PluginContentURL,
     PluginRule,
     PluginUserComment,
     ProductRewrite,
-    ProductRule,
     ThemePrettyNameRule,
-    TopMostFilesRule,
-    UserDataRule,
-    Winsock_LSPRule
+    TopMostFilesRule
+)
+from jansky.rules.signature_utilities import (
+    CSignatureTool,
+    SignatureGenerationRule,
+    SigTrunc,
+    StackwalkerErrorSignatureRule
 )
 from jansky.sentry import (
     set_sentry_client,
     setup_sentry_logging,
 )
+from jansky.stackwalker import StackwalkerCache, StackwalkerPool
 
 
 logger = logging.getLogger(__name__)
@@ -196,130 +222,975 @@ class AppConfig(RequiredConfigMixin):
 WorkItem = namedtuple('WorkItem', ['context', 'crash_id'])
 
 
+class SingleItemBatchAdapter:
+    """Gives a generator that hands out one work item at a time the batch
+    protocol
+
+    ``get_next_batch`` calls ``get_next`` until it has enough work items or
+    the generator comes up empty. ``ack_batch`` acks each work item through
+    its context, and ``nack_batch`` nacks those whose context can be nacked
+    and leaves the rest for the source to redeliver.
+
+    """
+    def __init__(self, generator):
+        self.generator = generator
+
+    def get_next_batch(self, size):
+        batch = []
+        while len(batch) < size:
+            try:
+                workitem = self.generator.get_next()
+            except Exception:
+                if not batch:
+                    raise
+                # hand out what we have rather than losing it
+                logger.exception('Error getting next work item')
+                break
+            if workitem is None:
+                break
+            batch.append(workitem)
+        return batch
+
+    def ack_batch(self, workitems):
+        for workitem in workitems:
+            workitem.context.ack()
+
+    def nack_batch(self, workitems):
+        for workitem in workitems:
+            nack = getattr(workitem.context, 'nack', None)
+            if nack is not None:
+                nack()
+
+
+def as_batch_generator(generator):
+    """Returns a generator that supports the batch protocol
+
+    Generators that implement ``get_next_batch``, ``ack_batch`` and
+    ``nack_batch`` themselves are returned as they are, others are wrapped
+    in a ``SingleItemBatchAdapter``.
+
+    """
+    if hasattr(generator, 'get_next_batch'):
+        return generator
+    return SingleItemBatchAdapter(generator)
+
+
 class Worklist:
     """Generates crash ids to work on
 
-    If it's exhausted, by default it'll sleep for ``sleep_when_exhausted`` seconds and then try
-    again. If ``sleep_when_exhausted`` is <= 0, then it'll return.
+    Work items are pulled from the generator up to ``batch_size`` at a time
+    with ``get_next_batch(size)``, which returns a list of at most ``size``
+    work items. Generators can also ack and nack many work items in one go
+    with ``ack_batch(workitems)`` and ``nack_batch(workitems)``. Generators
+    that only implement ``get_next()`` get that through a
+    ``SingleItemBatchAdapter``.
+
+    If it's exhausted, by default it'll sleep and then try again. If
+    ``sleep_when_exhausted`` is <= 0, then it'll return instead.
+
+    Sleeps back off exponentially: the first one after work dries up is
+    ``min_sleep`` seconds, each one after that is twice as long up to
+    ``sleep_when_exhausted`` seconds, and the first work item that shows up
+    resets it. Every sleep is shortened by a random amount of up to
+    ``jitter`` times its length so that many processors don't poll in step.
+
+    Generators that can wait for work themselves, like a queue consumer doing
+    a long poll, can implement ``get_next_blocking(timeout)``. It should
+    return a work item as soon as there is one, or None after ``timeout``
+    seconds. The worklist calls it with ``sleep_when_exhausted`` instead of
+    sleeping.
+
+    If ``on_idle`` is set, it's called with no arguments every time the
+    generator comes up empty, before sleeping. Consumers use it to finish up
+    work they are holding on to while there's nothing new to do.
+
+    If iteration stops while work items of a batch haven't been handed out
+    yet, they're nacked so the source can hand them to someone else.
 
     """
-    def __init__(self, generator, sleep_when_exhausted=2):
+    def __init__(self, generator, sleep_when_exhausted=2, on_idle=None,
+                 min_sleep=0.05, jitter=0.25, batch_size=1):
         self.generator = generator
+        self.batches = as_batch_generator(generator)
         self.sleep_when_exhausted = sleep_when_exhausted
+        self.on_idle = on_idle
+        self.min_sleep = min_sleep
+        self.jitter = jitter
+        self.batch_size = batch_size
+
+    def _get(self, get_next, *args):
+        try:
+            return get_next(*args)
+
+        except Exception:
+            # FIXME(willkg): the generator should handle all errors and throw a serviceerror for
+            # the errors it handled. anything else should be raised as a "real error" here.
+            logger.exception('Error getting next work item')
+            return None
+
+    def ack_batch(self, workitems):
+        """Tells the source that the work items are done"""
+        self.batches.ack_batch(workitems)
+
+    def nack_batch(self, workitems):
+        """Tells the source that the work items won't be done here"""
+        self.batches.nack_batch(workitems)
 
     def __iter__(self):
         """Generates crash ids and completers"""
-        while True:
-            try:
-                workitem = self.generator.get_next()
+        get_next_blocking = getattr(self.generator, 'get_next_blocking', None)
+        delay = self.min_sleep
+        pending = deque()
 
-            except Exception:
-                # FIXME(willkg): the generator should handle all errors and throw a serviceerror for
-                # the errors it handled. anything else should be raised as a "real error" here.
-                pass
+        try:
+            while True:
+                if not pending:
+                    pending.extend(
+                        self._get(self.batches.get_next_batch, self.batch_size) or ()
+                    )
+
+                if pending:
+                    delay = self.min_sleep
+                    yield pending.popleft()
+                    continue
+
+                if self.on_idle is not None:
+                    self.on_idle()
+
+                if self.sleep_when_exhausted <= 0:
+                    return
+
+                if get_next_blocking is not None:
+                    workitem = self._get(get_next_blocking, self.sleep_when_exhausted)
+                    if workitem is not None:
+                        yield workitem
+                    continue
+
+                delay = min(delay, self.sleep_when_exhausted)
+                time.sleep(delay * (1 - self.jitter * random.random()))
+                delay *= 2
+        finally:
+            if pending:
+                try:
+                    self.nack_batch(list(pending))
+                except Exception:
+                    logger.exception('Error nacking unprocessed work items')
 
-            if workitem is not None:
-                yield workitem
 
-            elif self.sleep_when_exhausted > 0:
-                time.sleep(self.sleep_when_exhausted)
+def crash_nbytes(crash):
+    """Roughly estimates how much memory a fetched crash holds on to
 
-            else:
-                return
+    Counts the dumps held in the heap and the raw crash keys and values.
+    Memory-mapped dumps aren't counted. It's meant to be cheap rather than
+    exact.
+
+    """
+    nbytes = crash.dumps.memory_nbytes()
+    for key, val in crash.raw_crash.items():
+        nbytes += len(key) + len(str(val))
+    return nbytes
+
+
+class Prefetcher:
+    """Fetches the crashes for upcoming work items in the background
+
+    A producer thread pulls work items off ``workitems`` and starts fetching
+    their crashes on a thread pool so that fetch latency is hidden behind
+    processing of the current crash. Iterating over the prefetcher yields
+    ``(workitem, future)`` pairs in work item order, where the future
+    resolves to the fetched ``Crash``.
+
+    Read-ahead is bounded two ways: at most ``max_items`` work items are held
+    at a time, and no new fetch is started while the fetched but not yet
+    consumed crashes add up to ``max_bytes`` or more, as measured by
+    ``crash_nbytes``. Sizes are only known once a fetch completes, so fetches
+    in progress are counted at the running average crash size, and until the
+    first fetch completes only one fetch runs at a time. Memory use can still
+    overshoot ``max_bytes`` by however much the crashes being fetched are
+    bigger than average.
+
+    If iteration stops early, the work items read ahead are nacked, if
+    ``workitems`` has a ``nack_batch``, and their fetches are cancelled or
+    their crashes closed. The iterator over ``workitems`` is closed, so a
+    ``Worklist`` nacks what it's still holding too.
+
+    Usage::
+
+        for workitem, future in Prefetcher(worklist, fetch, max_items=4):
+            crash = future.result()
+
+    """
+    def __init__(self, workitems, fetch, max_items=4, max_bytes=256 * 1024 * 1024):
+        """
+        :arg Iterable workitems: the work items to prefetch, usually a
+        ``Worklist``
+
+        :arg Callable fetch: takes a crash id and returns a fetched ``Crash``
+
+        :arg int max_items: maximum number of work items read ahead
+
+        :arg int max_bytes: stop starting fetches once this many bytes of
+        fetched crashes are waiting to be consumed
+
+        """
+        self.workitems = workitems
+        self.fetch = fetch
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._held_bytes = 0
+        self._pending_fetches = 0
+        self._average_nbytes = None
+        self._exhausted = False
+        self._stopped = False
+
+    def _has_room(self):
+        if len(self._queue) >= self.max_items:
+            return False
+        if self._average_nbytes is None:
+            return self._pending_fetches == 0
+        projected = self._held_bytes + self._pending_fetches * self._average_nbytes
+        return projected < self.max_bytes
+
+    def _fetched(self, future):
+        if future.cancelled() or future.exception() is not None:
+            nbytes = None
+        else:
+            nbytes = crash_nbytes(future.result())
+        with self._condition:
+            self._pending_fetches -= 1
+            if nbytes is not None:
+                if self._average_nbytes is None:
+                    self._average_nbytes = nbytes
+                else:
+                    self._average_nbytes = 0.8 * self._average_nbytes + 0.2 * nbytes
+            future.nbytes = nbytes or 0
+            self._held_bytes += future.nbytes
+            self._condition.notify_all()
+
+    def _nack(self, workitems):
+        nack_batch = getattr(self.workitems, 'nack_batch', None)
+        if nack_batch is None or not workitems:
+            return
+        try:
+            nack_batch(workitems)
+        except Exception:
+            logger.exception('Error nacking unprocessed work items')
+
+    def _produce(self, executor):
+        workitems = iter(self.workitems)
+        try:
+            for workitem in workitems:
+                with self._condition:
+                    while not self._has_room() and not self._stopped:
+                        self._condition.wait()
+                    if self._stopped:
+                        self._nack([workitem])
+                        return
+                    future = executor.submit(self.fetch, workitem.crash_id)
+                    self._pending_fetches += 1
+                    self._queue.append((workitem, future))
+                    self._condition.notify_all()
+                future.add_done_callback(self._fetched)
+        finally:
+            # lets a Worklist nack what it's still holding on to
+            close = getattr(workitems, 'close', None)
+            if close is not None:
+                close()
+            with self._condition:
+                self._exhausted = True
+                self._condition.notify_all()
+
+    def _stop(self):
+        with self._condition:
+            self._stopped = True
+            queued, self._queue = list(self._queue), deque()
+            self._condition.notify_all()
+
+        for workitem, future in queued:
+            future.cancel()
+            future.add_done_callback(_close_fetched)
+        self._nack([workitem for workitem, _ in queued])
+
+    def __iter__(self):
+        executor = ThreadPoolExecutor(max_workers=self.max_items)
+        producer = threading.Thread(target=self._produce, args=(executor,), daemon=True)
+        producer.start()
+        try:
+            while True:
+                with self._condition:
+                    while not self._queue and not self._exhausted:
+                        self._condition.wait()
+                    if not self._queue:
+                        return
+                    workitem, future = self._queue.popleft()
+
+                    # wait until the done callback has accounted for the fetch
+                    while not hasattr(future, 'nbytes'):
+                        self._condition.wait()
+                    self._held_bytes -= future.nbytes
+                    self._condition.notify_all()
+
+                yield workitem, future
+        finally:
+            # anything read ahead won't be processed here
+            self._stop()
+            executor.shutdown(wait=False)
+
+
+def _close_fetched(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
 
 
-class Processor:
+RULE_SCHEDULERS = ('sequential', 'scheduled')
+
+
+def parse_rule_scheduler(value):
+    """Parses the rule_scheduler option, one of ``RULE_SCHEDULERS``"""
+    value = value.strip().lower()
+    if value not in RULE_SCHEDULERS:
+        raise ValueError('%r is not one of %s' % (value, ', '.join(RULE_SCHEDULERS)))
+    return value
+
+
+class Processor(RequiredConfigMixin):
+    """Pulls crash ids off the worklist and runs each through the pipeline"""
+    required_config = ConfigOptions()
+    required_config.add_option(
+        'rule_scheduler',
+        default='sequential',
+        doc=(
+            'How crashes go through the rules. "sequential" runs every rule '
+            'in order. "scheduled" orders rules by the fields they declare, '
+            'skips rules whose required fields are missing from the crash '
+            'and can run independent rules at the same time, see '
+            'rule_threads. Batches always run sequentially.'
+        ),
+        parser=parse_rule_scheduler
+    )
+    required_config.add_option(
+        'rule_threads',
+        default='0',
+        doc=(
+            'With the "scheduled" rule scheduler, the number of threads to run '
+            'independent rules of a crash on at the same time. With 0 they '
+            'run one after another.'
+        ),
+        parser=int
+    )
+    required_config.add_option(
+        'instrument_rules',
+        default='false',
+        doc=(
+            'Whether to emit per-rule timings, predicate hit/miss counts and '
+            'suppressed error counts. Off by default to keep the overhead off '
+            'the per-crash path.'
+        ),
+        parser=parse_bool
+    )
+    required_config.add_option(
+        'worker_count',
+        default='1',
+        doc=(
+            'Number of worker processes to fork for processing crashes. With '
+            '1, crashes are processed in the main process. With more, the main '
+            'process pulls from the worklist and acks while the forked workers '
+            'share its rules copy-on-write.'
+        ),
+        parser=int
+    )
+    required_config.add_option(
+        'idle_min_sleep',
+        default='0.05',
+        doc='Seconds to sleep the first time the worklist comes up empty.',
+        parser=float
+    )
+    required_config.add_option(
+        'idle_max_sleep',
+        default='2',
+        doc=(
+            'Longest sleep in seconds when the worklist stays empty; sleeps '
+            'double from IDLE_MIN_SLEEP up to this. Also the long-poll timeout '
+            'for generators that can block.'
+        ),
+        parser=float
+    )
+    required_config.add_option(
+        'prefetch_count',
+        default='0',
+        doc=(
+            'Number of upcoming crashes to fetch in the background while the '
+            'current one is processed. 0 turns prefetching off.'
+        ),
+        parser=int
+    )
+    required_config.add_option(
+        'prefetch_max_bytes',
+        default=str(256 * 1024 * 1024),
+        doc='Stop prefetching while this many bytes of fetched crashes are waiting.',
+        parser=int
+    )
+    required_config.add_option(
+        'crashstorage_class',
+        default='jansky.crashstorage.FSCrashStorage',
+        doc=(
+            'The crash storage class crashes are fetched from and saved to. '
+            'Its options are set with a CRASHSTORAGE_ prefix.'
+        ),
+        parser=parse_class
+    )
+    required_config.add_option(
+        'stackwalker_command',
+        default='',
+        doc=(
+            'Command line that starts a long-lived stackwalker process. If '
+            'empty, dumps are not walked.'
+        )
+    )
+    required_config.add_option(
+        'stackwalker_pool_size',
+        default='1',
+        doc=(
+            'Number of stackwalker processes to keep running. With forked '
+            'workers, every worker gets this many.'
+        ),
+        parser=int
+    )
+    required_config.add_option(
+        'stackwalker_timeout',
+        default='600',
+        doc='Seconds to wait for the stackwalker to walk a dump before killing it.',
+        parser=float
+    )
+    required_config.add_option(
+        'stackwalker_max_output_bytes',
+        default=str(32 * 1024 * 1024),
+        doc=(
+            'Stackwalker output longer than this is spooled to disk and read '
+            'a chunk at a time, keeping at most STACKWALKER_MAX_THREADS threads '
+            'and STACKWALKER_MAX_FRAMES frames per thread.'
+        ),
+        parser=int
+    )
+    required_config.add_option(
+        'stackwalker_max_threads',
+        default='256',
+        doc='Threads to keep from stackwalker output.',
+        parser=int
+    )
+    required_config.add_option(
+        'stackwalker_max_frames',
+        default='500',
+        doc='Frames per thread to keep from stackwalker output.',
+        parser=int
+    )
+    required_config.add_option(
+        'stackwalker_cache_version',
+        default='',
+        doc=(
+            'Version of the stackwalker and symbols, part of the key of cached '
+            'stackwalker output. Change it whenever either changes.'
+        )
+    )
+    required_config.add_option(
+        'stackwalker_cache_memory_bytes',
+        default='0',
+        doc=(
+            'Bytes of stackwalker output to cache in memory, keyed by the dump '
+            'contents. 0 turns the in-memory cache off.'
+        ),
+        parser=int
+    )
+    required_config.add_option(
+        'stackwalker_cache_dir',
+        default='',
+        doc='Directory to cache stackwalker output in. Empty turns it off.'
+    )
+    required_config.add_option(
+        'stackwalker_cache_disk_bytes',
+        default=str(1024 * 1024 * 1024),
+        doc='Bytes of stackwalker output to keep in STACKWALKER_CACHE_DIR.',
+        parser=int
+    )
+    required_config.add_option(
+        'signature_cache_size',
+        default='10000',
+        doc=(
+            'Number of signatures to keep cached by the frames they were '
+            'generated from.'
+        ),
+        parser=int
+    )
+    required_config.add_option(
+        'worklist_batch_size',
+        default='10',
+        doc='Maximum number of work items to pull from the work generator at once.',
+        parser=int
+    )
+    required_config.add_option(
+        'ack_batch_size',
+        default='10',
+        doc=(
+            'Number of completed work items to collect before acking them '
+            'together. Collected acks are also sent whenever the worklist is '
+            'empty and when the processor stops. 1 acks every work item right '
+            'away.'
+        ),
+        parser=int
+    )
+    required_config.add_option(
+        'compact_processed_crashes',
+        default='false',
+        doc=(
+            'Whether to hold processed crashes in slot-based records with '
+            'interned values instead of dicts. Saves memory when many crashes '
+            'are held at once, like in batches.'
+        ),
+        parser=parse_bool
+    )
+
     def __init__(self, config):
-        self.config = config
+        self.config = config.with_options(self)
+        self.processed_crash_class = dict
+        if self.config('compact_processed_crashes'):
+            self.processed_crash_class = ProcessedCrash
+        self.crashstorage = self.config('crashstorage_class')(
+            config.with_namespace('crashstorage')
+        )
 
         self.generator = None  # FIXME(willkg): this should be rabbitmq or cmd args or whatever.
-        self.worklist = Worklist(self.generator)
+        self.worklist = Worklist(
+            self.generator,
+            sleep_when_exhausted=self.config('idle_max_sleep'),
+            on_idle=self.flush_acks,
+            min_sleep=self.config('idle_min_sleep'),
+            batch_size=self.config('worklist_batch_size')
+        )
+
+        # acks are collected and sent in batches; run modes ack from
+        # different threads than the worklist goes idle in
+        self._acks = []
+        self._acks_lock = threading.Lock()
+
+        self.stackwalker_pool = None
+        if self.config('stackwalker_command'):
+            self.stackwalker_pool = StackwalkerPool(
+                shlex.split(self.config('stackwalker_command')),
+                size=self.config('stackwalker_pool_size'),
+                timeout=self.config('stackwalker_timeout'),
+                max_output_bytes=self.config('stackwalker_max_output_bytes')
+            )
+
+        self.stackwalker_cache = None
+        cache_memory_bytes = self.config('stackwalker_cache_memory_bytes')
+        cache_dir = self.config('stackwalker_cache_dir')
+        if cache_memory_bytes > 0 or cache_dir:
+            self.stackwalker_cache = StackwalkerCache(
+                version=self.config('stackwalker_cache_version'),
+                max_memory_bytes=cache_memory_bytes,
+                directory=cache_dir or None,
+                max_disk_bytes=self.config('stackwalker_cache_disk_bytes')
+            )
+
+        self.signature_tool = CSignatureTool(
+            signature_cache_size=self.config('signature_cache_size')
+        )
+
+        # The rules are built and validated once here and shared by every
+        # crash this processor handles.
+        rules = self.build_rules()
+        if self.config('instrument_rules'):
+            rules = [InstrumentedRule(rule) for rule in rules]
+        self.batch_pipeline = Pipeline(*rules)
+        self.pipeline = self.batch_pipeline
+        if self.config('rule_scheduler') == 'scheduled':
+            executor = None
+            if self.config('rule_threads') > 0:
+                executor = ThreadPoolExecutor(max_workers=self.config('rule_threads'))
+            self.pipeline = ScheduledPipeline(*rules, executor=executor)
+
+    def build_rules(self):
+        """Returns the ordered list of rule instances to apply to each crash"""
+        stackwalker_rules = []
+        if self.stackwalker_pool is not None:
+            stackwalker_rules.append(BreakpadStackwalkerRule(
+                self.stackwalker_pool,
+                cache=self.stackwalker_cache,
+                max_threads=self.config('stackwalker_max_threads'),
+                max_frames=self.config('stackwalker_max_frames')
+            ))
+
+        return [
+            # initialize
+            UUIDCorrection(),
+            CreateMetadata(),
+
+            # rules to change the internals of the raw crash
+            ProductRewrite(),
+            ESRVersionRewrite(),
+            PluginContentURL(),
+            PluginUserComment(),
+            FennecBetaError20150430(),
+
+            # rules to transform a raw crash into a processed crash
+            #
+        ] + stackwalker_rules + [
+            # IdentifierRule, ProductRule, UserDataRule, EnvironmentRule,
+            # JavaProcessRule and Winsock_LSPRule in one
+            FieldMappingRule(IDENTIFIER_FIELD_MAPPINGS + COPY_FIELD_MAPPINGS),
+            PluginRule(),
+            AddonsRule(),
+            DatesAndTimesRule(),
+            # s.p.mozilla_transform_rules.OutOfMemoryBinaryRule
+
+            # post processing of the processed crash
+            #
+            # s.p.breakpad_transform_rules.CrashingThreadRule
+            CPUInfoRule(),
+            OSInfoRule(),
+            # s.p.mozilla_transform_rules.BetaVersionRule(),
+            ExploitabilityRule(),
+            FlashVersionRule(),
+            # s.p.mozilla_transform_rules.OSPrettyVersionRule
+            TopMostFilesRule(),
+            # s.p.mozilla_transform_rules.MissingSymbolsRule
+            ThemePrettyNameRule(),
+
+            SignatureGenerationRule(self.signature_tool),
+            StackwalkerErrorSignatureRule(),
+            # s.p.signature_utilities.OOMSignature
+            # s.p.signature_utilities.AbortSignature
+            # s.p.signature_utilities.SignatureShutdownTimeout
+            # s.p.signature_utilities.SignatureRunWatchDog
+            # s.p.signature_utilities.SignatureIPCChannelError
+            # s.p.signature_utilities.SignatureIPCMessageName
+            SigTrunc(),
+
+            # a set of classfiers for support
+            # TODO: this was apply_until_action_succeeds
+            #
+            # s.p.support_classifiers.BitguardClassifier
+            # s.p.support_classifiers.OutOfDateClassifier
+
+            # a set of classifiers t help with jit crashes
+            #
+            # s.p.breakpad_transform_rules.JitCrashCategorizeRule
+            # s.p.signature_utilities.SignatureJitCategory
+
+            # a set of special request classifiers
+            # TODO: this was apply_until_action_succeeds
+            #
+            # s.p.skunk_classifiers.DontConsiderTheseFilter
+            # s.p.skunk_classifiers.SetWindowPos
+            # s.p.skunk_classifiers.NullClassification
+
+            # finalize
+            SaveMetadata(),
+        ]
 
     def run(self):
+        try:
+            if self.config('worker_count') > 1:
+                return self.run_pool(self.config('worker_count'))
+
+            if self.config('prefetch_count') > 0:
+                return self.run_prefetching(self.config('prefetch_count'))
+
+            # FIXME(willkg): fix this loop. add exception handling to it.
+            for workitem in self.worklist:
+                logger.info('Processing %s', workitem.crash_id)
+                was_completed = self.run_one(workitem.crash_id)
+                if was_completed:
+                    self.ack(workitem)
+        finally:
+            self.flush_acks()
+
+    def run_prefetching(self, prefetch_count):
+        """Processes work items while the next ones are fetched in the background
+
+        :arg int prefetch_count: the number of work items to read ahead
+
+        """
+        prefetcher = Prefetcher(
+            self.worklist,
+            self.fetch,
+            max_items=prefetch_count,
+            max_bytes=self.config('prefetch_max_bytes')
+        )
         # FIXME(willkg): fix this loop. add exception handling to it.
-        for workitem in self.worklist:
+        for workitem, future in prefetcher:
             logger.info('Processing %s', workitem.crash_id)
-            was_completed = self.run_one(workitem.crash_id)
+            was_completed = self.process(future.result())
             if was_completed:
-                workitem.context.ack()
+                self.ack(workitem)
+
+    def run_pool(self, worker_count):
+        """Fans work items out to forked worker processes
+
+        The worker processes are forked after the pipeline is built so they
+        share it copy-on-write, along with logging and metrics set up. Only
+        crash ids go to the workers and only a completed flag comes back, all
+        worklist interaction and acking happens in this process.
+
+        At most two work items per worker are in flight at a time. A worker
+        that dies, say to the OOM killer, takes the pool down with it: the
+        work items in flight that didn't complete are nacked and a new pool
+        is forked.
+
+        :arg int worker_count: the number of processes to fork
+
+        """
+        global _pool_processor
+        _pool_processor = self
+
+        max_in_flight = worker_count * 2
+        in_flight = deque()
+
+        context = multiprocessing.get_context('fork')
+        pool = ProcessPoolExecutor(max_workers=worker_count, mp_context=context)
+
+        def restart(unfinished):
+            nonlocal pool
+            # the rest of what was in flight is done, one way or the other
+            while in_flight:
+                workitem, future = in_flight.popleft()
+                if not self._finish_pooled(workitem, future):
+                    unfinished.append(workitem)
+            logger.error(
+                'Worker process died, nacking %s and restarting workers',
+                ', '.join(workitem.crash_id for workitem in unfinished)
+            )
+            self.worklist.nack_batch(unfinished)
+            pool.shutdown(wait=False)
+            pool = ProcessPoolExecutor(max_workers=worker_count, mp_context=context)
+
+        def finish_next():
+            workitem, future = in_flight.popleft()
+            if not self._finish_pooled(workitem, future):
+                restart([workitem])
+
+        old_on_idle = self.worklist.on_idle
+
+        def finish_ready():
+            while in_flight and in_flight[0][1].done():
+                finish_next()
+            if old_on_idle is not None:
+                old_on_idle()
+
+        self.worklist.on_idle = finish_ready
+        try:
+            for workitem in self.worklist:
+                logger.info('Processing %s', workitem.crash_id)
+                try:
+                    future = pool.submit(_pool_run_one, workitem.crash_id)
+                except BrokenProcessPool:
+                    restart([workitem])
+                    continue
+                in_flight.append((workitem, future))
+                if len(in_flight) >= max_in_flight:
+                    finish_next()
+                finish_ready()
+
+            while in_flight:
+                finish_next()
+        finally:
+            self.worklist.on_idle = old_on_idle
+            _pool_processor = None
+            pool.shutdown()
+
+    def _finish_pooled(self, workitem, future):
+        """Acks a work item that completed in a worker
+
+        :returns Boolean: False if the pool broke before it finished
+
+        """
+        try:
+            completed = future.result()
+        except BrokenProcessPool:
+            return False
+        if completed:
+            self.ack(workitem)
+        return True
+
+    def ack(self, workitem):
+        """Tells the source of a work item that it's done
+
+        Acks are collected and sent to the source ``ack_batch_size`` at a
+        time by ``flush_acks``.
+
+        """
+        with self._acks_lock:
+            self._acks.append(workitem)
+            if len(self._acks) < self.config('ack_batch_size'):
+                return
+            workitems, self._acks = self._acks, []
+        self._send_acks(workitems)
+
+    def flush_acks(self):
+        """Sends any acks that have been collected"""
+        with self._acks_lock:
+            workitems, self._acks = self._acks, []
+        if workitems:
+            self._send_acks(workitems)
+
+    def _send_acks(self, workitems):
+        try:
+            self.worklist.ack_batch(workitems)
+        except Exception:
+            # the source will hand the work items out again
+            logger.exception('Error acking %d work items', len(workitems))
+
+    def run_many(self, crash_ids):
+        """Fetches, transforms and saves a batch of crashes rule by rule
+
+        This is meant for bulk work like reprocessing where there's no
+        worklist to ack.
+
+        """
+        batch = CrashBatch(crash_ids, self.processed_crash_class)
+        try:
+            batch.fetch(storage=self.crashstorage)
+            self.batch_pipeline.apply(batch).save(storage=self.crashstorage)
+        finally:
+            for crash in batch:
+                crash.close()
 
-    # FIXME(willkg): this is all prototypey filler
     def run_one(self, crash_id):
-        # while True:
+        """Fetches, transforms and saves a single crash
+
+        :returns: True if the crash was saved
+
+        """
+        return self.process(self.fetch(crash_id))
+
+    def fetch(self, crash_id):
+        """Returns a fetched crash"""
+        return Crash(crash_id, self.processed_crash_class).fetch(storage=self.crashstorage)
+
+    def process(self, crash):
+        """Transforms and saves a fetched crash
+
+        :returns: True if the crash was saved
+
+        """
+        try:
+            self.pipeline.apply(crash).save(storage=self.crashstorage)
+            return True
+        finally:
+            crash.close()
+
+
+class AsyncProcessor(Processor):
+    """Processor that overlaps fetching, transforming and saving crashes
+
+    An asyncio event loop keeps up to ``max_in_flight`` crashes in progress.
+    Fetching and saving are coroutines, so storage round-trips for some
+    crashes wait while the rules run for others. The rules themselves are
+    CPU-bound and run in an executor so they don't block the loop.
+
+    Usage::
+
+        processor = AsyncProcessor(config)
+        processor.run()
+
+    For testing, or for storage with native asyncio clients, ``fetcher`` and
+    ``saver`` can be coroutine functions with the rule signature.
+
+    """
+    required_config = ConfigOptions()
+    required_config.add_option(
+        'max_in_flight',
+        default='8',
+        doc='Maximum number of crashes being fetched, processed or saved at once.',
+        parser=int
+    )
+
+    def __init__(self, config, fetcher=None, saver=None, executor=None):
+        """
+        :arg config: everett config manager
+
+        :arg Callable fetcher: coroutine function used to fetch crashes
+
+        :arg Callable saver: coroutine function used to save crashes
+
+        :arg Executor executor: executor the pipeline runs in; defaults to
+        the event loop's default executor
+
+        """
+        super().__init__(config)
+        self.fetcher = fetcher
+        self.saver = saver
+        self.executor = executor
+
+    def run(self):
+        loop = asyncio.new_event_loop()
         try:
-            Crash(crash_id).fetch().pipeline(
-                # initialize
-                UUIDCorrection(),
-                CreateMetadata(),
-
-                # rules to change the internals of the raw crash
-                ProductRewrite(),
-                ESRVersionRewrite(),
-                PluginContentURL(),
-                PluginUserComment(),
-                FennecBetaError20150430(),
-
-                # rules to transform a raw crash into a processed crash
-                #
-                IdentifierRule(),
-                # s.p.breakpad_transform_rules.BreakpadStackwalkerRule2015
-                ProductRule(),
-                UserDataRule(),
-                EnvironmentRule(),
-                PluginRule(),
-                AddonsRule(),
-                DatesAndTimesRule(),
-                # s.p.mozilla_transform_rules.OutOfMemoryBinaryRule
-                JavaProcessRule(),
-                Winsock_LSPRule(),
-
-                # post processing of the processed crash
-                #
-                # s.p.breakpad_transform_rules.CrashingThreadRule
-                CPUInfoRule(),
-                OSInfoRule(),
-                # s.p.mozilla_transform_rules.BetaVersionRule(),
-                ExploitabilityRule(),
-                FlashVersionRule(),
-                # s.p.mozilla_transform_rules.OSPrettyVersionRule
-                TopMostFilesRule(),
-                # s.p.mozilla_transform_rules.MissingSymbolsRule
-                ThemePrettyNameRule(),
-
-                # s.p.signature_utilities.SignatureGenerationRule
-                # s.p.signature_utilities.StackwalkerErrorSignatureRule
-                # s.p.signature_utilities.OOMSignature
-                # s.p.signature_utilities.AbortSignature
-                # s.p.signature_utilities.SignatureShutdownTimeout
-                # s.p.signature_utilities.SignatureRunWatchDog
-                # s.p.signature_utilities.SignatureIPCChannelError
-                # s.p.signature_utilities.SignatureIPCMessageName
-                # s.p.signature_utilities.SigTrunc
-
-                # a set of classfiers for support
-                # TODO: this was apply_until_action_succeeds
-                #
-                # s.p.support_classifiers.BitguardClassifier
-                # s.p.support_classifiers.OutOfDateClassifier
-
-                # a set of classifiers t help with jit crashes
-                #
-                # s.p.breakpad_transform_rules.JitCrashCategorizeRule
-                # s.p.signature_utilities.SignatureJitCategory
-
-                # a set of special request classifiers
-                # TODO: this was apply_until_action_succeeds
-                #
-                # s.p.skunk_classifiers.DontConsiderTheseFilter
-                # s.p.skunk_classifiers.SetWindowPos
-                # s.p.skunk_classifiers.NullClassification
-
-                # finalize
-                SaveMetadata(),
-            ).save()
+            loop.run_until_complete(self.run_async())
         finally:
-            # TODO: clean up any temp files, dumps, etc
-            pass
+            loop.close()
+            self.flush_acks()
+
+    async def run_async(self):
+        """Processes work items until the worklist is done"""
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(self.config('max_in_flight'))
+        tasks = set()
+
+        # the worklist may block while it waits for work, so it gets a
+        # thread of its own
+        worklist_executor = ThreadPoolExecutor(max_workers=1)
+        worklist = iter(self.worklist)
+        try:
+            while True:
+                await in_flight.acquire()
+                workitem = await loop.run_in_executor(
+                    worklist_executor, next, worklist, None
+                )
+                if workitem is None:
+                    in_flight.release()
+                    break
+
+                task = asyncio.ensure_future(self.run_one_async(workitem, in_flight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            worklist_executor.shutdown(wait=False)
+
+    async def run_one_async(self, workitem, in_flight):
+        """Fetches, transforms, saves and acks a single work item"""
+        loop = asyncio.get_running_loop()
+        logger.info('Processing %s', workitem.crash_id)
+        crash = Crash(workitem.crash_id, self.processed_crash_class)
+        try:
+            await crash.fetch_async(self.fetcher, storage=self.crashstorage)
+            await loop.run_in_executor(self.executor, self.pipeline.apply, crash)
+            await crash.save_async(self.saver, storage=self.crashstorage)
+            self.ack(workitem)
+        except Exception:
+            logger.exception('Error while processing %s', workitem.crash_id)
+        finally:
+            crash.close()
+            in_flight.release()
+
+
+# The processor whose pipeline forked pool workers use; it's set in the parent
+# before forking so the workers inherit it.
+_pool_processor = None
+
+
+def _pool_run_one(crash_id):
+    """Runs in a forked worker process, returns whether the crash completed"""
+    try:
+        return bool(_pool_processor.run_one(crash_id))
+    except Exception:
+        logger.exception('Error while processing %s', crash_id)
+        return False
 
 
 def main(args, config=None):
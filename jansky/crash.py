@@ -2,9 +2,12 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import asyncio
+from functools import partial
 import logging
 
-from jansky.rule import Identity
+from jansky.crashstorage import CrashIDNotFound, DumpsMapping
+from jansky.rule import Identity, InstrumentedRule
 
 
 logger = logging.getLogger(__name__)
@@ -24,16 +27,28 @@ Usage::
       .transform(rule_printer)
       .save()
 
+Many crashes can be worked on together, one rule at a time::
+
+    batch = CrashBatch(crash_ids)
+
+    batch.fetch()
+      .pipeline(rule1, rule2, rule_printer)
+      .save()
+
 """
 
 
 class Crash:
-    def __init__(self, crash_id):
+    def __init__(self, crash_id, processed_crash_class=dict):
         """construct a class object with a given crash_id and initialize
         other fields as empty
 
         :arg String crash_id: crash key for indexing
 
+        :arg Callable processed_crash_class: makes the empty processed crash
+        mapping; a ``jansky.processed_crash.ProcessedCrash`` takes less memory
+        than the default dict
+
         Examples::
 
             Crash('AAAAAAAA-1111-4242-FFFB-094F01B8FF11')
@@ -46,19 +61,22 @@ class Crash:
         # a mapping containing the raw crash meta data
         self.raw_crash = {}
 
-        # a mapping of dump name keys and paths to file system locations
-        # for the dump data
-        self.dumps = {}  # TODO implement, see
-        # socorro.external.crashstorage_base.MemoryDumpsMapping()
+        # a mapping of dump name keys to dump data, backed by files or
+        # memory maps where possible
+        self.dumps = DumpsMapping()
 
         # a mapping containing the processed crash meta data
-        self.processed_crash = {}  # TODO DotDict()
+        self.processed_crash = processed_crash_class()
 
         # stores supressed errors that occur during transformation steps
         # for the lifetime of this crash object, intended to be append and
         # read only
         self._errors = []
 
+    def close(self):
+        """releases the dumps; the crash shouldn't be used afterwards"""
+        self.dumps.close()
+
     def transform(self, rule=Identity, supress_errors=False):
         """applies a transformation to the internal crash state
 
@@ -77,18 +95,30 @@ class Crash:
         try:
             rule(self.crash_id, self.raw_crash, self.dumps, self.processed_crash)
         except Exception as x:
-            logger.warning(
-                'Error while processing %s: %s',
-                self.crash_id,
-                str(x),
-                exc_info=True
-            )
-            if not supress_errors:
+            if not self._record_error(rule, x, supress_errors):
                 raise
-            self._errors.append(x)
 
         return self
 
+    def _record_error(self, rule, error, supress_errors):
+        """logs an error raised by a rule and stores it if it's supressed
+
+        :returns Boolean: whether the error was supressed
+
+        """
+        logger.warning(
+            'Error while processing %s: %s',
+            self.crash_id,
+            str(error),
+            exc_info=error
+        )
+        if not supress_errors:
+            return False
+        self._errors.append(error)
+        if isinstance(rule, InstrumentedRule):
+            rule.record_suppressed_error(error)
+        return True
+
     def pipeline(self, *args, suppress_errors=False):
         """sugar for applying multiple transformations
 
@@ -102,75 +132,275 @@ class Crash:
             self.transform(arg, supress_errors=suppress_errors)
         return self
 
-    def fetch(self, supress_errors=False):
+    def fetch(self, supress_errors=False, storage=None):
         """fetch remote crash information, overwriting local state.
 
         supress_errors - Boolean should errors be supressed and stored
         internally
 
+        :arg CrashStorageBase storage: where to fetch the crash from
+
         :raises Error: this touches the network, so all kinds of things may go
         wrong. These errors are generally fatal and should not be supressed.
 
         """
-        self.transform(get_crash_data, supress_errors)
+        self.transform(partial(get_crash_data, storage=storage), supress_errors)
         return self
 
-    def save(self, supress_errors=False):
+    def save(self, supress_errors=False, storage=None):
         """write local crash information to remote sources, overwriting their
         representation with this object's state.
 
+        :arg CrashStorageBase storage: where to save the crash to
+
         :raises Error: high seas in a rickety boat, here. Errors here are
         generally fatal and should not be supressed.
 
         """
-        self.transform(put_crash_data, supress_errors)
+        self.transform(partial(put_crash_data, storage=storage), supress_errors)
+        return self
+
+    async def transform_async(self, rule, supress_errors=False):
+        """awaits a coroutine transformation of the internal crash state
+
+        The asyncio counterpart of ``transform`` for rules that do I/O, like
+        fetching and saving. Errors are handled the same way.
+
+        :arg Callable rule: coroutine function that will perform the
+        transformation
+
+        :arg Boolean supress_errors: should errors be supressed and stored
+        internally
+
+        """
+        try:
+            await rule(self.crash_id, self.raw_crash, self.dumps, self.processed_crash)
+        except Exception as x:
+            if not self._record_error(rule, x, supress_errors):
+                raise
         return self
 
+    async def fetch_async(self, fetcher=None, supress_errors=False, storage=None):
+        """asyncio version of ``fetch``
+
+        :arg Callable fetcher: coroutine function with the rule signature that
+        fills in the crash; defaults to ``async_get_crash_data``
+
+        :arg CrashStorageBase storage: where the default fetcher fetches the
+        crash from
+
+        """
+        fetcher = fetcher or partial(async_get_crash_data, storage=storage)
+        await self.transform_async(fetcher, supress_errors)
+        return self
+
+    async def save_async(self, saver=None, supress_errors=False, storage=None):
+        """asyncio version of ``save``
+
+        :arg Callable saver: coroutine function with the rule signature that
+        writes the crash out; defaults to ``async_put_crash_data``
+
+        :arg CrashStorageBase storage: where the default saver saves the
+        crash to
+
+        """
+        saver = saver or partial(async_put_crash_data, storage=storage)
+        await self.transform_async(saver, supress_errors)
+        return self
+
+
+class CrashBatch:
+    def __init__(self, crash_ids, processed_crash_class=dict):
+        """construct a batch of crash objects, one per crash_id
+
+        A batch applies each rule to every crash before moving on to the next
+        rule. Rules that implement ``action_many`` get all the crashes their
+        predicate accepted in a single call, every other rule is called once
+        per crash exactly like ``Crash.transform`` would.
+
+        ``action_many`` takes a list of ``(crash_id, raw_crash, dumps,
+        processed_crash)`` tuples and must have the same effect as calling
+        ``action`` on each of them. An error with one crash mustn't stop the
+        others: ``action_many`` returns a list with, for each crash, the
+        exception its action raised or ``None``, so that it's recorded on
+        that crash alone.
+
+        :arg Iterable crash_ids: crash keys for indexing
+
+        :arg Callable processed_crash_class: makes each crash's empty
+        processed crash mapping, see ``Crash``
+
+        Examples::
+
+            CrashBatch(['AAAAAAAA-1111-4242-FFFB-094F01B8FF11', ...])
+
+        :returns CrashBatch: a batch of mostly-unitialized crash objects
+
+        """
+        self.crashes = [
+            Crash(crash_id, processed_crash_class) for crash_id in crash_ids
+        ]
+
+    def __len__(self):
+        return len(self.crashes)
+
+    def __iter__(self):
+        return iter(self.crashes)
+
+    def transform(self, rule=Identity, supress_errors=False):
+        """applies a transformation to every crash in the batch
 
-def get_crash_data(crash_id, raw_crash, dumps, processed_crash):
+        :arg Callable rule: callable that will perform the transformation
+
+        :arg Boolean supress_errors: should errors be supressed and stored
+        on the crashes they happened to. Errors ``action_many`` returns are
+        recorded on their own crash, one it raises on every crash that was
+        passed to it.
+
+        :raises Error: if supress_errors is False this may raise arbitrary
+        errors
+
+        """
+        action_many = getattr(rule, 'action_many', None)
+        if action_many is None:
+            for crash in self.crashes:
+                crash.transform(rule, supress_errors=supress_errors)
+            return self
+
+        selected = []
+        for crash in self.crashes:
+            try:
+                if rule.predicate(
+                    crash.crash_id,
+                    crash.raw_crash,
+                    crash.dumps,
+                    crash.processed_crash
+                ):
+                    selected.append(crash)
+            except Exception as x:
+                if not crash._record_error(rule, x, supress_errors):
+                    raise
+
+        if not selected:
+            return self
+
+        try:
+            errors = action_many([
+                (crash.crash_id, crash.raw_crash, crash.dumps, crash.processed_crash)
+                for crash in selected
+            ])
+        except Exception as x:
+            for crash in selected:
+                if not crash._record_error(rule, x, supress_errors):
+                    raise
+            return self
+
+        for crash, error in zip(selected, errors or ()):
+            if error is not None and not crash._record_error(rule, error, supress_errors):
+                raise error
+
+        return self
+
+    def pipeline(self, *args, suppress_errors=False):
+        """sugar for applying multiple transformations to the whole batch
+
+        :arg Callables *args: an arbitrary number of callable rules to
+        be executed in succession
+
+        :raises Error: if supress_errors is False this may raise arbitrary
+        errors
+        """
+        for arg in args:
+            self.transform(arg, supress_errors=suppress_errors)
+        return self
+
+    def fetch(self, supress_errors=False, storage=None):
+        """fetch remote crash information for every crash in the batch"""
+        for crash in self.crashes:
+            crash.fetch(supress_errors, storage=storage)
+        return self
+
+    def save(self, supress_errors=False, storage=None):
+        """write local crash information for every crash in the batch"""
+        for crash in self.crashes:
+            crash.save(supress_errors, storage=storage)
+        return self
+
+
+def get_crash_data(crash_id, raw_crash, dumps, processed_crash, storage=None):
     """Attempt to fetch everything we know about a crash_id.
 
     If the raw_crash or raw_dumps cannot be found, abort.
-    If the processed_crash exists, reuse that, else creat one.
+    If the processed_crash exists, reuse that, else start from an empty one.
+
+    :arg CrashStorageBase storage: where to fetch the crash from; without
+    one there's nothing to fetch and the crash is left as it is
+
+    :raises CrashIDNotFound: if the storage doesn't have the raw crash or
+    its dumps
+
     """
-    # TODO: implement get_raw_crash, get_raw_dumps_as_files
-    # TODO: clean this up
-    return
+    if storage is None:
+        return
     try:
-        # socorro/external/boto/BotoCrashStorage.get_raw_crash()
-        raw_crash = get_raw_crash(crash_id)
-        # socorro/external/boto/BotoCrashStorage.get_raw_dumps_as_files()
-        dumps = get_raw_dumps_as_files(crash_id)
-        try:
-            # socorro/external/boto/BotoCrashStorage.get_unredacted_processed()
-            processed_crash = get_unredacted_processed(crash_id)
-        except CrashIDNotFound:
-            processed_crash = DotDict()
+        raw_crash.update(storage.get_raw_crash(crash_id))
+        for name, path in storage.get_dumps_as_files(crash_id).items():
+            dumps.set_path(name, path)
     except CrashIDNotFound:
-        _reject(crash_id, 'CrashIDNotFound')  # from processor2015/processor_2015.py
+        _reject(crash_id, 'CrashIDNotFound')
+        raise
     except Exception:
         _reject(crash_id, 'error loading crash')
-    return raw_crash, dumps, processed_crash
+        raise
+    try:
+        processed_crash.update(storage.get_processed(crash_id))
+    except CrashIDNotFound:
+        pass
 
 
-def put_crash_data(crash_id, raw_crash, dumps, processed_crash):
-    return
-    """write the modified crashes"""
+def put_crash_data(crash_id, raw_crash, dumps, processed_crash, storage=None):
+    """write the modified crashes
+
+    :arg CrashStorageBase storage: where to save the crash to; without one
+    nothing is saved
+
+    """
+    if storage is None:
+        return
 
     # bug 866973 - save_raw_and_processed() instead of just
     # save_processed().  The raw crash may have been modified
     # by the processor rules.  The individual crash storage
     # implementations may choose to honor re-saving the raw_crash
     # or not.
+    storage.save_raw_and_processed(crash_id, raw_crash, dumps, processed_crash)
+    logger.info('saved - %s', crash_id)
+
+
+async def async_get_crash_data(crash_id, raw_crash, dumps, processed_crash,
+                               storage=None):
+    """asyncio equivalent of ``get_crash_data``
 
-    # TODO replace this crashstorage class
-    self.destination.save_raw_and_processed(
-        raw_crash,
+    Runs the blocking fetch in the event loop's default executor so the loop
+    stays free while it waits on storage.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
         None,
-        processed_crash,
-        crash_id
+        partial(get_crash_data, storage=storage),
+        crash_id, raw_crash, dumps, processed_crash
+    )
+
+
+async def async_put_crash_data(crash_id, raw_crash, dumps, processed_crash,
+                               storage=None):
+    """asyncio equivalent of ``put_crash_data``"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        None,
+        partial(put_crash_data, storage=storage),
+        crash_id, raw_crash, dumps, processed_crash
     )
-    logger.info('saved - %s', crash_id)
 
 
 def _reject(crash_id, reason):
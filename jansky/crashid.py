@@ -0,0 +1,214 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Encoding and decoding of crash ids
+
+Crash ids are uuids with the throttle result and the date of the crash
+written into the last seven digits::
+
+    de1bb258-cbbf-4589-a673-34f800160918
+                                 ^^^^^^^
+                                 ||____|
+                                 |  yymmdd
+                                 |
+                                 throttle_result
+
+A crash id packs into 16 bytes. Each packed id on its own is still a bytes
+object of about 49 bytes against about 85 for the str, so the dense form is
+a run of them in one bytes object from ``pack_many``, 16 bytes per id, which
+``iter_packed`` walks. That's worth having for indexes and queues that hold a
+lot of them. Packed ids sort in the same order as the lowercase strings, and
+the date and throttle can be read from them without unpacking.
+
+Usage::
+
+    from jansky import crashid
+
+    packed = crashid.pack('de1bb258-cbbf-4589-a673-34f800160918')
+    crashid.unpack(packed)
+
+    crashid.get_date(packed)
+    crashid.get_throttle(packed)
+
+    crashid.is_crash_id('../../etc/passwd')  # False
+
+    # many ids at once, packed or not
+    crashid.get_dates_and_throttles(crash_ids)
+
+    # a run of packed ids in one bytes object
+    blob = crashid.pack_many(crash_ids)
+    crashid.unpack_many(blob)
+
+"""
+
+import datetime
+import functools
+import re
+
+import isodate
+
+
+PACKED_SIZE = 16
+
+_CRASH_ID_RE = re.compile(
+    r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+)
+
+DATE_CACHE_SIZE = 4096
+
+
+def is_crash_id(value):
+    """Returns whether value is a crash id
+
+    Anything that passes is safe to use in a path or a key.
+
+    :arg value: the value to check
+
+    :returns: bool
+
+    """
+    return isinstance(value, str) and _CRASH_ID_RE.fullmatch(value) is not None
+
+
+def pack(crash_id):
+    """Returns the crash id packed into 16 bytes
+
+    :arg str crash_id: the crash id
+
+    :returns: bytes
+
+    :raises ValueError: if crash_id isn't a crash id
+
+    """
+    if not is_crash_id(crash_id):
+        raise ValueError('not a crash id: %r' % crash_id)
+    return bytes.fromhex(crash_id.replace('-', ''))
+
+
+def unpack(packed):
+    """Returns the crash id for a packed crash id
+
+    :arg bytes packed: the crash id as packed by ``pack``
+
+    :returns: the crash id as a lowercase str
+
+    :raises ValueError: if packed isn't 16 bytes
+
+    """
+    if len(packed) != PACKED_SIZE:
+        raise ValueError('packed crash ids are %d bytes, not %d' % (PACKED_SIZE, len(packed)))
+    digits = packed.hex()
+    return '%s-%s-%s-%s-%s' % (
+        digits[:8], digits[8:12], digits[12:16], digits[16:20], digits[20:]
+    )
+
+
+def pack_many(crash_ids):
+    """Returns the crash ids packed one after another into one bytes object
+
+    :arg crash_ids: an iterable of crash ids
+
+    :returns: bytes, 16 per crash id
+
+    """
+    return b''.join(pack(crash_id) for crash_id in crash_ids)
+
+
+def iter_packed(blob):
+    """Yields each packed crash id in a ``pack_many`` bytes object"""
+    if len(blob) % PACKED_SIZE:
+        raise ValueError('packed crash ids are %d bytes each' % PACKED_SIZE)
+    for start in range(0, len(blob), PACKED_SIZE):
+        yield blob[start:start + PACKED_SIZE]
+
+
+def unpack_many(blob):
+    """Returns the list of crash ids in a ``pack_many`` bytes object"""
+    return [unpack(packed) for packed in iter_packed(blob)]
+
+
+def get_date_digits(crash_id):
+    """Returns the ``'yymmdd'`` date digits of a crash id, packed or not"""
+    if isinstance(crash_id, str):
+        return crash_id[-6:]
+    # the yymmdd digits are the last three bytes of a packed crash id
+    return crash_id[-3:].hex()
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def _date_from_digits(digits, century):
+    return datetime.datetime(
+        int(century + digits[:2]), int(digits[2:4]), int(digits[4:6]), tzinfo=isodate.UTC
+    )
+
+
+def get_date(crash_id, century='20'):
+    """Returns the date in a crash id as a UTC datetime
+
+    There are only so many dates in the crash ids in flight, so the datetimes
+    are cached and shared.
+
+    :arg crash_id: the crash id, packed or not
+    :arg str century: the century as a string
+
+    :returns: datetime
+
+    :raises ValueError: if the crash id doesn't end in a valid date
+
+    """
+    return _date_from_digits(get_date_digits(crash_id), century)
+
+
+def get_throttle(crash_id):
+    """Returns the throttle result in a crash id
+
+    :arg crash_id: the crash id, packed or not
+
+    :returns: int
+
+    """
+    if isinstance(crash_id, str):
+        return int(crash_id[-7])
+    # the throttle digit is the low nibble of the fourth byte from the end
+    throttle = crash_id[-4] & 0x0f
+    if throttle > 9:
+        raise ValueError('invalid throttle digit in crash id')
+    return throttle
+
+
+def get_dates(crash_ids, century='20'):
+    """Returns a list with the date of each crash id, in order"""
+    return [date for date, _ in get_dates_and_throttles(crash_ids, century)]
+
+
+def get_throttles(crash_ids):
+    """Returns a list with the throttle result of each crash id, in order"""
+    return [get_throttle(crash_id) for crash_id in crash_ids]
+
+
+def get_dates_and_throttles(crash_ids, century='20'):
+    """Returns a list with ``(date, throttle)`` for each crash id, in order
+
+    :arg crash_ids: an iterable of crash ids, packed or not, or the bytes
+        from ``pack_many``
+
+    :returns: list of ``(datetime, int)`` tuples
+
+    :raises ValueError: if a crash id doesn't end in a valid date and throttle
+
+    """
+    if isinstance(crash_ids, (bytes, bytearray)):
+        crash_ids = iter_packed(crash_ids)
+
+    # a batch spans a handful of dates, so look each one up once
+    dates = {}
+    decoded = []
+    for crash_id in crash_ids:
+        digits = get_date_digits(crash_id)
+        date = dates.get(digits)
+        if date is None:
+            date = dates[digits] = _date_from_digits(digits, century)
+        decoded.append((date, get_throttle(crash_id)))
+    return decoded
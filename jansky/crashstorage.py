@@ -0,0 +1,394 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Crash storage is where crashes are fetched from and saved to
+
+Usage::
+
+    from jansky.crashstorage import FSCrashStorage
+
+    storage = FSCrashStorage(config.with_namespace('crashstorage'))
+
+    raw_crash = storage.get_raw_crash(crash_id)
+    dumps = storage.get_dumps(crash_id)
+
+"""
+
+from collections.abc import Mapping, MutableMapping, Sequence
+import datetime
+import errno
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+
+from everett.component import ConfigOptions, RequiredConfigMixin
+
+from jansky.crashid import is_crash_id
+from jansky.util import date_to_string, get_date_from_crash_id
+
+
+logger = logging.getLogger(__name__)
+
+
+class CrashIDNotFound(Exception):
+    """Raised when a crash storage doesn't have the crash asked for"""
+
+
+class DumpsMapping(MutableMapping):
+    """A mapping of dump names to dumps that keeps them out of the heap
+
+    Dumps are either files on disk, added with ``set_path``, or bytes, added
+    by setting an item. Looking a dump up returns a read-only ``memoryview``:
+    file dumps are memory-mapped the first time they're looked up, so the
+    kernel pages them in as they're read and can drop them again under
+    pressure, and bytes are wrapped without copying.
+
+    ``path(name)`` returns a file holding a dump for tools that want one. Dumps
+    held as bytes are written to a temporary file for that, and the bytes are
+    let go of.
+
+    ``close()`` unmaps every dump and deletes the temporary files. It should
+    be called once the crash is done with; the mapping is empty afterwards.
+
+    Usage::
+
+        dumps = DumpsMapping()
+        dumps.set_path('upload_file_minidump', '/data/minidumps/<crash_id>')
+
+        header = dumps['upload_file_minidump'][:4]
+        ...
+        dumps.close()
+
+    """
+    def __init__(self):
+        # dumps held as bytes
+        self._data = {}
+        # dumps held as files
+        self._paths = {}
+        # (mmap, memoryview) for the file dumps that have been looked up
+        self._maps = {}
+        # files this mapping wrote and has to delete
+        self._temp_paths = set()
+        self._tempdir = None
+
+    def __getitem__(self, name):
+        if name in self._data:
+            return memoryview(self._data[name])
+        if name not in self._maps:
+            self._maps[name] = self._map(self._paths[name])
+        return self._maps[name][1]
+
+    def __setitem__(self, name, data):
+        self._forget(name)
+        self._data[name] = bytes(data)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self._forget(name)
+
+    def __contains__(self, name):
+        return name in self._data or name in self._paths
+
+    def __iter__(self):
+        return iter(list(self._data) + list(self._paths))
+
+    def __len__(self):
+        return len(self._data) + len(self._paths)
+
+    def set_path(self, name, path):
+        """Adds a dump held in a file
+
+        The file is owned by whoever put it there and isn't deleted on
+        ``close()``.
+
+        """
+        self._forget(name)
+        self._paths[name] = path
+
+    def path(self, name):
+        """Returns the path of a file holding the dump
+
+        :raises KeyError: if there is no such dump
+
+        """
+        if name in self._paths:
+            return self._paths[name]
+
+        data = self._data[name]
+        if self._tempdir is None:
+            self._tempdir = tempfile.mkdtemp(prefix='jansky-dumps-')
+        fd, path = tempfile.mkstemp(suffix='.dump', dir=self._tempdir)
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+
+        del self._data[name]
+        self._paths[name] = path
+        self._temp_paths.add(path)
+        return path
+
+    def memory_nbytes(self):
+        """Returns how many bytes of dumps are held in the heap"""
+        return sum(len(data) for data in self._data.values())
+
+    def close(self):
+        """Unmaps the dumps, deletes temporary files and empties the mapping"""
+        for name in list(self._maps):
+            self._unmap(name)
+        self._data.clear()
+        self._paths.clear()
+        self._temp_paths.clear()
+        if self._tempdir is not None:
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+            self._tempdir = None
+
+    def _map(self, path):
+        with open(path, 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                # empty files can't be mapped
+                return None, memoryview(b'')
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped, memoryview(mapped)
+
+    def _unmap(self, name):
+        mapped, view = self._maps.pop(name)
+        view.release()
+        if mapped is None:
+            return
+        try:
+            mapped.close()
+        except BufferError:
+            # something still holds a view of the dump; the mapping goes away
+            # when that does
+            logger.warning('dump %s still in use when it was closed', name)
+
+    def _forget(self, name):
+        if name in self._maps:
+            self._unmap(name)
+        self._data.pop(name, None)
+        path = self._paths.pop(name, None)
+        if path in self._temp_paths:
+            self._temp_paths.discard(path)
+            os.unlink(path)
+
+
+class CrashStorageBase(RequiredConfigMixin):
+    """Interface for crash storage backends
+
+    Raw crashes and processed crashes are mappings that can be encoded as
+    JSON, dumps are a mapping of dump names to bytes.
+
+    """
+    required_config = ConfigOptions()
+
+    def __init__(self, config):
+        self.config = config.with_options(self)
+
+    def get_raw_crash(self, crash_id):
+        """Returns the raw crash
+
+        :raises CrashIDNotFound: if there's no raw crash for the crash id
+
+        """
+        raise NotImplementedError
+
+    def get_dumps(self, crash_id):
+        """Returns a mapping of dump names to dump contents
+
+        :raises CrashIDNotFound: if there are no dumps for the crash id
+
+        """
+        raise NotImplementedError
+
+    def get_dumps_as_files(self, crash_id):
+        """Returns a mapping of dump names to paths of files holding them
+
+        The files belong to the storage and must not be changed or deleted.
+
+        :raises CrashIDNotFound: if there are no dumps for the crash id
+
+        """
+        raise NotImplementedError
+
+    def get_processed(self, crash_id):
+        """Returns the processed crash
+
+        :raises CrashIDNotFound: if the crash hasn't been processed before
+
+        """
+        raise NotImplementedError
+
+    def save_raw_crash(self, crash_id, raw_crash, dumps):
+        """Saves a raw crash and its dumps as the collector would"""
+        raise NotImplementedError
+
+    def save_raw_and_processed(self, crash_id, raw_crash, dumps, processed_crash):
+        """Saves the raw crash and the processed crash
+
+        The raw crash may have been changed by the rules. Dumps are never
+        changed by processing, so backends don't have to write them again.
+
+        """
+        raise NotImplementedError
+
+
+def _json_default(obj):
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return date_to_string(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode('utf-8', 'replace')
+    # lazily decoded views like LazyJsonDump
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, Sequence):
+        return list(obj)
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+class FSCrashStorage(CrashStorageBase):
+    """Saves crashes to and fetches them from the local filesystem
+
+    Crashes are partitioned into a directory per day, taken from the date at
+    the end of the crash id::
+
+        <FS_ROOT>/<YYYYMMDD>/raw_crash/<crash_id>.json
+        <FS_ROOT>/<YYYYMMDD>/dump_names/<crash_id>.json
+        <FS_ROOT>/<YYYYMMDD>/dump/<dump_name>/<crash_id>
+        <FS_ROOT>/<YYYYMMDD>/processed_crash/<crash_id>.json
+
+    Crash ids and dump names come from outside, so anything that isn't a
+    crash id or a plain file name raises ``ValueError`` before it gets near a
+    path.
+
+    Every file is written to a temporary file in the same directory first and
+    then renamed into place, so readers never see a partially written file.
+    Every file is read in a single call.
+
+    This is meant for running the processor end to end without any other
+    services and as a fast local cache.
+
+    """
+    required_config = ConfigOptions()
+    required_config.add_option(
+        'fs_root',
+        default='./crashes',
+        doc=(
+            'The root directory crashes are saved to and fetched from. '
+            'Relative paths are relative to the working directory.'
+        )
+    )
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.root = os.path.abspath(self.config('fs_root'))
+
+    def _path(self, crash_id, *parts):
+        if not is_crash_id(crash_id):
+            raise ValueError('not a crash id: %r' % crash_id)
+        return os.path.join(self.root, get_date_from_crash_id(crash_id), *parts)
+
+    def _dump_path(self, crash_id, name):
+        if (not isinstance(name, str) or name in ('', '.', '..') or
+                os.sep in name or (os.altsep and os.altsep in name)):
+            raise ValueError('not a dump name: %r' % name)
+        return self._path(crash_id, 'dump', name, crash_id)
+
+    def _read(self, path, crash_id):
+        try:
+            with open(path, 'rb') as fp:
+                return fp.read()
+        except IOError as exc:
+            if exc.errno == errno.ENOENT:
+                raise CrashIDNotFound(crash_id)
+            raise
+
+    def _write(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(
+            directory,
+            '.%s.%d.%d.tmp' % (
+                os.path.basename(path), os.getpid(), threading.get_ident()
+            )
+        )
+        try:
+            with open(tmp_path, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _read_json(self, path, crash_id):
+        return json.loads(self._read(path, crash_id).decode('utf-8'))
+
+    def _write_json(self, path, data):
+        self._write(
+            path,
+            json.dumps(data, default=_json_default, sort_keys=True).encode('utf-8')
+        )
+
+    def get_raw_crash(self, crash_id):
+        return self._read_json(
+            self._path(crash_id, 'raw_crash', crash_id + '.json'),
+            crash_id
+        )
+
+    def _dump_names(self, crash_id):
+        return self._read_json(
+            self._path(crash_id, 'dump_names', crash_id + '.json'),
+            crash_id
+        )
+
+    def get_dumps(self, crash_id):
+        return dict(
+            (name, self._read(self._dump_path(crash_id, name), crash_id))
+            for name in self._dump_names(crash_id)
+        )
+
+    def get_dumps_as_files(self, crash_id):
+        paths = {}
+        for name in self._dump_names(crash_id):
+            path = self._dump_path(crash_id, name)
+            if not os.path.exists(path):
+                raise CrashIDNotFound(crash_id)
+            paths[name] = path
+        return paths
+
+    def get_processed(self, crash_id):
+        return self._read_json(
+            self._path(crash_id, 'processed_crash', crash_id + '.json'),
+            crash_id
+        )
+
+    def save_raw_crash(self, crash_id, raw_crash, dumps):
+        # dumps go first so the dump names never point at missing files
+        for name, data in dumps.items():
+            self._write(self._dump_path(crash_id, name), data)
+        self._write_json(
+            self._path(crash_id, 'dump_names', crash_id + '.json'),
+            sorted(dumps)
+        )
+        self._write_json(
+            self._path(crash_id, 'raw_crash', crash_id + '.json'),
+            raw_crash
+        )
+
+    def save_raw_and_processed(self, crash_id, raw_crash, dumps, processed_crash):
+        self._write_json(
+            self._path(crash_id, 'raw_crash', crash_id + '.json'),
+            raw_crash
+        )
+        self._write_json(
+            self._path(crash_id, 'processed_crash', crash_id + '.json'),
+            processed_crash
+        )
@@ -0,0 +1,511 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Read-only views of stackwalker output that decode it as it's looked at
+
+Usage::
+
+    json_dump = LazyJsonDump(output)
+
+    # decodes the sections up to and including system_info
+    json_dump['system_info']['os']
+
+    # decodes the threads up to and including the crashing one
+    json_dump['threads'][json_dump['crash_info']['crashing_thread']]
+
+Either way the number of threads and frames kept can be capped::
+
+    json_dump = LazyJsonDump(output, max_threads=256, max_frames=500)
+    notes = json_dump.truncation_notes()
+
+Output too big to hold in memory can be read from a file a chunk at a time::
+
+    json_dump, notes = read_capped_json_dump(fp, max_threads=256, max_frames=500)
+
+"""
+
+import codecs
+from collections.abc import Mapping, Sequence
+import json
+from json.decoder import scanstring
+import re
+import threading
+
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def _skip_whitespace(text, pos):
+    return _whitespace.match(text, pos).end()
+
+
+class LazyJsonArray(Sequence):
+    """A JSON array whose items are decoded in order as they're looked up
+
+    Looking up item ``n`` decodes items up to ``n``. Negative indexes, slices,
+    ``len()`` and anything else that needs the whole array decode all of it.
+
+    With ``max_items`` the items after that many are decoded and dropped, and
+    ``count`` is the number of items the array had once it's decoded.
+
+    """
+    def __init__(self, text, pos, max_items=None, item_hook=None):
+        """
+        :arg str text: the JSON document
+
+        :arg int pos: the position right after the array's ``[``
+
+        :arg int max_items: the number of items to keep, or None for all
+
+        :arg item_hook: called with each kept item, returns what's kept
+
+        """
+        self._lock = threading.Lock()
+        self._items = []
+        self._max_items = max_items
+        self._item_hook = item_hook
+        self.count = 0
+        self._text = text
+        self._pos = _skip_whitespace(text, pos)
+        self._end = None
+        if text[self._pos:self._pos + 1] == ']':
+            self._finished(self._pos + 1)
+
+    def _finished(self, end):
+        self._end = end
+        self._text = None
+
+    def _advance(self):
+        text = self._text
+        value, pos = _decoder.raw_decode(text, self._pos)
+        self.count += 1
+        if self._max_items is None or len(self._items) < self._max_items:
+            if self._item_hook is not None:
+                value = self._item_hook(value)
+            self._items.append(value)
+        pos = _skip_whitespace(text, pos)
+        separator = text[pos:pos + 1]
+        if separator == ',':
+            self._pos = _skip_whitespace(text, pos + 1)
+        elif separator == ']':
+            self._finished(pos + 1)
+        else:
+            raise ValueError("Expecting ',' delimiter: char %d" % pos)
+
+    def finish(self):
+        """Decodes the rest of the array
+
+        :returns int: the position right after the array's ``]``
+
+        """
+        with self._lock:
+            while self._end is None:
+                self._advance()
+        return self._end
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or index < 0:
+            self.finish()
+        else:
+            with self._lock:
+                while len(self._items) <= index and self._end is None:
+                    self._advance()
+        return self._items[index]
+
+    def __len__(self):
+        self.finish()
+        return len(self._items)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyJsonArray)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # copies and pickles are plain lists
+        return (list, (list(self),))
+
+    def __repr__(self):
+        return '<LazyJsonArray: %d items decoded>' % len(self._items)
+
+
+class LazyJsonDump(Mapping):
+    """A JSON object whose top-level sections are decoded in order as
+    they're looked up
+
+    Looking up a key decodes the sections up to and including it, without
+    decoding anything after it. Stackwalker output has its keys sorted, so
+    ``threads``, where most of the bytes are, comes last. Its value is a
+    ``LazyJsonArray`` so that looking at the crashing thread doesn't decode
+    the threads after it.
+
+    Looking up a key that isn't there, iterating and ``len()`` decode
+    everything. Errors in the JSON show up as ``ValueError`` when the broken
+    section is decoded.
+
+    That doesn't make decoding the rest free, only later: saving a processed
+    crash serializes all of its json_dump, and ``SaveMetadata`` asks for the
+    truncation notes right before that. What laziness spares is the decoding
+    for crashes that fail or are dropped before they get that far.
+
+    It is read-only. Copies and pickles are plain dicts.
+
+    With ``max_threads`` and ``max_frames`` the threads and frames past the
+    caps are dropped as they're decoded, the same as ``read_capped_json_dump``
+    drops them, and ``truncation_notes`` says what was dropped. It has to
+    decode everything to know.
+
+    """
+    lazy_arrays = frozenset(['threads'])
+
+    def __init__(self, raw, max_threads=None, max_frames=None):
+        """
+        :arg raw: the JSON document as str or bytes
+
+        :arg int max_threads: the number of threads to keep, or None for all
+
+        :arg int max_frames: the number of frames to keep per thread,
+        including the ``crashing_thread`` section, or None for all
+
+        :raises ValueError: if the document isn't a JSON object
+
+        """
+        text = bytes(raw).decode('utf-8') if not isinstance(raw, str) else raw
+        pos = _skip_whitespace(text, 0)
+        if text[pos:pos + 1] != '{':
+            raise ValueError('json_dump is not a JSON object')
+
+        self._lock = threading.Lock()
+        self._sections = {}
+        self._caps = {
+            ('threads',): max_threads,
+            ('threads', '*', 'frames'): max_frames,
+            ('crashing_thread', 'frames'): max_frames,
+        }
+        # path -> [arrays truncated, largest length seen], like _CappedParser
+        self.truncated = {}
+        # an array in lazy_arrays that has to be decoded before the section
+        # after it can be
+        self._pending = None
+        self._text = text
+        self._pos = _skip_whitespace(text, pos + 1)
+        self._done = False
+        if text[self._pos:self._pos + 1] == '}':
+            self._finished()
+
+    def _finished(self):
+        self._done = True
+        self._text = None
+
+    def _after_value(self, pos):
+        text = self._text
+        pos = _skip_whitespace(text, pos)
+        separator = text[pos:pos + 1]
+        if separator == ',':
+            self._pos = _skip_whitespace(text, pos + 1)
+        elif separator == '}':
+            self._finished()
+        else:
+            raise ValueError("Expecting ',' delimiter: char %d" % pos)
+
+    def _advance(self):
+        if self._pending is not None:
+            pos = self._pending.finish()
+            self._pending = None
+            self._after_value(pos)
+            return
+
+        text, pos = self._text, self._pos
+        if text[pos:pos + 1] != '"':
+            raise ValueError('Expecting property name: char %d' % pos)
+        key, pos = scanstring(text, pos + 1)
+        pos = _skip_whitespace(text, pos)
+        if text[pos:pos + 1] != ':':
+            raise ValueError("Expecting ':' delimiter: char %d" % pos)
+        pos = _skip_whitespace(text, pos + 1)
+
+        if key in self.lazy_arrays and text[pos:pos + 1] == '[':
+            if key == 'threads':
+                array = LazyJsonArray(
+                    text, pos + 1, self._caps[('threads',)], self._cap_thread
+                )
+            else:
+                array = LazyJsonArray(text, pos + 1)
+            self._pending = self._sections[key] = array
+            return
+
+        value, pos = _decoder.raw_decode(text, pos)
+        if key == 'crashing_thread':
+            value = self._cap_frames(value, ('crashing_thread', 'frames'))
+        self._sections[key] = value
+        self._after_value(pos)
+
+    def _record_truncation(self, path, count):
+        truncated = self.truncated.setdefault(path, [0, 0])
+        truncated[0] += 1
+        truncated[1] = max(truncated[1], count)
+
+    def _cap_frames(self, thread, path):
+        cap = self._caps[path]
+        if cap is None or not isinstance(thread, dict):
+            return thread
+        frames = thread.get('frames')
+        if isinstance(frames, list) and len(frames) > cap:
+            self._record_truncation(path, len(frames))
+            thread['frames'] = frames[:cap]
+        return thread
+
+    def _cap_thread(self, thread):
+        return self._cap_frames(thread, ('threads', '*', 'frames'))
+
+    def truncation_notes(self):
+        """Returns processor notes describing what the caps dropped
+
+        This decodes everything, since how many threads there were is only
+        known at the end.
+
+        """
+        self._finish()
+        threads = self._sections.get('threads')
+        cap = self._caps[('threads',)]
+        if (isinstance(threads, LazyJsonArray) and cap is not None and
+                threads.count > cap and ('threads',) not in self.truncated):
+            self._record_truncation(('threads',), threads.count)
+        return _truncation_notes(self.truncated, self._caps)
+
+    def _finish(self):
+        with self._lock:
+            while not self._done:
+                self._advance()
+
+    def __getitem__(self, key):
+        with self._lock:
+            while key not in self._sections and not self._done:
+                self._advance()
+        return self._sections[key]
+
+    def __iter__(self):
+        self._finish()
+        return iter(self._sections)
+
+    def __len__(self):
+        self._finish()
+        return len(self._sections)
+
+    def __reduce__(self):
+        # copies and pickles are plain dicts
+        return (dict, (dict(self),))
+
+    def __repr__(self):
+        return '<LazyJsonDump: %s decoded>' % ', '.join(self._sections)
+
+
+_TRUNCATION_LABELS = [
+    (('threads',), 'threads'),
+    (('threads', '*', 'frames'), 'frames per thread'),
+    (('crashing_thread', 'frames'), 'crashing_thread frames'),
+]
+
+
+def _truncation_notes(truncated, caps):
+    """Returns processor notes for the arrays dropped past their caps
+
+    :arg dict truncated: path -> [arrays truncated, largest length seen]
+
+    :arg dict caps: path -> cap
+
+    """
+    notes = []
+    for path, label in _TRUNCATION_LABELS:
+        if path in truncated:
+            count, largest = truncated[path]
+            if count == 1:
+                notes.append('json_dump truncated to %d %s from %d' % (
+                    caps[path], label, largest
+                ))
+            else:
+                notes.append('json_dump truncated to %d %s in %d places, up to %d' % (
+                    caps[path], label, count, largest
+                ))
+    return notes
+
+
+# a JSON token, after optional whitespace
+_token = re.compile(r'''
+    [ \t\n\r]*
+    (?:
+        (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+      | (?P<number>-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)
+      | (?P<literal>true|false|null)
+      | (?P<punct>[\[\]{}:,])
+    )
+''', re.VERBOSE)
+
+_literals = {'true': True, 'false': False, 'null': None}
+
+# deeper nesting than this is treated as broken output
+MAX_DEPTH = 100
+
+
+def _tokens(fp, chunk_size, max_token_length):
+    """Yields (kind, text) for every JSON token read from a binary file"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    text, pos, eof = '', 0, False
+    while True:
+        match = _token.match(text, pos)
+        # a token that reaches the end of the text may continue in the next
+        # chunk
+        if match is None or (match.end() == len(text) and not eof):
+            if eof:
+                if text[pos:].strip():
+                    raise ValueError('Unexpected data: char %d' % pos)
+                return
+            text, pos = text[pos:], 0
+            if len(text) > max_token_length:
+                raise ValueError('Token longer than %d characters' % max_token_length)
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            text += decoder.decode(chunk, final=eof)
+            continue
+        pos = match.end()
+        yield match.lastgroup, match.group(match.lastgroup)
+
+
+class _CappedParser:
+    """Builds Python objects from JSON tokens, keeping at most ``caps[path]``
+    items of the arrays at the paths in ``caps``
+
+    Paths are tuples of object keys, with ``'*'`` standing for any array
+    index. Dropped items are still tokenized but nothing is built for them.
+
+    """
+    def __init__(self, tokens, caps):
+        self._tokens = tokens
+        self.caps = caps
+        # path -> [arrays truncated, largest length seen]
+        self.truncated = {}
+
+    def _next(self):
+        return next(self._tokens, (None, None))
+
+    def parse(self):
+        kind, text = self._next()
+        value = self._value(kind, text, (), True, 0)
+        if self._next()[0] is not None:
+            raise ValueError('Extra data after the JSON document')
+        return value
+
+    def _value(self, kind, text, path, keep, depth):
+        if depth > MAX_DEPTH:
+            raise ValueError('JSON nested deeper than %d' % MAX_DEPTH)
+        if kind == 'punct' and text == '{':
+            return self._object(path, keep, depth)
+        if kind == 'punct' and text == '[':
+            return self._array(path, keep, depth)
+        if kind == 'string':
+            return scanstring(text, 1)[0] if keep else None
+        if kind == 'number':
+            if not keep:
+                return None
+            if '.' in text or 'e' in text or 'E' in text:
+                return float(text)
+            return int(text)
+        if kind == 'literal':
+            return _literals[text]
+        raise ValueError('Unexpected token: %r' % text)
+
+    def _object(self, path, keep, depth):
+        obj = {} if keep else None
+        kind, text = self._next()
+        if kind == 'punct' and text == '}':
+            return obj
+        while True:
+            if kind != 'string':
+                raise ValueError('Expecting property name: %r' % text)
+            key = scanstring(text, 1)[0] if keep else None
+            kind, text = self._next()
+            if text != ':':
+                raise ValueError("Expecting ':' delimiter: %r" % text)
+            kind, text = self._next()
+            value = self._value(
+                kind, text, path + (key,) if keep else None, keep, depth + 1
+            )
+            if keep:
+                obj[key] = value
+            kind, text = self._next()
+            if text == '}':
+                return obj
+            if text != ',':
+                raise ValueError("Expecting ',' delimiter: %r" % text)
+            kind, text = self._next()
+
+    def _array(self, path, keep, depth):
+        items = [] if keep else None
+        cap = self.caps.get(path) if keep else None
+        item_path = path + ('*',) if keep else None
+        count = 0
+        kind, text = self._next()
+        if kind == 'punct' and text == ']':
+            return items
+        while True:
+            keep_item = keep and (cap is None or count < cap)
+            value = self._value(kind, text, item_path, keep_item, depth + 1)
+            if keep_item:
+                items.append(value)
+            count += 1
+            kind, text = self._next()
+            if text == ']':
+                break
+            if text != ',':
+                raise ValueError("Expecting ',' delimiter: %r" % text)
+            kind, text = self._next()
+
+        if cap is not None and count > cap:
+            truncated = self.truncated.setdefault(path, [0, 0])
+            truncated[0] += 1
+            truncated[1] = max(truncated[1], count)
+        return items
+
+
+def read_capped_json_dump(fp, max_threads, max_frames, chunk_size=1024 * 1024,
+                          max_token_length=1024 * 1024):
+    """Reads stackwalker output from a file a chunk at a time, dropping
+    threads and frames beyond the caps
+
+    Memory use is bounded by the caps and the chunk size rather than by the
+    size of the output, which makes this the way to read output too big to
+    hold in memory. It's a lot slower than ``LazyJsonDump``.
+
+    :arg fp: binary file holding the stackwalker output
+
+    :arg int max_threads: the number of threads to keep
+
+    :arg int max_frames: the number of frames to keep per thread, including
+    the ``crashing_thread`` section
+
+    :arg int chunk_size: the number of bytes to read at a time
+
+    :arg int max_token_length: strings or numbers longer than this make the
+    output count as broken
+
+    :returns: ``(json_dump, notes)`` where notes is a list of processor notes
+    describing what was dropped
+
+    :raises ValueError: if the output isn't a JSON object
+
+    """
+    caps = {
+        ('threads',): max_threads,
+        ('threads', '*', 'frames'): max_frames,
+        ('crashing_thread', 'frames'): max_frames,
+    }
+    parser = _CappedParser(_tokens(fp, chunk_size, max_token_length), caps)
+    json_dump = parser.parse()
+    if not isinstance(json_dump, dict):
+        raise ValueError('json_dump is not a JSON object')
+    return json_dump, _truncation_notes(parser.truncated, caps)
@@ -0,0 +1,362 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+An index over the modules in a json_dump, built once per crash and shared by
+the rules that look modules up
+
+Usage::
+
+    from jansky.modules import get_module_index
+
+    index = get_module_index(processed_crash)
+    index.by_filename('xul.dll')
+    index.with_prefix('NPSWF32', 'libflashplayer')
+    index.by_debug_id('8385BD80FD534F6E80CF65811735A7472')
+    index.at_address(0x12e0042)
+
+    # the module each frame of the crashing thread is in
+    index.for_frames(json_dump['crashing_thread']['frames'])
+
+    # every module a KnownModuleClassifier recognizes, with its version
+    index.classify(classifier)
+
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from collections.abc import Sequence
+import heapq
+import re
+
+
+def parse_address(address):
+    """Returns an address from the json_dump as an int, or None
+
+    Addresses are hex strings like ``'0x12e0000'``; ints are passed through.
+
+    """
+    if isinstance(address, int):
+        return address
+    try:
+        return int(address, 16)
+    except (TypeError, ValueError):
+        return None
+
+
+class IntervalIndex:
+    """Maps addresses to the values of the half-open ``[start, end)``
+    intervals that hold them
+
+    Intervals are flattened into disjoint segments when the index is built,
+    so a lookup is one bisect whatever the overlaps. Where intervals overlap,
+    the one added first wins.
+
+    """
+    def __init__(self, intervals):
+        """
+        :arg intervals: ``(start, end, value)`` tuples, earlier ones winning
+        overlaps; empty intervals are ignored
+
+        """
+        ranked = sorted(
+            (start, end, rank, value)
+            for rank, (start, end, value) in enumerate(intervals)
+            if start < end
+        )
+        self._starts = []
+        self._ends = []
+        self._values = []
+        if all(ranked[i][1] <= ranked[i + 1][0] for i in range(len(ranked) - 1)):
+            # no overlaps, which is what stackwalker output normally has
+            for start, end, _, value in ranked:
+                self._add(start, end, value)
+        else:
+            self._flatten(ranked)
+
+    def _add(self, start, end, value):
+        if self._values and self._ends[-1] == start and self._values[-1] is value:
+            self._ends[-1] = end
+            return
+        self._starts.append(start)
+        self._ends.append(end)
+        self._values.append(value)
+
+    def _flatten(self, ranked):
+        boundaries = sorted(set(
+            [start for start, _, _, _ in ranked] + [end for _, end, _, _ in ranked]
+        ))
+        # intervals that have started, lowest rank first; ones that have ended
+        # are dropped when they come to the top
+        active = []
+        following = 0
+        for start, end in zip(boundaries, boundaries[1:]):
+            while following < len(ranked) and ranked[following][0] <= start:
+                _, interval_end, rank, value = ranked[following]
+                heapq.heappush(active, (rank, interval_end, value))
+                following += 1
+            while active and active[0][1] <= start:
+                heapq.heappop(active)
+            if active:
+                self._add(start, end, active[0][2])
+
+    def __len__(self):
+        return len(self._starts)
+
+    def lookup(self, address, default=None):
+        """Returns the value of the interval holding address, or default"""
+        segment = bisect_right(self._starts, address) - 1
+        if segment >= 0 and address < self._ends[segment]:
+            return self._values[segment]
+        return default
+
+    def lookup_many(self, addresses, default=None):
+        """Returns a list with the value for each address, in order"""
+        starts, ends, values = self._starts, self._ends, self._values
+        found = []
+        for address in addresses:
+            segment = bisect_right(starts, address) - 1
+            if segment >= 0 and address < ends[segment]:
+                found.append(values[segment])
+            else:
+                found.append(default)
+        return found
+
+
+class KnownModule:
+    """A kind of module recognized by its filename, for
+    ``KnownModuleClassifier``
+
+    The version of a recognized module is its ``version`` field if it has
+    one, else what the pattern's ``version`` group matched, else what its
+    debug id is known to be.
+
+    """
+    def __init__(self, kind, prefixes, pattern, version_separator=None,
+                 debug_ids=None):
+        """
+        :arg str kind: what the classification is called, e.g. ``'flash'``
+
+        :arg tuple prefixes: every filename the pattern matches starts with
+        one of these
+
+        :arg str pattern: a regular expression matched against the start of
+        the filename, with an optional ``(?P<version>...)`` group
+
+        :arg str version_separator: if set, replaced with ``.`` in versions
+        taken from the filename
+
+        :arg dict debug_ids: debug id -> version for versions that can't be
+        had from the filename
+
+        """
+        self.kind = kind
+        self.prefixes = tuple(prefixes)
+        self.pattern = pattern
+        self.version_separator = version_separator
+        self.debug_ids = debug_ids or {}
+
+
+Classification = namedtuple('Classification', ['kind', 'version'])
+
+
+class KnownModuleClassifier:
+    """Recognizes modules from a table of ``KnownModule``
+
+    The table is compiled into a prefix check and a single regular
+    expression, tried in table order, so classifying a module costs one
+    ``startswith`` and at most one ``match`` however many kinds of module
+    there are. With a ``ModuleIndex`` only the modules with one of the
+    prefixes are looked at.
+
+    """
+    def __init__(self, known_modules):
+        """
+        :arg list known_modules: ``KnownModule`` instances; where more than
+        one matches a filename the first wins
+
+        """
+        self.known_modules = tuple(known_modules)
+        self.prefixes = tuple(sorted(set(
+            prefix for known in self.known_modules for prefix in known.prefixes
+        )))
+        alternatives = []
+        for number, known in enumerate(self.known_modules):
+            pattern = known.pattern.replace('(?P<version>', '(?P<v%d>' % number)
+            alternatives.append('(?P<k%d>%s)' % (number, pattern))
+        self._regex = re.compile('|'.join(alternatives))
+
+    def classify_module(self, module):
+        """Returns the module's ``Classification``, or None if it isn't one
+        of the known modules"""
+        filename = module.get('filename')
+        if not filename or not filename.startswith(self.prefixes):
+            return None
+        match = self._regex.match(filename)
+        if match is None:
+            return None
+
+        # the outer group of the alternative that matched closes last
+        number = int(match.lastgroup[1:])
+        known = self.known_modules[number]
+        version = module.get('version')
+        if not version:
+            version = match.groupdict().get('v%d' % number)
+            if version and known.version_separator:
+                version = version.replace(known.version_separator, '.')
+        if not version:
+            version = known.debug_ids.get(module.get('debug_id'))
+        return Classification(known.kind, version)
+
+    def classify(self, modules):
+        """Returns ``(module, Classification)`` for each known module, in
+        order
+
+        :arg modules: a list of modules or a ``ModuleIndex``
+
+        """
+        if isinstance(modules, ModuleIndex):
+            modules = modules.with_prefix(*self.prefixes)
+        classified = []
+        for module in modules:
+            classification = self.classify_module(module)
+            if classification is not None:
+                classified.append((module, classification))
+        return classified
+
+
+class ModuleIndex(Sequence):
+    """The modules of a json_dump, in their original order, with lookups by
+    filename, filename prefix, debug id and address
+
+    Each lookup returns the module dicts themselves. Where several modules
+    match, they come back in the order they're listed in the json_dump.
+    Modules without a filename, debug id or a usable address range are left
+    out of the matching lookup.
+
+    """
+    def __init__(self, modules):
+        """
+        :arg list modules: ``json_dump['modules']``
+
+        """
+        self.source = modules
+        self._modules = list(modules)
+        self._by_filename = {}
+        self._by_debug_id = {}
+        names = []
+        ranges = []
+        for position, module in enumerate(self._modules):
+            filename = module.get('filename')
+            if filename:
+                self._by_filename.setdefault(filename, []).append(position)
+                names.append((filename, position))
+
+            debug_id = module.get('debug_id')
+            if debug_id:
+                self._by_debug_id.setdefault(debug_id, []).append(position)
+
+            base = parse_address(module.get('base_addr'))
+            end = parse_address(module.get('end_addr'))
+            if base is not None and end is not None:
+                ranges.append((base, end, module))
+
+        names.sort()
+        self._names = [name for name, _ in names]
+        self._name_positions = [position for _, position in names]
+
+        self._addresses = IntervalIndex(ranges)
+        self._classified = {}
+
+    def __getitem__(self, index):
+        return self._modules[index]
+
+    def __len__(self):
+        return len(self._modules)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, ModuleIndex)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<ModuleIndex: %d modules>' % len(self._modules)
+
+    def _modules_at(self, positions):
+        return [self._modules[position] for position in positions]
+
+    def by_filename(self, filename):
+        """Returns the modules with exactly this filename"""
+        return self._modules_at(self._by_filename.get(filename, ()))
+
+    def by_debug_id(self, debug_id):
+        """Returns the modules with this debug id"""
+        return self._modules_at(self._by_debug_id.get(debug_id, ()))
+
+    def with_prefix(self, *prefixes):
+        """Returns the modules whose filename starts with any of the prefixes"""
+        positions = set()
+        for prefix in prefixes:
+            start = bisect_left(self._names, prefix)
+            # every string starting with prefix sorts before prefix + U+10FFFF
+            end = bisect_right(self._names, prefix + '\U0010ffff', start)
+            positions.update(self._name_positions[start:end])
+        return self._modules_at(sorted(positions))
+
+    def at_address(self, address):
+        """Returns the module whose address range holds address, or None
+
+        Where ranges overlap, the module listed first wins.
+
+        """
+        address = parse_address(address)
+        if address is None:
+            return None
+        return self._addresses.lookup(address)
+
+    def at_addresses(self, addresses):
+        """Returns a list with the module, or None, for each address"""
+        parsed = [parse_address(address) for address in addresses]
+        # unparseable addresses are looked up as -1, which nothing holds
+        return self._addresses.lookup_many(
+            [-1 if address is None else address for address in parsed]
+        )
+
+    def classify(self, classifier):
+        """Returns ``classifier.classify(self)``, working it out once per
+        classifier"""
+        classified = self._classified.get(classifier)
+        if classified is None:
+            classified = self._classified[classifier] = classifier.classify(self)
+        return classified
+
+    def for_frames(self, frames):
+        """Returns a list with the module, or None, holding each frame's
+        instruction address (its ``offset``)"""
+        return self.at_addresses([frame.get('offset') for frame in frames])
+
+
+def get_module_index(processed_crash):
+    """Returns the ``ModuleIndex`` for ``processed_crash['json_dump']``
+
+    The index is built on first use and kept in ``processed_crash['metadata']``
+    for the rules after it, so it goes away with the rest of the metadata. If
+    the json_dump's modules are replaced the index is rebuilt. Keeping it
+    there doesn't count as writing ``processed_crash.metadata``; rules that
+    look modules up declare ``processed_crash.json_dump`` as a read.
+
+    """
+    json_dump = processed_crash.get('json_dump') or {}
+    modules = json_dump.get('modules') or []
+    metadata = processed_crash.get('metadata')
+    if metadata is None:
+        return ModuleIndex(modules)
+
+    index = metadata.get('module_index')
+    if index is None or index.source is not modules:
+        index = ModuleIndex(modules)
+        metadata['module_index'] = index
+    return index
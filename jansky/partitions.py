@@ -0,0 +1,130 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Weekly partition names for dates and crash ids
+
+Partitions are named for the Monday they start on, as ``'YYYYMMDD'``.
+
+Usage::
+
+    from jansky.partitions import WeeklyPartitions
+
+    partitions = WeeklyPartitions()
+    partitions.for_date('2015-01-09')       # '20150105'
+    partitions.for_crash_id(crash_id)
+
+    # crash ids by the partition they go in
+    partitions.group_crash_ids(crash_ids)
+
+"""
+
+import datetime
+
+from jansky import crashid
+
+
+def _monday(date):
+    return date + datetime.timedelta(0 - date.weekday())
+
+
+class WeeklyPartitions:
+    """Looks up weekly partitions in tables built for a window of days
+    around today
+
+    The tables cover ``days_back`` days before today to ``days_ahead`` days
+    after it, which is where the crashes being processed are. They're
+    rebuilt when a lookup of ``'now'`` finds the day has changed. Dates
+    outside the window are worked out on each call, with the same results.
+
+    """
+    def __init__(self, days_back=400, days_ahead=7):
+        self.days_back = days_back
+        self.days_ahead = days_ahead
+        self.today = None
+        self.refresh()
+
+    def refresh(self, today=None):
+        """Builds the tables for the window around today
+
+        :arg date today: the date to center the window on; defaults to the
+            local date
+
+        """
+        today = today or datetime.date.today()
+        by_ordinal = {}
+        by_string = {}
+        by_digits = {}
+        first = today - datetime.timedelta(days=self.days_back)
+        for days in range(self.days_back + self.days_ahead + 1):
+            date = first + datetime.timedelta(days=days)
+            partition = _monday(date).strftime('%Y%m%d')
+            by_ordinal[date.toordinal()] = partition
+            by_string[date.strftime('%Y-%m-%d')] = partition
+            if date.year // 100 == 20:
+                by_digits[date.strftime('%y%m%d')] = partition
+
+        self._by_ordinal = by_ordinal
+        self._by_string = by_string
+        self._by_digits = by_digits
+        self.today = today
+
+    def for_date(self, date):
+        """Returns the partition for a date
+
+        :arg date: a date or datetime, a ``'YYYY-MM-DD'`` string, or
+            ``'now'`` for the local date
+
+        :returns: the partition as a ``'YYYYMMDD'`` str
+
+        :raises ValueError: if the string isn't a date
+
+        """
+        if isinstance(date, str):
+            if date == 'now':
+                date = datetime.datetime.now().date()
+                if date != self.today:
+                    self.refresh(date)
+            else:
+                partition = self._by_string.get(date)
+                if partition is not None:
+                    return partition
+                date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+
+        partition = self._by_ordinal.get(date.toordinal())
+        if partition is None:
+            partition = _monday(date).strftime('%Y%m%d')
+        return partition
+
+    def for_crash_id(self, crash_id):
+        """Returns the partition for the date in a crash id
+
+        :arg crash_id: the crash id, packed or not
+
+        :returns: the partition as a ``'YYYYMMDD'`` str
+
+        :raises ValueError: if the crash id doesn't end in a valid date
+
+        """
+        partition = self._by_digits.get(crashid.get_date_digits(crash_id))
+        if partition is None:
+            partition = self.for_date(crashid.get_date(crash_id).date())
+        return partition
+
+    def group_crash_ids(self, crash_ids):
+        """Returns a dict of partition -> list of the crash ids in it
+
+        The crash ids in each list are in the order they were given.
+
+        :arg crash_ids: an iterable of crash ids, packed or not
+
+        """
+        groups = {}
+        for crash_id in crash_ids:
+            partition = self.for_crash_id(crash_id)
+            group = groups.get(partition)
+            if group is None:
+                group = groups[partition] = []
+            group.append(crash_id)
+        return groups
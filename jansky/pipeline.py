@@ -0,0 +1,221 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from concurrent.futures import wait
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+"""
+A pipeline is an ordered, validated collection of rules that is built once
+and then applied to many crashes
+
+Usage::
+
+    from jansky.crash import Crash
+    from jansky.pipeline import Pipeline
+
+    pipeline = Pipeline(rule1, rule2, rule_printer)
+
+    for crash_id in crash_ids:
+        pipeline.apply(Crash(crash_id).fetch()).save()
+
+"""
+
+
+class PipelineError(Exception):
+    """Raised when a pipeline is built from rules that can't be run"""
+
+
+class Pipeline:
+    def __init__(self, *rules):
+        """construct a pipeline from rule instances
+
+        Rules are validated here so that mistakes surface when the processor
+        starts rather than on the first crash.
+
+        :arg Callables *rules: rule instances to be executed in succession
+
+        :raises PipelineError: if any of the rules is not a callable rule
+        instance
+
+        """
+        for rule in rules:
+            if isinstance(rule, type):
+                raise PipelineError(
+                    'pipeline rules must be instances, not classes: %r' % rule
+                )
+            if not callable(rule):
+                raise PipelineError('pipeline rule is not callable: %r' % rule)
+
+        self.rules = tuple(rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def apply(self, crash, suppress_errors=False):
+        """applies every rule in the pipeline to a crash
+
+        :arg Crash crash: the crash to transform, or a ``CrashBatch`` to apply
+        each rule to the whole batch before moving on to the next one
+
+        :arg Boolean suppress_errors: should errors be supressed and stored
+        on the crash
+
+        :raises Error: if suppress_errors is False this may raise arbitrary
+        errors
+
+        :returns Crash: the crash that was passed in
+
+        """
+        transform = crash.transform
+        for rule in self.rules:
+            transform(rule, supress_errors=suppress_errors)
+        return crash
+
+
+def _depends_on(later, earlier):
+    """Returns whether rule ``later`` has to run after rule ``earlier``
+
+    That's the case when either rule is undeclared, when ``later`` reads or
+    writes something ``earlier`` writes, or when ``later`` writes something
+    ``earlier`` reads.
+
+    """
+    later_reads, later_writes, later_requires = _declarations(later)
+    earlier_reads, earlier_writes, earlier_requires = _declarations(earlier)
+    if None in (later_reads, later_writes, earlier_reads, earlier_writes):
+        return True
+    if earlier_writes & (later_reads | later_writes | later_requires):
+        return True
+    if later_writes & (earlier_reads | earlier_requires):
+        return True
+    return False
+
+
+def _declarations(rule):
+    # plain callables can be pipeline rules too, those count as undeclared
+    return (
+        getattr(rule, 'reads', None),
+        getattr(rule, 'writes', None),
+        getattr(rule, 'requires', frozenset()),
+    )
+
+
+def _field_present(field, raw_crash, dumps, processed_crash):
+    container, _, key = field.partition('.')
+    if container == 'raw_crash':
+        return key in raw_crash
+    if container == 'dumps':
+        return key in dumps
+    if container == 'processed_crash':
+        return key in processed_crash
+    raise PipelineError('unknown field container: %r' % field)
+
+
+class ScheduledPipeline(Pipeline):
+    """A pipeline that orders rules by their declared fields
+
+    The rules' ``reads``, ``writes`` and ``requires`` declarations are turned
+    into a dependency graph where each rule depends on the earlier rules whose
+    fields it conflicts with. The graph is then cut into stages: every rule in
+    a stage only depends on rules in earlier stages, so the rules within a
+    stage can run in any order or at the same time. Within a stage rules keep
+    their declared order.
+
+    Rules whose ``requires`` fields are missing from the crash when their
+    stage comes up are skipped, which in turn leaves their outputs missing
+    for the rules downstream of them. Because of that it works on single
+    crashes rather than on a ``CrashBatch``.
+
+    Usage::
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        pipeline = ScheduledPipeline(
+            rule1, rule2, rule3,
+            executor=ThreadPoolExecutor(max_workers=4)
+        )
+        pipeline.apply(crash)
+
+    """
+    def __init__(self, *rules, executor=None):
+        """
+        :arg Callables *rules: rule instances in their declared order
+
+        :arg Executor executor: optional ``concurrent.futures`` executor used
+        to run the rules of a stage concurrently; stages with a single rule
+        always run inline
+
+        """
+        super().__init__(*rules)
+        self.executor = executor
+
+        levels = []
+        for index, rule in enumerate(self.rules):
+            level = 0
+            for earlier_index in range(index):
+                if _depends_on(rule, self.rules[earlier_index]):
+                    level = max(level, levels[earlier_index] + 1)
+            levels.append(level)
+
+        stages = [[] for _ in range(max(levels, default=-1) + 1)]
+        for rule, level in zip(self.rules, levels):
+            stages[level].append(rule)
+        self.stages = tuple(tuple(stage) for stage in stages)
+
+    def runnable(self, rule, crash):
+        """Returns whether all the fields a rule requires are on the crash"""
+        for field in getattr(rule, 'requires', ()):
+            if not _field_present(
+                field, crash.raw_crash, crash.dumps, crash.processed_crash
+            ):
+                logger.debug(
+                    '%s skipped for %s: %s is missing',
+                    rule.__class__.__name__,
+                    crash.crash_id,
+                    field
+                )
+                return False
+        return True
+
+    def apply(self, crash, suppress_errors=False):
+        """applies every stage of the pipeline to a crash
+
+        :arg Crash crash: the crash to transform
+
+        :arg Boolean suppress_errors: should errors be supressed and stored
+        on the crash
+
+        :raises Error: if suppress_errors is False this may raise arbitrary
+        errors
+
+        :returns Crash: the crash that was passed in
+
+        """
+        transform = crash.transform
+        for stage in self.stages:
+            rules = [rule for rule in stage if self.runnable(rule, crash)]
+
+            if self.executor is None or len(rules) < 2:
+                for rule in rules:
+                    transform(rule, supress_errors=suppress_errors)
+                continue
+
+            futures = [
+                self.executor.submit(
+                    transform, rule, supress_errors=suppress_errors
+                )
+                for rule in rules
+            ]
+            wait(futures)
+            for future in futures:
+                # re-raises the first unsuppressed error in declared order
+                future.result()
+
+        return crash
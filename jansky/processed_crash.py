@@ -0,0 +1,163 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+A compact record for processed crashes
+
+``ProcessedCrash`` is a mapping that works anywhere the plain dict rules
+expect does, but keeps the fields the rules know about in slots and only
+puts other keys in a dict of their own. Values of the fields with only a
+handful of distinct values, like the product and the os, are interned, so
+crashes held together share one copy of each.
+
+It's worth it when many processed crashes are held in memory at once, like
+a ``CrashBatch`` waiting to be saved. Use it by passing it as the
+``processed_crash_class`` of a ``Crash`` or ``CrashBatch``::
+
+    from jansky.processed_crash import ProcessedCrash
+
+    batch = CrashBatch(crash_ids, processed_crash_class=ProcessedCrash)
+
+"""
+
+from collections.abc import MutableMapping
+import sys
+
+
+# the processed crash fields the rules read and write
+FIELDS = (
+    'PluginFilename',
+    'PluginName',
+    'PluginVersion',
+    'ReleaseChannel',
+    'Winsock_LSP',
+    'addons',
+    'addons_checked',
+    'app_notes',
+    'build',
+    'client_crash_date',
+    'completed_datetime',
+    'cpu_info',
+    'cpu_name',
+    'crash_id',
+    'crash_time',
+    'date_processed',
+    'distributor',
+    'distributor_version',
+    'email',
+    'exploitability',
+    'flash_version',
+    'hang_type',
+    'hangid',
+    'install_age',
+    'java_stack_trace',
+    'json_dump',
+    'last_crash',
+    'mdsw_return_code',
+    'mdsw_status_string',
+    'metadata',
+    'os_name',
+    'os_version',
+    'process_type',
+    'processor_notes',
+    'product',
+    'productid',
+    'proto_signature',
+    'release_channel',
+    'signature',
+    'started_datetime',
+    'submitted_timestamp',
+    'success',
+    'topmost_filenames',
+    'uptime',
+    'url',
+    'user_comments',
+    'user_id',
+    'uuid',
+    'version',
+)
+
+# fields with few distinct values whose strings are interned
+INTERNED_FIELDS = frozenset([
+    'ReleaseChannel',
+    'cpu_name',
+    'os_name',
+    'process_type',
+    'product',
+    'release_channel',
+])
+
+# field -> slot; slots are prefixed so they can't collide with methods
+_SLOTS = dict((field, '_f_' + field) for field in FIELDS)
+
+
+class ProcessedCrash(MutableMapping):
+    """A processed crash with its known fields in slots
+
+    Keys iterate in ``FIELDS`` order followed by any other keys in the order
+    they were added. Compares equal to a dict with the same items.
+
+    """
+    __slots__ = tuple(_SLOTS.values()) + ('_extra',)
+
+    def __init__(self, *args, **kwargs):
+        self._extra = {}
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            return self._extra[key]
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            self._extra[key] = value
+            return
+        if key in INTERNED_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        setattr(self, slot, value)
+
+    def __delitem__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            del self._extra[key]
+            return
+        try:
+            delattr(self, slot)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            return key in self._extra
+        return hasattr(self, slot)
+
+    def get(self, key, default=None):
+        slot = _SLOTS.get(key)
+        if slot is None:
+            return self._extra.get(key, default)
+        return getattr(self, slot, default)
+
+    def __iter__(self):
+        for field, slot in _SLOTS.items():
+            if hasattr(self, slot):
+                yield field
+        yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'ProcessedCrash(%r)' % dict(self)
+
+    def copy(self):
+        """Returns a shallow copy, like ``dict.copy``"""
+        return ProcessedCrash(self)
@@ -3,7 +3,11 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import logging
+import time
 
+import markus
+
+from jansky.jsondump import LazyJsonDump
 from jansky.util import utc_now
 
 logger = logging.getLogger(__name__)
@@ -42,8 +46,23 @@ class Rule():
             get_processed_crash('AAAAAAAA-1111-4242-FFFB-094F01B8FF11')
         )
 
+    Rules may declare the crash fields they touch so that a scheduler can work
+    out which rules depend on each other. Fields are named
+    ``'<container>.<key>'`` where container is ``raw_crash``, ``dumps`` or
+    ``processed_crash`` and key is a top-level key of that mapping. Appending
+    a processor note counts as both reading and writing
+    ``processed_crash.metadata``.
+
+    ``reads`` and ``writes`` default to ``None``, meaning "undeclared", and
+    such rules are treated as depending on every other rule. ``requires``
+    lists fields that must be present for the rule to do anything useful; a
+    scheduler may skip the rule when any of them are absent.
 
     '''
+    reads = None
+    writes = None
+    requires = frozenset()
+
     def __call__(self, crash_id, raw_crash, dumps, processed_crash):
         if self.predicate(crash_id, raw_crash, dumps, processed_crash):
             self.action(crash_id, raw_crash, dumps, processed_crash)
@@ -77,6 +96,9 @@ class Identity(Rule):
         crash.fetch()
           .transform(Identity)
     '''
+    reads = frozenset()
+    writes = frozenset()
+
     def __call__(self, crash_id, raw_crash, dumps, processed_crash):
         return
 
@@ -87,6 +109,95 @@ class Introspector(Rule):
         logger.info((crash_id, raw_crash, dumps, processed_crash))
 
 
+class InstrumentedRule(Rule):
+    '''Wraps a rule to emit metrics about how it behaves
+
+    For every call this emits ``jansky.rule.timing`` with the wall time of the
+    call in milliseconds and, for rules that use the predicate/action split,
+    increments ``jansky.rule.predicate`` tagged with ``result:hit`` or
+    ``result:miss``. All metrics are tagged with ``rule:<class name>``.
+    ``Crash.transform`` reports errors it suppresses for instrumented rules
+    through ``record_suppressed_error``.
+
+    Rules with an ``action_many`` keep it when wrapped, so a ``CrashBatch``
+    still hands them the whole batch. Each of those calls emits
+    ``jansky.rule.batch_timing`` with its wall time in milliseconds, and the
+    predicate calls the batch makes are counted as above.
+
+    Wrapping is how instrumentation is turned on, so rules that aren't wrapped
+    pay nothing for it.
+
+    Usage::
+
+        pipeline = Pipeline(*[InstrumentedRule(rule) for rule in rules])
+    '''
+    def __init__(self, rule, metrics=None):
+        self.rule = rule
+        self.metrics = metrics or markus.get_metrics('jansky.rule')
+        self.tags = ['rule:%s' % rule.__class__.__name__]
+        self._hit_tags = self.tags + ['result:hit']
+        self._miss_tags = self.tags + ['result:miss']
+
+        # rules that override __call__ have no meaningful predicate
+        self._split = (
+            isinstance(rule, Rule) and
+            type(rule).__call__ is Rule.__call__
+        )
+
+        # schedulers see through the wrapper
+        self.reads = getattr(rule, 'reads', None)
+        self.writes = getattr(rule, 'writes', None)
+        self.requires = getattr(rule, 'requires', frozenset())
+
+        # CrashBatch looks for action_many, so only have one if the rule does
+        if getattr(rule, 'action_many', None) is not None:
+            self.action_many = self._action_many
+
+    def predicate(self, crash_id, raw_crash, dumps, processed_crash):
+        if not self._split:
+            return True
+        if self.rule.predicate(crash_id, raw_crash, dumps, processed_crash):
+            self.metrics.incr('predicate', tags=self._hit_tags)
+            return True
+        self.metrics.incr('predicate', tags=self._miss_tags)
+        return False
+
+    def _action_many(self, crashes):
+        start = time.perf_counter()
+        try:
+            return self.rule.action_many(crashes)
+        finally:
+            self.metrics.timing(
+                'batch_timing',
+                value=(time.perf_counter() - start) * 1000.0,
+                tags=self.tags
+            )
+
+    def __call__(self, crash_id, raw_crash, dumps, processed_crash):
+        start = time.perf_counter()
+        try:
+            if not self._split:
+                self.rule(crash_id, raw_crash, dumps, processed_crash)
+            elif self.rule.predicate(crash_id, raw_crash, dumps, processed_crash):
+                self.metrics.incr('predicate', tags=self._hit_tags)
+                self.rule.action(crash_id, raw_crash, dumps, processed_crash)
+            else:
+                self.metrics.incr('predicate', tags=self._miss_tags)
+        finally:
+            self.metrics.timing(
+                'timing',
+                value=(time.perf_counter() - start) * 1000.0,
+                tags=self.tags
+            )
+
+    def record_suppressed_error(self, error):
+        """Counts an error raised by the wrapped rule that was suppressed"""
+        self.metrics.incr(
+            'errors_suppressed',
+            tags=self.tags + ['error:%s' % error.__class__.__name__]
+        )
+
+
 class UUIDCorrection(Rule):
     '''set the UUID in the raw_crash if it is missing
 
@@ -96,6 +207,9 @@ class UUIDCorrection(Rule):
 
     TODO: should this be an error condition instead?
     '''
+    reads = frozenset(['raw_crash.uuid'])
+    writes = frozenset(['raw_crash.uuid'])
+
     def predicate(self, crash_id, raw_crash, dumps, processed_crash):
         return 'uuid' not in raw_crash
 
@@ -138,6 +252,16 @@ class CreateMetadata(Rule):
     without being read. the metadata can likely be replaced with a notes object
     hung directly off the processor itself.
     '''
+    reads = frozenset([
+        'processed_crash.processor_notes',
+        'processed_crash.started_datetime',
+    ])
+    writes = frozenset([
+        'processed_crash.metadata',
+        'processed_crash.signature',
+        'processed_crash.started_datetime',
+        'processed_crash.success',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         metadata = {
@@ -170,10 +294,23 @@ class SaveMetadata(Rule):
 
     this is expected to be the final rule before save
     '''
+    reads = frozenset(['processed_crash.json_dump', 'processed_crash.metadata'])
+    writes = frozenset([
+        'processed_crash.completed_datetime',
+        'processed_crash.metadata',
+        'processed_crash.processor_notes',
+        'processed_crash.success',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         metadata = processed_crash['metadata']
 
+        # saving decodes all of a lazy json_dump anyway, so it's only now
+        # that what its caps dropped is worth finding out
+        json_dump = processed_crash.get('json_dump')
+        if isinstance(json_dump, LazyJsonDump):
+            metadata['processor_notes'].extend(json_dump.truncation_notes())
+
         if 'original_processor_notes' in metadata:
             metadata['processor_notes'].extend(
                 metadata['original_processor_notes'])
@@ -0,0 +1,131 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import logging
+
+from jansky.jsondump import LazyJsonDump, read_capped_json_dump
+from jansky.rule import Rule
+from jansky.stackwalker import (
+    StackwalkerError,
+    StackwalkerResult,
+    StackwalkerTimeout
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BreakpadStackwalkerRule(Rule):
+    '''walk the minidump with a stackwalker from a pool and store its output
+    as the json_dump
+
+    replaces socorro's BreakpadStackwalkerRule2015, which started a new
+    stackwalker for every crash. the raw crash is handed to the stackwalker
+    along with the dump, so the rule is left undeclared and runs after every
+    rule that changes the raw crash.
+
+    in a CrashBatch all of the batch's dumps are pipelined through one
+    stackwalker process.
+
+    with a StackwalkerCache, dumps that have been walked before aren't walked
+    again, which mostly pays off when reprocessing.
+
+    the json_dump keeps at most max_threads threads and max_frames frames per
+    thread, and what was dropped is noted, by SaveMetadata for the
+    LazyJsonDump. output too big to hold in memory
+    comes spooled to a file and is read from there a chunk at a time, the
+    rest is a LazyJsonDump.
+    '''
+    def __init__(self, pool, dump_name='upload_file_minidump', cache=None,
+                 max_threads=256, max_frames=500):
+        self.pool = pool
+        self.dump_name = dump_name
+        self.requires = frozenset(['dumps.%s' % dump_name])
+        self.cache = cache
+        self.max_threads = max_threads
+        self.max_frames = max_frames
+
+    def predicate(self, crash_id, raw_crash, dumps, processed_crash):
+        return self.dump_name in dumps
+
+    def _request(self, crash_id, raw_crash, dumps):
+        return {
+            'crash_id': crash_id,
+            'dump_path': dumps.path(self.dump_name),
+            'raw_crash': raw_crash,
+        }
+
+    def _walk_many(self, crashes):
+        results = [None] * len(crashes)
+        keys = [None] * len(crashes)
+        if self.cache is not None:
+            for index, (_, _, dumps, _) in enumerate(crashes):
+                keys[index] = self.cache.key(dumps[self.dump_name])
+                results[index] = self.cache.get(keys[index])
+
+        misses = [index for index, result in enumerate(results) if result is None]
+        if not misses:
+            return results
+
+        walked = self.pool.walk_many([
+            self._request(*crashes[index][:3]) for index in misses
+        ])
+        for index, result in zip(misses, walked):
+            results[index] = result
+            if self.cache is not None and isinstance(result, StackwalkerResult):
+                self.cache.put(keys[index], result)
+        return results
+
+    def action(self, crash_id, raw_crash, dumps, processed_crash):
+        result, = self._walk_many([(crash_id, raw_crash, dumps, processed_crash)])
+        self._save_result(crash_id, processed_crash, result)
+
+    def action_many(self, crashes):
+        results = self._walk_many(crashes)
+        errors = [None] * len(crashes)
+        for index, result in enumerate(results):
+            crash_id, _, _, processed_crash = crashes[index]
+            try:
+                self._save_result(crash_id, processed_crash, result)
+            except Exception as x:
+                errors[index] = x
+        return errors
+
+    def _read_output(self, output, processor_notes):
+        if isinstance(output, bytes):
+            # SaveMetadata notes what the caps dropped, since finding out
+            # means decoding all of it
+            return LazyJsonDump(output, self.max_threads, self.max_frames)
+
+        # spooled to a file because it's too big to hold in memory
+        with output:
+            json_dump, notes = read_capped_json_dump(
+                output, self.max_threads, self.max_frames
+            )
+        processor_notes.extend(notes)
+        return json_dump
+
+    def _save_result(self, crash_id, processed_crash, result):
+        processor_notes = processed_crash['metadata']['processor_notes']
+        returncode, json_dump, status = -1, {}, 'unknown error'
+
+        if isinstance(result, StackwalkerTimeout):
+            processor_notes.append('MDSW timeout (SIGKILL)')
+        elif isinstance(result, StackwalkerError):
+            processor_notes.append('MDSW failed: %s' % result)
+        else:
+            returncode = result.returncode
+            try:
+                json_dump = self._read_output(result.output, processor_notes)
+                status = json_dump.get('status', status)
+            except ValueError:
+                json_dump = {}
+                processor_notes.append('MDSW emitted no json output')
+            if returncode != 0:
+                processor_notes.append(
+                    'MDSW terminated with return code %s' % returncode
+                )
+
+        processed_crash['json_dump'] = json_dump
+        processed_crash['mdsw_return_code'] = returncode
+        processed_crash['mdsw_status_string'] = status
@@ -2,6 +2,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from collections import namedtuple
 import logging
 
 from jansky.rule import Rule
@@ -9,9 +10,131 @@ from jansky.rule import Rule
 logger = logging.getLogger(__name__)
 
 
+# a field FieldMappingRule copies: raw_key is looked up in the raw crash and
+# its value stored under processed_key, or default when it's missing. with a
+# raw_key of None the default is always stored, a default of REQUIRED leaves
+# processed_key unset when raw_key is missing, and with fill_raw the default
+# is stored in the raw crash too, like raw_crash.setdefault does
+FieldMapping = namedtuple(
+    'FieldMapping', ['raw_key', 'processed_key', 'default', 'fill_raw']
+)
+FieldMapping.__new__.__defaults__ = (None, False)
+
+REQUIRED = object()
+
+
+def _compile_mappings(mappings):
+    """Returns a function with the rule signature that applies the
+    mappings to a crash"""
+    copied = tuple(
+        (mapping.raw_key, mapping.processed_key, mapping.default)
+        for mapping in mappings
+        if mapping.raw_key is not None and
+        mapping.default is not REQUIRED and
+        not mapping.fill_raw
+    )
+    constants = dict(
+        (mapping.processed_key, mapping.default)
+        for mapping in mappings if mapping.raw_key is None
+    )
+    required = tuple(
+        (mapping.raw_key, mapping.processed_key)
+        for mapping in mappings if mapping.default is REQUIRED
+    )
+    filled = tuple(
+        (mapping.raw_key, mapping.processed_key, mapping.default)
+        for mapping in mappings if mapping.fill_raw
+    )
+
+    def copy_fields(crash_id, raw_crash, dumps, processed_crash):
+        get = raw_crash.get
+        for raw_key, processed_key, default in copied:
+            processed_crash[processed_key] = get(raw_key, default)
+        if constants:
+            processed_crash.update(constants)
+        for raw_key, processed_key in required:
+            if raw_key in raw_crash:
+                processed_crash[processed_key] = raw_crash[raw_key]
+        for raw_key, processed_key, default in filled:
+            processed_crash[processed_key] = raw_crash.setdefault(raw_key, default)
+
+    return copy_fields
+
+
+class FieldMappingRule(Rule):
+    '''copy fields from the raw crash to the processed crash as laid out in
+    a table of FieldMapping
+
+    stands in for rules that do nothing but copy, like ProductRule and
+    UserDataRule, with one rule and one call per crash. the table is checked
+    and compiled into a single function when the rule is built, and the
+    rule's reads and writes are worked out from it.
+    '''
+    def __init__(self, mappings):
+        """
+        :arg mappings: ``FieldMapping`` instances or tuples of their fields
+
+        :raises ValueError: if two mappings write the same processed key, a
+            mapping fills a raw key another one reads, or a mapping without a
+            raw key is required or fills one
+
+        """
+        self.mappings = tuple(FieldMapping(*mapping) for mapping in mappings)
+
+        processed_keys = [mapping.processed_key for mapping in self.mappings]
+        duplicates = set(key for key in processed_keys if processed_keys.count(key) > 1)
+        if duplicates:
+            raise ValueError('processed keys mapped more than once: %s' % sorted(duplicates))
+        for mapping in self.mappings:
+            if mapping.raw_key is None and (mapping.default is REQUIRED or mapping.fill_raw):
+                raise ValueError('%s needs a raw key' % mapping.processed_key)
+            if mapping.fill_raw and mapping.default is REQUIRED:
+                raise ValueError('%s fills a required raw key' % mapping.processed_key)
+            if mapping.fill_raw and [
+                other for other in self.mappings if other.raw_key == mapping.raw_key
+            ] != [mapping]:
+                raise ValueError('%s is filled and read by other mappings' % mapping.raw_key)
+
+        self.reads = frozenset(
+            'raw_crash.%s' % mapping.raw_key
+            for mapping in self.mappings if mapping.raw_key is not None
+        )
+        self.writes = frozenset(
+            ['processed_crash.%s' % key for key in processed_keys] +
+            ['raw_crash.%s' % mapping.raw_key for mapping in self.mappings if mapping.fill_raw]
+        )
+        self._copy_fields = _compile_mappings(self.mappings)
+
+    def __call__(self, crash_id, raw_crash, dumps, processed_crash):
+        self._copy_fields(crash_id, raw_crash, dumps, processed_crash)
+
+    def action(self, crash_id, raw_crash, dumps, processed_crash):
+        self._copy_fields(crash_id, raw_crash, dumps, processed_crash)
+
+    def action_many(self, crashes):
+        copy_fields = self._copy_fields
+        errors = [None] * len(crashes)
+        for index, crash in enumerate(crashes):
+            try:
+                copy_fields(*crash)
+            except Exception as x:
+                errors[index] = x
+        return errors
+
+
+# what IdentifierRule copies
+IDENTIFIER_FIELD_MAPPINGS = (
+    FieldMapping('uuid', 'crash_id', REQUIRED),
+    FieldMapping('uuid', 'uuid', REQUIRED),
+)
+
+
 class IdentifierRule(Rule):
     '''sets processed crash id values
     '''
+    reads = frozenset(['raw_crash.uuid'])
+    writes = frozenset(['processed_crash.crash_id', 'processed_crash.uuid'])
+    requires = frozenset(['raw_crash.uuid'])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['crash_id'] = raw_crash['uuid']
@@ -21,6 +144,12 @@ class IdentifierRule(Rule):
 class CPUInfoRule(Rule):
     '''lift cpu_info and count out of the dump and into top-level fields
     '''
+    reads = frozenset(['processed_crash.json_dump'])
+    writes = frozenset([
+        'processed_crash.cpu_info',
+        'processed_crash.cpu_name',
+    ])
+    requires = frozenset(['processed_crash.json_dump'])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['cpu_info'] = ''
@@ -45,6 +174,12 @@ class CPUInfoRule(Rule):
 class OSInfoRule(Rule):
     '''lift os_name and os_version out of the dump and into top-level fields
     '''
+    reads = frozenset(['processed_crash.json_dump'])
+    writes = frozenset([
+        'processed_crash.os_name',
+        'processed_crash.os_version',
+    ])
+    requires = frozenset(['processed_crash.json_dump'])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['os_name'] = (
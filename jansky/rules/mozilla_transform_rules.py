@@ -4,14 +4,15 @@
 
 import datetime
 import logging
-import re
 import time
 
 from sys import maxsize
 
 
+from jansky.modules import KnownModule, KnownModuleClassifier, get_module_index
 from jansky.util import get_date_from_crash_id, datetime_from_isodate_string
 from jansky.rule import Rule
+from jansky.rules.general_transform_rules import FieldMapping
 
 from urllib.parse import unquote_plus
 
@@ -31,6 +32,16 @@ UTC = isodate.UTC
 class AddonsRule(Rule):
     '''transform add-on information into a useful form
     '''
+    reads = frozenset([
+        'raw_crash.Add-ons',
+        'raw_crash.EMCheckCompatibility',
+        'processed_crash.metadata',
+    ])
+    writes = frozenset([
+        'processed_crash.addons',
+        'processed_crash.addons_checked',
+        'processed_crash.metadata',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         addons_checked = raw_crash.get('EMCheckCompatibility', '')
@@ -61,7 +72,32 @@ class AddonsRule(Rule):
 
 class DatesAndTimesRule(Rule):
     '''
+    in a CrashBatch the submitted timestamps are parsed once per distinct
+    value and the epoch arithmetic is done for the whole batch. crashes whose
+    fields are all missing or integers are handled without per-field
+    exception handling; anything else goes through action, so the results
+    and notes are the same either way.
     '''
+    reads = frozenset([
+        'raw_crash.CrashTime',
+        'raw_crash.InstallTime',
+        'raw_crash.SecondsSinceLastCrash',
+        'raw_crash.StartupTime',
+        'raw_crash.submitted_timestamp',
+        'raw_crash.timestamp',
+        'raw_crash.uuid',
+        'processed_crash.metadata',
+    ])
+    writes = frozenset([
+        'processed_crash.client_crash_date',
+        'processed_crash.crash_time',
+        'processed_crash.date_processed',
+        'processed_crash.install_age',
+        'processed_crash.last_crash',
+        'processed_crash.metadata',
+        'processed_crash.submitted_timestamp',
+        'processed_crash.uptime',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processor_notes = processed_crash['metadata']['processor_notes']
@@ -152,10 +188,141 @@ class DatesAndTimesRule(Rule):
 
         return True
 
+    _EPOCH = datetime.datetime(1970, 1, 1, tzinfo=UTC)
+    _EPOCH_ORDINAL = _EPOCH.toordinal()
+    # client_crash_date can be worked out by arithmetic in this range
+    _MAX_TIMESTAMP = int((datetime.datetime(9999, 1, 1, tzinfo=UTC) - _EPOCH).total_seconds())
+
+    def _mktime(self, submitted_timestamp):
+        try:
+            return int(time.mktime(submitted_timestamp.timetuple()))
+        except (OverflowError, ValueError):
+            return None
+
+    def _epoch_seconds(self, submitted_timestamps, local_is_utc):
+        """returns int(time.mktime(x.timetuple())) for each of
+        submitted_timestamps, or None where that fails"""
+        if not local_is_utc:
+            return [self._mktime(x) for x in submitted_timestamps]
+
+        # mktime reads the timestamp as local time, which is UTC here, so
+        # it's plain arithmetic
+        epoch_seconds = []
+        for x in submitted_timestamps:
+            if x.year < 1970:
+                epoch_seconds.append(self._mktime(x))
+                continue
+            epoch_seconds.append(
+                (x.toordinal() - self._EPOCH_ORDINAL) * 86400 +
+                x.hour * 3600 + x.minute * 60 + x.second
+            )
+        return epoch_seconds
+
+    def _action_regular(self, raw_crash, submitted_timestamp, submitted_timestamp_as_epoch):
+        """works out the fields of a crash whose fields are all missing or
+        integers, like action does
+
+        :returns: ``(fields, notes)``
+
+        :raises Exception: if anything is off, leaving it to action to deal
+        with
+
+        """
+        notes = []
+        timestampTime = int(raw_crash.get('timestamp', submitted_timestamp_as_epoch))
+
+        if 'CrashTime' in raw_crash:
+            crash_time = int(raw_crash['CrashTime'][:10])
+        else:
+            notes.append("WARNING: raw_crash missing %s" % 'CrashTime')
+            crash_time = timestampTime
+        if crash_time == submitted_timestamp_as_epoch:
+            notes.append("client_crash_date is unknown")
+
+        startupTime = int(raw_crash.get('StartupTime', crash_time))
+        installTime = int(raw_crash.get('InstallTime', startupTime))
+
+        last_crash = None
+        if 'SecondsSinceLastCrash' in raw_crash:
+            last_crash = int(raw_crash['SecondsSinceLastCrash'])
+        else:
+            notes.append('non-integer value of "SecondsSinceLastCrash"')
+        if last_crash is not None and last_crash > maxsize:
+            last_crash = None
+            notes.append('"SecondsSinceLastCrash" larger than MAXINT - set to NULL')
+
+        if not 0 <= crash_time < self._MAX_TIMESTAMP:
+            raise ValueError('crash_time out of range')
+        client_crash_date = self._EPOCH + datetime.timedelta(seconds=crash_time)
+
+        fields = {
+            'submitted_timestamp': submitted_timestamp,
+            'date_processed': submitted_timestamp,
+            'crash_time': crash_time,
+            'client_crash_date': client_crash_date,
+            'install_age': crash_time - installTime,
+            'uptime': max(0, crash_time - startupTime),
+            'last_crash': last_crash,
+        }
+        return fields, notes
+
+    def action_many(self, crashes):
+        errors = [None] * len(crashes)
+
+        def action(index):
+            try:
+                self.action(*crashes[index])
+            except Exception as x:
+                errors[index] = x
+
+        # submitted timestamps are all about the same time, so there are few
+        # distinct ones to parse
+        parsed = {}
+        regular = []
+        for index, crash in enumerate(crashes):
+            raw_crash = crash[1]
+            value = raw_crash.get('submitted_timestamp')
+            if isinstance(value, str):
+                if value not in parsed:
+                    try:
+                        parsed[value] = datetime_from_isodate_string(value)
+                    except ValueError:
+                        parsed[value] = None
+                value = parsed[value]
+            if (isinstance(value, datetime.datetime) and
+                    isinstance(raw_crash.get('uuid'), str)):
+                regular.append((index, value))
+            else:
+                action(index)
+
+        local_is_utc = time.timezone == 0 and time.altzone == 0 and not time.daylight
+        epoch_seconds = self._epoch_seconds(
+            [submitted_timestamp for _, submitted_timestamp in regular],
+            local_is_utc
+        )
+        for (index, submitted_timestamp), as_epoch in zip(regular, epoch_seconds):
+            crash = crashes[index]
+            try:
+                if as_epoch is None:
+                    raise ValueError('submitted_timestamp out of range')
+                fields, notes = self._action_regular(
+                    crash[1], submitted_timestamp, as_epoch
+                )
+            except Exception:
+                # let action raise, or note, exactly what it would alone
+                action(index)
+                continue
+            processed_crash = crash[3]
+            processed_crash.update(fields)
+            processed_crash['metadata']['processor_notes'].extend(notes)
+        return errors
+
 
 class EnvironmentRule(Rule):
     '''move the Notes from the raw_crash to the processed crash
     '''
+    reads = frozenset(['raw_crash.Notes'])
+    writes = frozenset(['processed_crash.app_notes'])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['app_notes'] = raw_crash.get('Notes', '')
@@ -164,6 +331,9 @@ class EnvironmentRule(Rule):
 class ESRVersionRewrite(Rule):
     '''rewrites the version to denote esr builds where appropriate
     '''
+    reads = frozenset(['raw_crash.ReleaseChannel', 'raw_crash.Version'])
+    writes = frozenset(['raw_crash.Version'])
+    requires = frozenset(['raw_crash.ReleaseChannel'])
 
     def predicate(self, crash_id, raw_crash, dumps, processed_crash):
         return raw_crash.get('ReleaseChannel', '') == 'esr'
@@ -179,6 +349,14 @@ class ESRVersionRewrite(Rule):
 class ExploitabilityRule(Rule):
     '''lifts exploitability out of the dump and into top-level fields
     '''
+    reads = frozenset([
+        'processed_crash.json_dump',
+        'processed_crash.metadata',
+    ])
+    writes = frozenset([
+        'processed_crash.exploitability',
+        'processed_crash.metadata',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         try:
@@ -196,6 +374,17 @@ class ExploitabilityRule(Rule):
 class FennecBetaError20150430(Rule):
     '''Correct the release channel for Fennec build 20150427090529
     '''
+    reads = frozenset([
+        'raw_crash.BuildID',
+        'raw_crash.ProductName',
+        'raw_crash.ReleaseChannel',
+    ])
+    writes = frozenset(['raw_crash.ReleaseChannel'])
+    requires = frozenset([
+        'raw_crash.BuildID',
+        'raw_crash.ProductName',
+        'raw_crash.ReleaseChannel',
+    ])
 
     def predicate(self, crash_id, raw_crash, dumps, processed_crash):
         return (raw_crash['ProductName'].startswith('Fennec') and
@@ -207,98 +396,108 @@ class FennecBetaError20150430(Rule):
         return True
 
 
+# a subset of the known "debug identifiers" for flash versions
+_KNOWN_FLASH_IDENTIFIERS = {
+    '7224164B5918E29AF52365AF3EAF7A500': '10.1.51.66',
+    'C6CDEFCDB58EFE5C6ECEF0C463C979F80': '10.1.51.66',
+    '4EDBBD7016E8871A461CCABB7F1B16120': '10.1',
+    'D1AAAB5D417861E6A5B835B01D3039550': '10.0.45.2',
+    'EBD27FDBA9D9B3880550B2446902EC4A0': '10.0.45.2',
+    '266780DB53C4AAC830AFF69306C5C0300': '10.0.42.34',
+    'C4D637F2C8494896FBD4B3EF0319EBAC0': '10.0.42.34',
+    'B19EE2363941C9582E040B99BB5E237A0': '10.0.32.18',
+    '025105C956638D665850591768FB743D0': '10.0.32.18',
+    '986682965B43DFA62E0A0DFFD7B7417F0': '10.0.23',
+    '937DDCC422411E58EF6AD13710B0EF190': '10.0.23',
+    '860692A215F054B7B9474B410ABEB5300': '10.0.22.87',
+    '77CB5AC61C456B965D0B41361B3F6CEA0': '10.0.22.87',
+    '38AEB67F6A0B43C6A341D7936603E84A0': '10.0.12.36',
+    '776944FD51654CA2B59AB26A33D8F9B30': '10.0.12.36',
+    '974873A0A6AD482F8F17A7C55F0A33390': '9.0.262.0',
+    'B482D3DFD57C23B5754966F42D4CBCB60': '9.0.262.0',
+    '0B03252A5C303973E320CAA6127441F80': '9.0.260.0',
+    'AE71D92D2812430FA05238C52F7E20310': '9.0.246.0',
+    '6761F4FA49B5F55833D66CAC0BBF8CB80': '9.0.246.0',
+    '27CC04C9588E482A948FB5A87E22687B0': '9.0.159.0',
+    '1C8715E734B31A2EACE3B0CFC1CF21EB0': '9.0.159.0',
+    'F43004FFC4944F26AF228334F2CDA80B0': '9.0.151.0',
+    '890664D4EF567481ACFD2A21E9D2A2420': '9.0.151.0',
+    '8355DCF076564B6784C517FD0ECCB2F20': '9.0.124.0',
+    '51C00B72112812428EFA8F4A37F683A80': '9.0.124.0',
+    '9FA57B6DC7FF4CFE9A518442325E91CB0': '9.0.115.0',
+    '03D99C42D7475B46D77E64D4D5386D6D0': '9.0.115.0',
+    '0CFAF1611A3C4AA382D26424D609F00B0': '9.0.47.0',
+    '0F3262B5501A34B963E5DF3F0386C9910': '9.0.47.0',
+    'C5B5651B46B7612E118339D19A6E66360': '9.0.45.0',
+    'BF6B3B51ACB255B38FCD8AA5AEB9F1030': '9.0.28.0',
+    '83CF4DC03621B778E931FC713889E8F10': '9.0.16.0',
+}
+
+
+# modules recognized by rules; add detectors to this table rather than
+# scanning the modules again
+KNOWN_MODULES = KnownModuleClassifier([
+    KnownModule(
+        'flash', ['NPSWF32'], r'NPSWF32_?(?P<version>.*)\.dll',
+        version_separator='_', debug_ids=_KNOWN_FLASH_IDENTIFIERS
+    ),
+    KnownModule(
+        'flash', ['FlashPlayerPlugin'], r'FlashPlayerPlugin_?(?P<version>.*)\.exe',
+        version_separator='_', debug_ids=_KNOWN_FLASH_IDENTIFIERS
+    ),
+    KnownModule(
+        'flash', ['libflashplayer'], r'libflashplayer(?P<version>.*)\.(.*)',
+        debug_ids=_KNOWN_FLASH_IDENTIFIERS
+    ),
+    KnownModule(
+        'flash', ['Flash Player', 'FlashPlayer'], r'Flash ?Player-?(?P<version>.*)',
+        debug_ids=_KNOWN_FLASH_IDENTIFIERS
+    ),
+])
+
+
 class FlashVersionRule(Rule):
     '''detect if flash is a module and pretty up the name
 
-    relies on a subset of the known "debug identifiers" for flash versions,
-    associated to the version and a regular expression to match Flash file
-    names
+    flash modules are recognized by KNOWN_MODULES from their file names, and
+    their version comes from the module, the file name or a subset of the
+    known "debug identifiers" for flash versions, in that order
     '''
-
-    _KNOWN_FLASH_IDENTIFIERS = {
-        '7224164B5918E29AF52365AF3EAF7A500': '10.1.51.66',
-        'C6CDEFCDB58EFE5C6ECEF0C463C979F80': '10.1.51.66',
-        '4EDBBD7016E8871A461CCABB7F1B16120': '10.1',
-        'D1AAAB5D417861E6A5B835B01D3039550': '10.0.45.2',
-        'EBD27FDBA9D9B3880550B2446902EC4A0': '10.0.45.2',
-        '266780DB53C4AAC830AFF69306C5C0300': '10.0.42.34',
-        'C4D637F2C8494896FBD4B3EF0319EBAC0': '10.0.42.34',
-        'B19EE2363941C9582E040B99BB5E237A0': '10.0.32.18',
-        '025105C956638D665850591768FB743D0': '10.0.32.18',
-        '986682965B43DFA62E0A0DFFD7B7417F0': '10.0.23',
-        '937DDCC422411E58EF6AD13710B0EF190': '10.0.23',
-        '860692A215F054B7B9474B410ABEB5300': '10.0.22.87',
-        '77CB5AC61C456B965D0B41361B3F6CEA0': '10.0.22.87',
-        '38AEB67F6A0B43C6A341D7936603E84A0': '10.0.12.36',
-        '776944FD51654CA2B59AB26A33D8F9B30': '10.0.12.36',
-        '974873A0A6AD482F8F17A7C55F0A33390': '9.0.262.0',
-        'B482D3DFD57C23B5754966F42D4CBCB60': '9.0.262.0',
-        '0B03252A5C303973E320CAA6127441F80': '9.0.260.0',
-        'AE71D92D2812430FA05238C52F7E20310': '9.0.246.0',
-        '6761F4FA49B5F55833D66CAC0BBF8CB80': '9.0.246.0',
-        '27CC04C9588E482A948FB5A87E22687B0': '9.0.159.0',
-        '1C8715E734B31A2EACE3B0CFC1CF21EB0': '9.0.159.0',
-        'F43004FFC4944F26AF228334F2CDA80B0': '9.0.151.0',
-        '890664D4EF567481ACFD2A21E9D2A2420': '9.0.151.0',
-        '8355DCF076564B6784C517FD0ECCB2F20': '9.0.124.0',
-        '51C00B72112812428EFA8F4A37F683A80': '9.0.124.0',
-        '9FA57B6DC7FF4CFE9A518442325E91CB0': '9.0.115.0',
-        '03D99C42D7475B46D77E64D4D5386D6D0': '9.0.115.0',
-        '0CFAF1611A3C4AA382D26424D609F00B0': '9.0.47.0',
-        '0F3262B5501A34B963E5DF3F0386C9910': '9.0.47.0',
-        'C5B5651B46B7612E118339D19A6E66360': '9.0.45.0',
-        'BF6B3B51ACB255B38FCD8AA5AEB9F1030': '9.0.28.0',
-        '83CF4DC03621B778E931FC713889E8F10': '9.0.16.0',
-    }
-
-    _FLASH_RE = re.compile(
-        r'NPSWF32_?(.*)\.dll|'
-        'FlashPlayerPlugin_?(.*)\.exe|'
-        'libflashplayer(.*)\.(.*)|'
-        'Flash ?Player-?(.*)'
-    )
+    reads = frozenset(['processed_crash.json_dump'])
+    writes = frozenset(['processed_crash.flash_version'])
+    requires = frozenset(['processed_crash.json_dump'])
 
     def _get_flash_version(self, filename=None, version=None,
                            debug_id=None, **kwargs):
         """If (we recognize this module as Flash and figure out a version):
         Returns version; else (None or '')"""
-
-        match = self._FLASH_RE.match(filename)
-        if not match:
+        classification = KNOWN_MODULES.classify_module({
+            'filename': filename,
+            'version': version,
+            'debug_id': debug_id,
+        })
+        if classification is None or classification.kind != 'flash':
             return None
-
-        if version:
-            return version
-
-        # we didn't get a version passed into us
-        # try do deduce it
-        groups = match.groups()
-        if groups[0]:
-            return groups[0].replace('_', '.')
-        if groups[1]:
-            return groups[1].replace('_', '.')
-        if groups[2]:
-            return groups[2]
-        if groups[4]:
-            return groups[4]
-        return self._KNOWN_FLASH_IDENTIFIERS.get(
-            debug_id,
-            None
-        )
+        return classification.version
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['flash_version'] = '[blank]'
 
-        for a_module in processed_crash['json_dump']['modules']:
-            flash_version = self._get_flash_version(**a_module)
-            if flash_version:
-                processed_crash['flash_version'] = flash_version
+        index = get_module_index(processed_crash)
+        for _, classification in index.classify(KNOWN_MODULES):
+            if classification.kind == 'flash' and classification.version:
+                processed_crash['flash_version'] = classification.version
                 return
 
 
 class JavaProcessRule(Rule):
     '''copy or initialize the java_stack_trace
     '''
+    reads = frozenset(['raw_crash.JavaStackTrace'])
+    writes = frozenset([
+        'raw_crash.JavaStackTrace',
+        'processed_crash.java_stack_trace',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['java_stack_trace'] = raw_crash.setdefault(
@@ -310,6 +509,9 @@ class JavaProcessRule(Rule):
 class PluginContentURL(Rule):
     '''overwrite 'URL' with 'PluginContentURL' if it exists
     '''
+    reads = frozenset(['raw_crash.PluginContentURL'])
+    writes = frozenset(['raw_crash.URL'])
+    requires = frozenset(['raw_crash.PluginContentURL'])
 
     def predicate(self, crash_id, raw_crash, dumps, processed_crash):
         return 'PluginContentURL' in raw_crash
@@ -321,6 +523,9 @@ class PluginContentURL(Rule):
 class PluginUserComment(Rule):
     '''replace the top level 'Comment' with 'PluginUserComment' if it exists
     '''
+    reads = frozenset(['raw_crash.PluginUserComment'])
+    writes = frozenset(['raw_crash.Comments'])
+    requires = frozenset(['raw_crash.PluginUserComment'])
 
     def predicate(self, crash_id, raw_crash, dumps, processed_crash):
         return 'PluginUserComment' in raw_crash
@@ -333,6 +538,25 @@ class ProductRule(Rule):
     '''transfers Product-related properties from the raw to the processed_crash,
     filling in with empty defaults where it
     '''
+    reads = frozenset([
+        'raw_crash.BuildID',
+        'raw_crash.Distributor',
+        'raw_crash.Distributor_version',
+        'raw_crash.ProductID',
+        'raw_crash.ProductName',
+        'raw_crash.ReleaseChannel',
+        'raw_crash.Version',
+    ])
+    writes = frozenset([
+        'processed_crash.build',
+        'processed_crash.distributor',
+        'processed_crash.distributor_version',
+        'processed_crash.product',
+        'processed_crash.productid',
+        'processed_crash.release_channel',
+        'processed_crash.ReleaseChannel',
+        'processed_crash.version',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['product'] = raw_crash.get('ProductName', '')
@@ -352,6 +576,9 @@ class ProductRule(Rule):
 class ProductRewrite(Rule):
     '''map a raw_crash ProductID to a ProductName using a lookup table
     '''
+    reads = frozenset(['raw_crash.ProductID', 'raw_crash.ProductName'])
+    writes = frozenset(['raw_crash.ProductName'])
+    requires = frozenset(['raw_crash.ProductID'])
 
     def __init__(self):
         super(ProductRewrite, self).__init__()
@@ -391,6 +618,24 @@ class ProductRewrite(Rule):
 class PluginRule(Rule):
     '''Detects and notes hangs, sometimes hangs in in plugins
     '''
+    reads = frozenset([
+        'raw_crash.Hang',
+        'raw_crash.HangID',
+        'raw_crash.PluginFilename',
+        'raw_crash.PluginHang',
+        'raw_crash.PluginName',
+        'raw_crash.PluginVersion',
+        'raw_crash.ProcessType',
+        'raw_crash.uuid',
+    ])
+    writes = frozenset([
+        'processed_crash.hang_type',
+        'processed_crash.hangid',
+        'processed_crash.PluginFilename',
+        'processed_crash.PluginName',
+        'processed_crash.PluginVersion',
+        'processed_crash.process_type',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['hangid'] = raw_crash.get('HangID', None)
@@ -424,6 +669,9 @@ class ThemePrettyNameRule(Rule):
     other built-in extensions.
 
     Must be run after the Addons Rule."""
+    reads = frozenset(['processed_crash.addons'])
+    writes = frozenset(['processed_crash.addons'])
+    requires = frozenset(['processed_crash.addons'])
 
     _CONVERSIONS = {
         "{972ce4c6-7e08-4474-a285-3208198ce6fd}":
@@ -462,6 +710,14 @@ class TopMostFilesRule(Rule):
     entirely, just giving one single value.  The fact that the destination
     varible in the processed_crash is plural rather than singular is
     unfortunate."""
+    reads = frozenset([
+        'processed_crash.json_dump',
+        'processed_crash.metadata',
+    ])
+    writes = frozenset([
+        'processed_crash.metadata',
+        'processed_crash.topmost_filenames',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['topmost_filenames'] = None
@@ -492,6 +748,17 @@ class TopMostFilesRule(Rule):
 class UserDataRule(Rule):
     '''copy user data from the raw crash to to the raw crash
     '''
+    reads = frozenset([
+        'raw_crash.Comments',
+        'raw_crash.Email',
+        'raw_crash.URL',
+    ])
+    writes = frozenset([
+        'processed_crash.email',
+        'processed_crash.url',
+        'processed_crash.user_comments',
+        'processed_crash.user_id',
+    ])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['url'] = raw_crash.get('URL', None)
@@ -504,6 +771,39 @@ class UserDataRule(Rule):
 class Winsock_LSPRule(Rule):
     '''copy over winsock_lsp field if it exists
     '''
+    reads = frozenset(['raw_crash.Winsock_LSP'])
+    writes = frozenset(['processed_crash.Winsock_LSP'])
 
     def action(self, crash_id, raw_crash, dumps, processed_crash):
         processed_crash['Winsock_LSP'] = raw_crash.get('Winsock_LSP', None)
+
+
+# what ProductRule, UserDataRule, EnvironmentRule, JavaProcessRule and
+# Winsock_LSPRule copy, for a FieldMappingRule
+COPY_FIELD_MAPPINGS = (
+    # ProductRule
+    FieldMapping('ProductName', 'product', ''),
+    FieldMapping('Version', 'version', ''),
+    FieldMapping('ProductID', 'productid', ''),
+    FieldMapping('Distributor', 'distributor', None),
+    FieldMapping('Distributor_version', 'distributor_version', None),
+    FieldMapping('ReleaseChannel', 'release_channel', ''),
+    # redundant, but I want to exactly match old processors.
+    FieldMapping('ReleaseChannel', 'ReleaseChannel', ''),
+    FieldMapping('BuildID', 'build', ''),
+
+    # UserDataRule
+    FieldMapping('URL', 'url', None),
+    FieldMapping('Comments', 'user_comments', None),
+    FieldMapping('Email', 'email', None),
+    FieldMapping(None, 'user_id', ''),
+
+    # EnvironmentRule
+    FieldMapping('Notes', 'app_notes', ''),
+
+    # JavaProcessRule
+    FieldMapping('JavaStackTrace', 'java_stack_trace', None, fill_raw=True),
+
+    # Winsock_LSPRule
+    FieldMapping('Winsock_LSP', 'Winsock_LSP', None),
+)
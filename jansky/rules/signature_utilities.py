@@ -0,0 +1,399 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import functools
+from itertools import islice
+import logging
+import re
+
+from jansky.rule import Rule
+
+logger = logging.getLogger(__name__)
+
+
+# frames that are left out of signatures
+IRRELEVANT_SIGNATURES = (
+    r'@0x[0-9a-fA-F]{2,}',
+    r'@0x[1-9a-fA-F]',
+    r'_CxxThrowException',
+    r'google_breakpad::ExceptionHandler::HandleInvalidParameter.*',
+    r'KiFastSystemCallRet',
+    r'libc\.so@.*',
+    r'libc-2\.5\.so@.*',
+    r'libEGL\.so@.*',
+    r'libdvm\.so\s*@\s*0x.*',
+    r'linux-gate\.so@0x.*',
+    r'MOZ_Assert',
+    r'MOZ_Crash',
+    r'mozcrt19\.dll@0x.*',
+    r'mozilla::ipc::RPCChannel::Call\(IPC::Message\*, IPC::Message\*\)',
+    r'_NSRaiseError',
+    r'(Nt|Zw)WaitForSingleObject(Ex)?',
+    r'(Nt|Zw)WaitForMultipleObjects(Ex)?',
+    r'RaiseException',
+    r'RtlpAdjustHeapLookasideDepth',
+    r'___TERMINATING_DUE_TO_UNCAUGHT_EXCEPTION___',
+    r'WaitForSingleObjectExImplementation',
+    r'WaitForMultipleObjectsExImplementation',
+    r'RealMsgWaitFor.*',
+    r'_ZdlPv',
+    r'zero',
+)
+
+# frames that aren't enough of a signature on their own, so the frame after
+# them is added too
+PREFIX_SIGNATURES = (
+    r'@0x0',
+    r'.*abort',
+    r'.*alloc_impl',
+    r'_alloca_probe.*',
+    r'__android_log_assert',
+    r'arena_.*',
+    r'.*calloc',
+    r'CFRelease',
+    r'_chkstk',
+    r'CrashInJS',
+    r'__delayLoadHelper2',
+    r'dlmalloc',
+    r'dvm.*',
+    r'.*free',
+    r'huge_dalloc',
+    r'je_.*',
+    r'JNI_CreateJavaVM',
+    r'_JNIEnv.*',
+    r'js::HashMap<.*',
+    r'js::HashSet<.*',
+    r'JS_DHashTableEnumerate',
+    r'JS_DHashTableOperate',
+    r'kill',
+    r'__libc_android_abort',
+    r'(libxul\.so|xul\.dll|XUL)@0x.*',
+    r'malloc',
+    r'malloc_.*',
+    r'memcmp',
+    r'memcpy',
+    r'memmove',
+    r'memset',
+    r'moz_xcalloc',
+    r'moz_xmalloc',
+    r'moz_xrealloc',
+    r'mozalloc_abort.*',
+    r'mozalloc_handle_oom',
+    r'<name omitted>',
+    r'NS_ABORT_OOM.*',
+    r'NS_DebugBreak.*',
+    r'NSS.*',
+    r'nss.*',
+    r'objc_msgSend',
+    r'operator new',
+    r'PL_.*',
+    r'PR_.*',
+    r'pthread_mutex_lock',
+    r'raise',
+    r'realloc',
+    r'RtlEnterCriticalSection',
+    r'strchr',
+    r'strcmp',
+    r'strcpy',
+    r'.*strdup',
+    r'strlen',
+    r'strncpy',
+    r'strstr',
+    r'wcslen',
+)
+
+# frames a signature starts at, skipping the frames above them; a tuple is a
+# sentinel and a function of the frames saying whether it applies
+SIGNATURE_SENTINELS = (
+    '_purecall',
+    (
+        'mozilla::ipc::RPCChannel::Call(IPC::Message*, IPC::Message*)',
+        lambda frames: (
+            'CrashReporter::CreatePairedMinidumps(void*, unsigned long, '
+            'nsAString_internal*, nsILocalFile**, nsILocalFile**)'
+        ) not in frames
+    ),
+    'Java_org_mozilla_gecko_GeckoAppShell_reportJavaCrash',
+    'google_breakpad::ExceptionHandler::HandleInvalidParameter'
+    '(wchar_t const*, wchar_t const*, wchar_t const*, unsigned int, unsigned int)',
+)
+
+# functions that get their line number added to the signature
+SIGNATURES_WITH_LINE_NUMBERS = (
+    r'js_Interpret',
+)
+
+
+class CSignatureTool:
+    '''generates signatures from the frames of a C/C++ stack
+
+    the irrelevant and prefix lists are compiled into a single regular
+    expression when the tool is built. normalized frames are memoized, and
+    signatures are cached by the tuple of normalized frames they were
+    generated from, so a stack that has been seen before costs a couple of
+    dict lookups.
+
+    the tool holds no per-crash state and is meant to be shared by every
+    crash a processor handles.
+    '''
+    signatures_delimiter = ' | '
+    max_frames = 40
+
+    def __init__(self, irrelevant=IRRELEVANT_SIGNATURES,
+                 prefixes=PREFIX_SIGNATURES, sentinels=SIGNATURE_SENTINELS,
+                 with_line_numbers=SIGNATURES_WITH_LINE_NUMBERS,
+                 normalize_cache_size=65536, signature_cache_size=10000):
+        # irrelevant comes first, so a frame in both lists is irrelevant
+        self._frame_re = re.compile('(?P<irrelevant>%s)|(?P<prefix>%s)' % (
+            self._alternatives(irrelevant),
+            self._alternatives(prefixes)
+        ))
+        self._line_numbers_re = re.compile(self._alternatives(with_line_numbers))
+        self._sentinels = {}
+        for sentinel in sentinels:
+            condition = None
+            if isinstance(sentinel, tuple):
+                sentinel, condition = sentinel
+            self._sentinels[sentinel] = condition
+
+        self._fixup_space = re.compile(r' (?=[\*&,])')
+        self._fixup_comma = re.compile(r',(?! )')
+
+        self._normalize = functools.lru_cache(maxsize=normalize_cache_size)(
+            self._normalize_uncached
+        )
+        self._generate = functools.lru_cache(maxsize=signature_cache_size)(
+            self._generate_uncached
+        )
+
+    @staticmethod
+    def _alternatives(patterns):
+        # an empty list matches nothing rather than everything
+        return '|'.join(patterns) or '(?!)'
+
+    def _collapse(self, function, exceptions=('name omitted', 'IPC::ParamTraits')):
+        '''replaces template arguments with T, leaving alone the ones that
+        start with one of the exceptions'''
+        if '<' not in function:
+            return function
+
+        output = []
+        depth = 0
+        for index, character in enumerate(function):
+            if character == '<':
+                if depth == 0 and (
+                    function.startswith(exceptions, index + 1) or
+                    function.endswith('operator', 0, index) or
+                    function.endswith('operator<', 0, index)
+                ):
+                    # a '>' outside of template arguments is kept as it is
+                    output.append(character)
+                elif depth == 0:
+                    output.append('<T>')
+                    depth = 1
+                else:
+                    depth += 1
+            elif character == '>' and depth:
+                depth -= 1
+            elif depth == 0:
+                output.append(character)
+        return ''.join(output)
+
+    def _normalize_uncached(self, module, function, file, line, module_offset, offset):
+        if function:
+            function = self._collapse(function)
+            if self._line_numbers_re.match(function):
+                function = '%s:%s' % (function, line)
+            # no spaces before stars, ampersands and commas, one after commas
+            function = self._fixup_space.sub('', function)
+            function = self._fixup_comma.sub(', ', function)
+            return function
+
+        if file and line:
+            filename = file.rstrip('/\\')
+            if '\\' in filename:
+                filename = filename.rsplit('\\', 1)[-1]
+            else:
+                filename = filename.rsplit('/', 1)[-1]
+            return '%s#%s' % (filename, line)
+
+        if not module and not module_offset and offset:
+            return '@%s' % offset
+        return '%s@%s' % (module or '', module_offset)
+
+    def normalize_frame(self, frame):
+        '''returns the signature of one frame dict from a json_dump'''
+        if 'normalized' in frame:
+            return frame['normalized']
+        return self._normalize(
+            frame.get('module'),
+            frame.get('function'),
+            frame.get('file'),
+            frame.get('line'),
+            frame.get('module_offset'),
+            frame.get('offset'),
+        )
+
+    def normalize_frames(self, frames):
+        '''returns the signatures of the top max_frames frames'''
+        return [
+            self.normalize_frame(frame)
+            for frame in islice(frames, self.max_frames)
+        ]
+
+    def _generate_uncached(self, source_list, hang_type, crashed_thread):
+        notes = []
+        # the first sentinel in list order that's in the stack wins, wherever
+        # it is in the stack
+        first_index = {}
+        for index, frame in enumerate(source_list):
+            if frame in self._sentinels and frame not in first_index:
+                first_index[frame] = index
+        if first_index:
+            for sentinel, condition in self._sentinels.items():
+                if sentinel in first_index and (condition is None or condition(source_list)):
+                    source_list = source_list[first_index[sentinel]:]
+                    break
+
+        new_list = []
+        for frame in source_list:
+            match = self._frame_re.match(frame)
+            if match is not None and match.group('irrelevant') is not None:
+                continue
+            new_list.append(frame)
+            if match is None:
+                break
+
+        signature = self.signatures_delimiter.join(new_list)
+        if hang_type == -1:
+            signature = 'hang | %s' % signature
+        elif hang_type == 1:
+            signature = 'chromehang | %s' % signature
+
+        if not new_list:
+            if crashed_thread is None:
+                notes.append(
+                    'CSignatureTool: No signature could be created because we '
+                    'do not know which thread crashed'
+                )
+                signature = 'EMPTY: no crashing thread identified'
+            else:
+                notes.append(
+                    'CSignatureTool: No proper signature could be created '
+                    'because no good data for the crashing thread (%s) was '
+                    'found' % crashed_thread
+                )
+                signature = 'EMPTY: no frame data available'
+        return signature, tuple(notes)
+
+    def generate(self, source_list, hang_type=None, crashed_thread=None):
+        '''returns a signature and a list of processor notes for the frame
+        signatures in source_list
+
+        :arg list source_list: normalized frames, top of the stack first
+
+        :arg int hang_type: -1 for a plugin hang, 1 for a browser hang
+
+        :arg int crashed_thread: the index of the crashing thread, or None
+        if it's not known
+
+        '''
+        signature, notes = self._generate(
+            tuple(islice(source_list, self.max_frames)), hang_type, crashed_thread
+        )
+        return signature, list(notes)
+
+
+class SignatureGenerationRule(Rule):
+    '''generate a signature from the top frames of the crashing thread
+
+    replaces the 'EMPTY: crash failed to process' placeholder set by
+    CreateMetadata and stores the normalized frames as the proto_signature.
+    '''
+    reads = frozenset([
+        'processed_crash.hang_type',
+        'processed_crash.json_dump',
+        'processed_crash.metadata',
+    ])
+    writes = frozenset([
+        'processed_crash.metadata',
+        'processed_crash.proto_signature',
+        'processed_crash.signature',
+    ])
+    requires = frozenset(['processed_crash.json_dump'])
+
+    def __init__(self, signature_tool=None):
+        self.c_signature_tool = signature_tool or CSignatureTool()
+
+    def predicate(self, crash_id, raw_crash, dumps, processed_crash):
+        return 'json_dump' in processed_crash
+
+    def action(self, crash_id, raw_crash, dumps, processed_crash):
+        processor_notes = processed_crash['metadata']['processor_notes']
+        json_dump = processed_crash['json_dump']
+
+        crash_info = json_dump.get('crash_info') or {}
+        crashed_thread = crash_info.get('crashing_thread')
+        frames = []
+        if crashed_thread is not None:
+            try:
+                frames = json_dump['threads'][crashed_thread]['frames']
+            except (KeyError, IndexError, TypeError) as exc:
+                processor_notes.append(
+                    'No crashing frames found because of %r' % exc
+                )
+
+        signature_list = self.c_signature_tool.normalize_frames(frames)
+        signature, notes = self.c_signature_tool.generate(
+            signature_list,
+            processed_crash.get('hang_type'),
+            crashed_thread
+        )
+        processed_crash['proto_signature'] = ' | '.join(signature_list)
+        processed_crash['signature'] = signature
+        processor_notes.extend(notes)
+
+
+class StackwalkerErrorSignatureRule(Rule):
+    '''add the stackwalker status to EMPTY signatures when the stackwalker
+    didn't finish cleanly
+    '''
+    reads = frozenset([
+        'processed_crash.mdsw_status_string',
+        'processed_crash.signature',
+    ])
+    writes = frozenset(['processed_crash.signature'])
+    requires = frozenset(['processed_crash.mdsw_status_string'])
+
+    def predicate(self, crash_id, raw_crash, dumps, processed_crash):
+        return (
+            processed_crash.get('signature', '').startswith('EMPTY') and
+            processed_crash.get('mdsw_status_string', 'OK') != 'OK'
+        )
+
+    def action(self, crash_id, raw_crash, dumps, processed_crash):
+        processed_crash['signature'] = '%s; %s' % (
+            processed_crash['signature'],
+            processed_crash['mdsw_status_string']
+        )
+
+
+class SigTrunc(Rule):
+    '''ensure that the signature is never longer than 255 characters
+    '''
+    reads = frozenset(['processed_crash.metadata', 'processed_crash.signature'])
+    writes = frozenset(['processed_crash.metadata', 'processed_crash.signature'])
+
+    max_length = 255
+
+    def predicate(self, crash_id, raw_crash, dumps, processed_crash):
+        return len(processed_crash.get('signature', '')) > self.max_length
+
+    def action(self, crash_id, raw_crash, dumps, processed_crash):
+        processed_crash['signature'] = '%s...' % (
+            processed_crash['signature'][:self.max_length - 3]
+        )
+        processed_crash['metadata']['processor_notes'].append(
+            'SigTrunc: signature truncated due to length'
+        )
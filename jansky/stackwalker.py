@@ -0,0 +1,469 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Long-lived stackwalker processes that minidumps are handed to for walking
+
+Every stackwalker process serves requests from its stdin and answers them on
+its stdout, in order. A request is a single line of JSON::
+
+    {"crash_id": "...", "dump_path": "/path/to/minidump", "raw_crash": {...}}
+
+and a response is a line of JSON with the return code and the length of the
+stackwalker output, followed by exactly that many bytes of output::
+
+    {"returncode": 0, "length": 1234}
+    {"status": "OK", "crash_info": ..., "threads": ...}
+
+Output longer than ``max_output_bytes`` is spooled to a temporary file as it
+comes in rather than held in memory, and the result's ``output`` is that file.
+
+Usage::
+
+    pool = StackwalkerPool(['stackwalk_server', '/symbols'], size=4)
+
+    result = pool.walk(request)
+    json_dump = json.loads(result.output.decode('utf-8'))
+
+"""
+
+from collections import namedtuple, OrderedDict
+import hashlib
+import json
+import logging
+import os
+import queue
+import selectors
+import subprocess
+import tempfile
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# output is bytes, or a binary file positioned at the start of the output
+# if it was spooled to disk
+StackwalkerResult = namedtuple('StackwalkerResult', ['returncode', 'output'])
+
+
+class StackwalkerError(Exception):
+    """Raised when a stackwalker process fails to answer a request"""
+
+
+class StackwalkerTimeout(StackwalkerError):
+    """Raised when a stackwalker process takes too long to answer a request"""
+
+
+class StackwalkerProcess:
+    """A stackwalker process that is started on first use and restarted
+    whenever it dies or has to be killed
+
+    Requests are pipelined: all of them are written to the process while the
+    responses are read back, without waiting for each response before
+    sending the next request.
+
+    """
+    read_size = 64 * 1024
+
+    def __init__(self, command, timeout=600, max_output_bytes=32 * 1024 * 1024):
+        """
+        :arg list command: the command line that starts a stackwalker process
+
+        :arg float timeout: seconds to wait for each response before the
+        process is killed
+
+        :arg int max_output_bytes: output longer than this is spooled to a
+        temporary file
+
+        """
+        self.command = command
+        self.timeout = timeout
+        self.max_output_bytes = max_output_bytes
+        self._proc = None
+        self._pid = None
+        self._buffer = bytearray()
+        self._header = None
+        self._spool = None
+
+    def _ensure_started(self):
+        if self._proc is not None and self._pid != os.getpid():
+            # inherited from the process we were forked from, which owns it
+            self._proc = None
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        if self._proc is not None:
+            logger.warning(
+                'stackwalker exited with %s, restarting', self._proc.returncode
+            )
+            self.kill()
+
+        self._proc = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            bufsize=0
+        )
+        self._pid = os.getpid()
+        os.set_blocking(self._proc.stdin.fileno(), False)
+        os.set_blocking(self._proc.stdout.fileno(), False)
+
+    def kill(self):
+        """Kills the process; the next request starts a new one"""
+        proc, self._proc = self._proc, None
+        self._buffer = bytearray()
+        self._header = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        if proc is None or self._pid != os.getpid():
+            return
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdin.close()
+        proc.stdout.close()
+        proc.wait()
+
+    def _parse_response(self):
+        """Returns the next complete response in the buffer, or None"""
+        if self._header is None:
+            end = self._buffer.find(b'\n')
+            if end < 0:
+                return None
+            try:
+                self._header = json.loads(self._buffer[:end].decode('utf-8'))
+                self._header['length'] = int(self._header['length'])
+            except (KeyError, TypeError, ValueError):
+                raise StackwalkerError(
+                    'bad response header: %r' % bytes(self._buffer[:end][:100])
+                )
+            del self._buffer[:end + 1]
+            if self._header['length'] > self.max_output_bytes:
+                self._spool = tempfile.TemporaryFile()
+
+        length = self._header['length']
+        if self._spool is not None:
+            # move what's here to the spool; length counts what's left
+            taken = min(length, len(self._buffer))
+            self._spool.write(self._buffer[:taken])
+            del self._buffer[:taken]
+            self._header['length'] = length = length - taken
+            if length:
+                return None
+            output, self._spool = self._spool, None
+            output.seek(0)
+        elif len(self._buffer) < length:
+            return None
+        else:
+            output = bytes(self._buffer[:length])
+            del self._buffer[:length]
+
+        result = StackwalkerResult(self._header.get('returncode', -1), output)
+        self._header = None
+        return result
+
+    def _communicate(self, requests, results):
+        """Sends requests and appends their results as they come back
+
+        :raises StackwalkerError: if the process dies, times out or answers
+        with garbage before all requests are answered
+
+        """
+        self._ensure_started()
+        expected = len(results) + len(requests)
+        pending = b''.join(
+            json.dumps(request, default=str).encode('utf-8') + b'\n'
+            for request in requests
+        )
+        stdin_fd = self._proc.stdin.fileno()
+        stdout_fd = self._proc.stdout.fileno()
+
+        selector = selectors.DefaultSelector()
+        selector.register(stdout_fd, selectors.EVENT_READ)
+        selector.register(stdin_fd, selectors.EVENT_WRITE)
+        deadline = time.monotonic() + self.timeout
+        try:
+            while len(results) < expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise StackwalkerTimeout(
+                        'no response within %s seconds' % self.timeout
+                    )
+                for key, _ in selector.select(remaining):
+                    if key.fd == stdin_fd:
+                        written = os.write(stdin_fd, pending[:self.read_size])
+                        pending = pending[written:]
+                        if not pending:
+                            selector.unregister(stdin_fd)
+                        continue
+
+                    chunk = os.read(stdout_fd, self.read_size)
+                    if not chunk:
+                        raise StackwalkerError('stackwalker exited')
+                    self._buffer.extend(chunk)
+                    result = self._parse_response()
+                    while result is not None:
+                        results.append(result)
+                        # every request gets the full timeout
+                        deadline = time.monotonic() + self.timeout
+                        result = self._parse_response()
+        except OSError as exc:
+            raise StackwalkerError('stackwalker pipe failed: %s' % exc)
+        finally:
+            selector.close()
+
+    def walk_many(self, requests):
+        """Walks many requests through this process
+
+        If the process fails while working on a request, that request's
+        result is the ``StackwalkerError`` and the process is restarted for
+        the requests after it.
+
+        :returns list: a ``StackwalkerResult`` or ``StackwalkerError`` for
+        each request, in order
+
+        """
+        results = []
+        while len(results) < len(requests):
+            try:
+                self._communicate(requests[len(results):], results)
+            except StackwalkerError as exc:
+                logger.warning(
+                    'stackwalker failed on %s: %s',
+                    requests[len(results)].get('crash_id'),
+                    exc
+                )
+                self.kill()
+                results.append(exc)
+        return results
+
+
+class StackwalkerPool:
+    """A fixed number of stackwalker processes shared by the threads of a
+    processor
+
+    Processes are started when they're first needed, so a pool built before
+    the processor forks worker processes gives each worker processes of its
+    own. Warm processes are reused first to keep their symbol caches hot.
+
+    """
+    def __init__(self, command, size=1, timeout=600, max_output_bytes=32 * 1024 * 1024):
+        """
+        :arg list command: the command line that starts a stackwalker process
+
+        :arg int size: the number of stackwalker processes
+
+        :arg float timeout: seconds to wait for each response
+
+        :arg int max_output_bytes: output longer than this is spooled to a
+        temporary file
+
+        """
+        self.size = size
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(StackwalkerProcess(
+                command, timeout=timeout, max_output_bytes=max_output_bytes
+            ))
+
+    def walk(self, request):
+        """Walks a single request
+
+        :returns StackwalkerResult: the result
+
+        :raises StackwalkerError: if the stackwalker failed on the request
+
+        """
+        result = self.walk_many([request])[0]
+        if isinstance(result, StackwalkerError):
+            raise result
+        return result
+
+    def walk_many(self, requests):
+        """Walks requests pipelined through one of the processes
+
+        :returns list: a ``StackwalkerResult`` or ``StackwalkerError`` for
+        each request, in order
+
+        """
+        process = self._idle.get()
+        try:
+            return process.walk_many(requests)
+        finally:
+            self._idle.put(process)
+
+    def close(self):
+        """Kills every process in the pool"""
+        processes = []
+        for _ in range(self.size):
+            processes.append(self._idle.get())
+        for process in processes:
+            process.kill()
+            self._idle.put(process)
+
+
+class StackwalkerCache:
+    """Remembers stackwalker output by the contents of the dump
+
+    Results are keyed by the SHA-256 of the dump bytes and ``version``, which
+    should change whenever the stackwalker or the symbols do. The output is
+    assumed to depend on nothing else.
+
+    There are two tiers: an in-memory LRU holding up to ``max_memory_bytes``
+    of output, and optionally a directory holding up to ``max_disk_bytes``.
+    Disk entries are files named after their key; once the directory goes
+    over its size, the least recently used files are deleted until it's
+    under 90% of it. The directory may be shared by several processes.
+
+    Only results with a return code of 0 are cached.
+
+    Usage::
+
+        cache = StackwalkerCache(version='stackwalker-1.2/symbols-2017-06-01')
+
+        key = cache.key(dumps['upload_file_minidump'])
+        result = cache.get(key)
+        if result is None:
+            result = pool.walk(request)
+            cache.put(key, result)
+
+    """
+    def __init__(self, version='', max_memory_bytes=64 * 1024 * 1024,
+                 directory=None, max_disk_bytes=1024 * 1024 * 1024):
+        """
+        :arg str version: the stackwalker and symbols version
+
+        :arg int max_memory_bytes: size of the in-memory tier; 0 turns it off
+
+        :arg str directory: directory of the on-disk tier; None turns it off
+
+        :arg int max_disk_bytes: size of the on-disk tier
+
+        """
+        self.version = version.encode('utf-8')
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # measured the first time something is written to disk
+        self._disk_bytes = None
+
+    def key(self, dump):
+        """Returns the cache key for a dump
+
+        :arg bytes dump: the dump; anything with the buffer protocol will do,
+        like the memoryviews of a ``DumpsMapping``
+
+        """
+        digest = hashlib.sha256(dump)
+        digest.update(b'\0' + self.version)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached ``StackwalkerResult`` for a key, or None"""
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                return result
+
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+            # the mtime is the disk tier's LRU order
+            os.utime(path)
+        except OSError:
+            return None
+        returncode, _, output = data.partition(b'\n')
+        result = StackwalkerResult(int(returncode), output)
+        self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        """Caches a ``StackwalkerResult`` if it's a successful one held in
+        memory"""
+        if result.returncode != 0 or not isinstance(result.output, bytes):
+            return
+        self._remember(key, result)
+        if self.directory is not None:
+            self._write(key, result)
+
+    def _remember(self, key, result):
+        size = len(result.output)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old.output)
+            self._memory[key] = result
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted.output)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _write(self, key, result):
+        path = self._path(key)
+        data = b'%d\n' % result.returncode + result.output
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception('Error writing %s to the stackwalker cache', key)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+
+    def _disk_entries(self):
+        """Returns (mtime, path, size) for every file in the disk tier"""
+        entries = []
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _evict(self):
+        # rescan, other processes may share the directory
+        entries = sorted(self._disk_entries())
+        self._disk_bytes = sum(size for _, _, size in entries)
+        target = self.max_disk_bytes * 0.9
+        for _, path, size in entries:
+            if self._disk_bytes <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self._disk_bytes -= size
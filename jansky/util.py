@@ -3,6 +3,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import datetime
+import functools
 import json
 import logging
 from pathlib import Path
@@ -10,6 +11,10 @@ import re
 import uuid
 
 import isodate
+from isodate.isotzinfo import build_tzinfo
+
+from jansky import crashid
+from jansky.partitions import WeeklyPartitions
 
 
 logger = logging.getLogger(__name__)
@@ -60,7 +65,7 @@ def get_throttle_from_crash_id(crash_id):
     :returns: int
 
     """
-    return int(crash_id[-7])
+    return crashid.get_throttle(crash_id)
 
 
 def get_date_from_crash_id(crash_id, as_datetime=False, century='20'):
@@ -74,10 +79,9 @@ def get_date_from_crash_id(crash_id, as_datetime=False, century='20'):
     :returns: string or datetime depending on ``as_datetime`` value
 
     """
-    s = century + crash_id[-6:]
     if as_datetime:
-        return datetime.datetime(int(s[:4]), int(s[4:6]), int(s[6:8]), tzinfo=UTC)
-    return s
+        return crashid.get_date(crash_id, century)
+    return century + crash_id[-6:]
 
 
 def date_to_string(date):
@@ -128,18 +132,84 @@ def datestring_to_weekly_partition(date_str):
         date = '2015-01-09'
         weekly_partition = '2014-01-05'
 
-    """
-
-    if isinstance(date_str, datetime.datetime):
-        d = date_str
-    elif date_str == 'now':
-        d = datetime.datetime.now().date()
-    else:
-        d = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-
-    last_monday = d + datetime.timedelta(0 - d.weekday())
+    The partitions are looked up in a ``WeeklyPartitions``.
 
-    return last_monday.strftime('%Y%m%d')
+    """
+    return _get_weekly_partitions().for_date(date_str)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_weekly_partitions():
+    return WeeklyPartitions()
+
+
+# the formats crashes actually come with, parsed without isodate
+_DATE_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+_DATETIME_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})'
+    r'(?:\.(\d{1,6}))?'
+    r'(Z|([-+])(\d{2})(?::?(\d{2}))?)?'
+)
+_SPACE_BETWEEN_DIGITS_RE = re.compile(r'(\d)\s(\d)')
+
+# number of parsed strings string_to_datetime remembers
+DATETIME_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=64)
+def _tzinfo(tzname, sign, hours, minutes):
+    return build_tzinfo(tzname, sign, int(hours), int(minutes or 0))
+
+
+def _fast_string_to_datetime(date):
+    """Returns a datetime for the common formats, or None for anything else
+    or anything that doesn't make a valid datetime"""
+    match = _DATETIME_RE.fullmatch(date)
+    if match is not None:
+        (year, month, day, hour, minute, second, fraction,
+         tzname, sign, tzhour, tzminute) = match.groups()
+        tzinfo = UTC
+        if tzname and tzname != 'Z':
+            tzinfo = _tzinfo(tzname, sign, tzhour, tzminute)
+        try:
+            return datetime.datetime(
+                int(year), int(month), int(day),
+                int(hour), int(minute), int(second),
+                int(fraction.ljust(6, '0')) if fraction else 0,
+                tzinfo=tzinfo
+            )
+        except ValueError:
+            return None
+
+    match = _DATE_RE.fullmatch(date)
+    if match is not None:
+        try:
+            return datetime.datetime(*map(int, match.groups()), tzinfo=UTC)
+        except ValueError:
+            return None
+    return None
+
+
+@functools.lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _parse_datetime_string(date):
+    parsed = _fast_string_to_datetime(date)
+    if parsed is not None:
+        return parsed
+
+    if len(date) <= len('2000-01-01'):
+        return (datetime.datetime
+                .strptime(date, '%Y-%m-%d')
+                .replace(tzinfo=UTC))
+    try:
+        parsed = isodate.parse_datetime(date)
+    except ValueError:
+        # e.g. '2012-01-10 12:13:14Z' becomes '2012-01-10T12:13:14Z'
+        parsed = isodate.parse_datetime(
+            _SPACE_BETWEEN_DIGITS_RE.sub(r'\1T\2', date)
+        )
+    if not parsed.tzinfo:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed
 
 
 def string_to_datetime(date):
@@ -162,6 +232,9 @@ def string_to_datetime(date):
     * 2012-01-10
     * ['2012-01-10', '12:13:14']
 
+    The formats above are parsed directly and anything else goes to isodate.
+    The last ``DATETIME_CACHE_SIZE`` strings parsed are remembered.
+
     """
     if date is None:
         return None
@@ -172,24 +245,28 @@ def string_to_datetime(date):
     if isinstance(date, list):
         date = 'T'.join(date)
     if isinstance(date, str):
-        if len(date) <= len('2000-01-01'):
-            return (datetime.datetime
-                    .strptime(date, '%Y-%m-%d')
-                    .replace(tzinfo=UTC))
-        else:
-            try:
-                parsed = isodate.parse_datetime(date)
-            except ValueError:
-                # e.g. '2012-01-10 12:13:14Z' becomes '2012-01-10T12:13:14Z'
-                parsed = isodate.parse_datetime(
-                    re.sub('(\d)\s(\d)', r'\1T\2', date)
-                )
-            if not parsed.tzinfo:
-                parsed = parsed.replace(tzinfo=UTC)
-            return parsed
+        return _parse_datetime_string(date)
     raise ValueError("date not a parsable string")
 
 
+def strings_to_datetimes(dates):
+    """Return a list with ``string_to_datetime`` of each of dates
+
+    Each distinct value is only parsed once.
+
+    """
+    parsed = {}
+    result = []
+    for date in dates:
+        if isinstance(date, str):
+            if date not in parsed:
+                parsed[date] = string_to_datetime(date)
+            result.append(parsed[date])
+        else:
+            result.append(string_to_datetime(date))
+    return result
+
+
 def utc_now():
     """Return a timezone aware datetime instance in UTC timezone
 
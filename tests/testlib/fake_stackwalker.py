@@ -0,0 +1,55 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""A stand-in for a long-lived stackwalker process to test against.
+
+It speaks the ``jansky.stackwalker`` protocol. What it does with a request
+depends on what the dump holds:
+
+* ``crash``: exits without answering
+* ``hang``: never answers
+* ``garbage``: answers with output that isn't JSON
+* anything else: answers with a json_dump naming the crash, its own pid and
+  the size of the dump
+
+"""
+
+import json
+import os
+import sys
+import time
+
+
+def main():
+    stdout = sys.stdout.buffer
+    for line in sys.stdin.buffer:
+        request = json.loads(line.decode('utf-8'))
+        with open(request['dump_path'], 'rb') as fp:
+            dump = fp.read()
+
+        if dump == b'crash':
+            os._exit(1)
+        if dump == b'hang':
+            time.sleep(60)
+
+        returncode = 0
+        if dump == b'garbage':
+            output = b'not json'
+            returncode = 1
+        else:
+            output = json.dumps({
+                'status': 'OK',
+                'crash_id': request['crash_id'],
+                'pid': os.getpid(),
+                'dump_size': len(dump),
+                'product': request['raw_crash'].get('ProductName'),
+            }).encode('utf-8')
+
+        header = json.dumps({'returncode': returncode, 'length': len(output)})
+        stdout.write(header.encode('utf-8') + b'\n' + output)
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+
+from jansky.crash import Crash, CrashBatch
+from jansky.jsondump import LazyJsonDump
+from jansky.rule import SaveMetadata
+from jansky.rules.breakpad_transform_rules import BreakpadStackwalkerRule
+from jansky.stackwalker import StackwalkerCache, StackwalkerPool, StackwalkerResult
+
+from tests.unittest.test_stackwalker import FAKE_STACKWALKER
+
+
+def build_crash(crash, dump):
+    crash.raw_crash['ProductName'] = 'Firefox'
+    crash.dumps['upload_file_minidump'] = dump
+    crash.processed_crash['metadata'] = {'processor_notes': []}
+    return crash
+
+
+class TestBreakpadStackwalkerRule:
+
+    def setup_method(self):
+        self.pool = StackwalkerPool(FAKE_STACKWALKER, timeout=10)
+
+    def teardown_method(self):
+        self.pool.close()
+
+    def test_everything_we_hoped_for(self):
+        crash = build_crash(Crash('crash1'), b'MDMP')
+        crash.transform(BreakpadStackwalkerRule(self.pool))
+        crash.close()
+
+        processed_crash = crash.processed_crash
+        assert processed_crash['json_dump']['crash_id'] == 'crash1'
+        assert processed_crash['json_dump']['product'] == 'Firefox'
+        assert processed_crash['mdsw_return_code'] == 0
+        assert processed_crash['mdsw_status_string'] == 'OK'
+        assert processed_crash['metadata']['processor_notes'] == []
+
+    def test_no_dump(self):
+        crash = Crash('crash1')
+        crash.processed_crash['metadata'] = {'processor_notes': []}
+        crash.transform(BreakpadStackwalkerRule(self.pool))
+        assert 'json_dump' not in crash.processed_crash
+
+    def test_requires_the_named_dump(self):
+        assert BreakpadStackwalkerRule(self.pool).requires == frozenset([
+            'dumps.upload_file_minidump'
+        ])
+        assert BreakpadStackwalkerRule(self.pool, dump_name='other').requires == frozenset([
+            'dumps.other'
+        ])
+
+    def test_stackwalker_failures_are_noted(self):
+        crash = build_crash(Crash('crash1'), b'crash')
+        crash.transform(BreakpadStackwalkerRule(self.pool))
+        crash.close()
+
+        processed_crash = crash.processed_crash
+        assert processed_crash['json_dump'] == {}
+        assert processed_crash['mdsw_return_code'] == -1
+        assert processed_crash['mdsw_status_string'] == 'unknown error'
+        assert processed_crash['metadata']['processor_notes'][0].startswith(
+            'MDSW failed'
+        )
+
+    def test_bad_output(self):
+        crash = build_crash(Crash('crash1'), b'garbage')
+        crash.transform(BreakpadStackwalkerRule(self.pool))
+        crash.close()
+
+        assert crash.processed_crash['json_dump'] == {}
+        assert crash.processed_crash['metadata']['processor_notes'] == [
+            'MDSW emitted no json output',
+            'MDSW terminated with return code 1',
+        ]
+
+    def test_batches_are_pipelined(self):
+        batch = CrashBatch(['crash1', 'crash2', 'crash3'])
+        for crash, dump in zip(batch, [b'MDMP', b'crash', b'MDMP']):
+            build_crash(crash, dump)
+        batch.transform(BreakpadStackwalkerRule(self.pool))
+
+        crash1, crash2, crash3 = [crash.processed_crash for crash in batch]
+        assert crash1['json_dump']['crash_id'] == 'crash1'
+        assert crash2['mdsw_return_code'] == -1
+        assert crash3['json_dump']['crash_id'] == 'crash3'
+        for crash in batch:
+            crash.close()
+
+    def test_cached_dumps_are_not_walked_again(self):
+        rule = BreakpadStackwalkerRule(self.pool, cache=StackwalkerCache())
+        first = build_crash(Crash('crash1'), b'MDMP')
+        first.transform(rule)
+        first.close()
+
+        # a byte-identical dump gets the first crash's output
+        second = build_crash(Crash('crash2'), b'MDMP')
+        second.transform(rule)
+        second.close()
+        assert second.processed_crash['json_dump']['crash_id'] == 'crash1'
+
+        # failures aren't cached
+        for crash_id in ('crash3', 'crash4'):
+            crash = build_crash(Crash(crash_id), b'crash')
+            crash.transform(rule)
+            crash.close()
+            assert crash.processed_crash['mdsw_return_code'] == -1
+
+    def test_big_output_is_capped(self):
+        pool = StackwalkerPool(FAKE_STACKWALKER, timeout=10, max_output_bytes=10)
+        try:
+            crash = build_crash(Crash('crash1'), b'MDMP')
+            crash.transform(BreakpadStackwalkerRule(pool))
+            crash.close()
+        finally:
+            pool.close()
+
+        processed_crash = crash.processed_crash
+        assert isinstance(processed_crash['json_dump'], dict)
+        assert processed_crash['json_dump']['crash_id'] == 'crash1'
+        assert processed_crash['mdsw_status_string'] == 'OK'
+
+    def test_output_in_memory_is_capped(self):
+        output = json.dumps({
+            'status': 'OK',
+            'threads': [{'frames': [{'frame': i} for i in range(20)]}] * 3,
+        }, sort_keys=True).encode('utf-8')
+        cache = StackwalkerCache()
+        cache.put(cache.key(b'MDMP'), StackwalkerResult(0, output))
+        rule = BreakpadStackwalkerRule(self.pool, cache=cache, max_threads=2, max_frames=5)
+
+        crash = build_crash(Crash('crash1'), b'MDMP')
+        crash.transform(rule)
+
+        # nothing past the crashing thread is decoded yet
+        json_dump = crash.processed_crash['json_dump']
+        assert isinstance(json_dump, LazyJsonDump)
+        assert crash.processed_crash['metadata']['processor_notes'] == []
+        assert json_dump['threads'][0]['frames'][-1] == {'frame': 4}
+        assert json_dump['threads']._end is None
+
+        crash.transform(SaveMetadata())
+        crash.close()
+        assert [len(thread['frames']) for thread in json_dump['threads']] == [5, 5]
+        assert crash.processed_crash['processor_notes'] == (
+            'json_dump truncated to 2 threads from 3; '
+            'json_dump truncated to 5 frames per thread in 2 places, up to 20'
+        )
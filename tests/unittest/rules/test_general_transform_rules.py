@@ -2,10 +2,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import pytest
+
 from jansky.rules.general_transform_rules import (
     CPUInfoRule,
+    FieldMapping,
+    FieldMappingRule,
     IdentifierRule,
-    OSInfoRule
+    IDENTIFIER_FIELD_MAPPINGS,
+    OSInfoRule,
+    REQUIRED
 )
 
 from tests.testlib import _
@@ -21,6 +27,68 @@ class TestIdentifierRule:
         assert processed_crash['uuid'] == raw_crash['uuid']
 
 
+class TestFieldMappingRule:
+
+    def test_mappings(self):
+        rule = FieldMappingRule([
+            ('A', 'a', ''),
+            FieldMapping('B', 'b'),
+            FieldMapping(None, 'c', 'constant'),
+            FieldMapping('D', 'd', REQUIRED),
+            FieldMapping('E', 'e', 'filled', fill_raw=True),
+        ])
+        assert rule.reads == frozenset([
+            'raw_crash.A', 'raw_crash.B', 'raw_crash.D', 'raw_crash.E'
+        ])
+        assert rule.writes == frozenset([
+            'processed_crash.a', 'processed_crash.b', 'processed_crash.c',
+            'processed_crash.d', 'processed_crash.e', 'raw_crash.E',
+        ])
+
+        raw_crash = {}
+        processed_crash = {}
+        rule(_, raw_crash, _, processed_crash)
+        assert raw_crash == {'E': 'filled'}
+        assert processed_crash == {'a': '', 'b': None, 'c': 'constant', 'e': 'filled'}
+
+        raw_crash = {'A': 1, 'B': 2, 'D': 4, 'E': 5}
+        processed_crash = {}
+        rule(_, raw_crash, _, processed_crash)
+        assert raw_crash == {'A': 1, 'B': 2, 'D': 4, 'E': 5}
+        assert processed_crash == {'a': 1, 'b': 2, 'c': 'constant', 'd': 4, 'e': 5}
+
+    def test_action_many(self):
+        rule = FieldMappingRule([('A', 'a', '')])
+        crashes = [(_, {'A': 1}, _, {}), (_, {}, _, {})]
+        rule.action_many(crashes)
+        assert [processed_crash for _, _, _, processed_crash in crashes] == [
+            {'a': 1}, {'a': ''}
+        ]
+
+    @pytest.mark.parametrize('mappings', [
+        [('A', 'a'), ('B', 'a')],
+        [(None, 'a', REQUIRED)],
+        [FieldMapping(None, 'a', fill_raw=True)],
+        [FieldMapping('A', 'a', REQUIRED, fill_raw=True)],
+        [FieldMapping('A', 'a', fill_raw=True), ('A', 'b')],
+    ])
+    def test_bad_tables(self, mappings):
+        with pytest.raises(ValueError):
+            FieldMappingRule(mappings)
+
+    def test_same_as_identifier_rule(self, raw_crash):
+        expected = {}
+        IdentifierRule()(_, raw_crash, _, expected)
+        processed_crash = {}
+        FieldMappingRule(IDENTIFIER_FIELD_MAPPINGS)(_, raw_crash, _, processed_crash)
+        assert processed_crash == expected
+
+        # where IdentifierRule would be skipped for the missing uuid
+        processed_crash = {}
+        FieldMappingRule(IDENTIFIER_FIELD_MAPPINGS)(_, {}, _, processed_crash)
+        assert processed_crash == {}
+
+
 class TestCPUInfoRule:
 
     def test_everything_we_hoped_for(self, processed_crash):
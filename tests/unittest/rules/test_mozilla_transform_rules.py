@@ -2,10 +2,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import copy
+import datetime
+import time
+
 import pytest
 
+from jansky.rules.general_transform_rules import FieldMappingRule
 from jansky.rules.mozilla_transform_rules import (
     AddonsRule,
+    COPY_FIELD_MAPPINGS,
     DatesAndTimesRule,
     EnvironmentRule,
     ESRVersionRewrite,
@@ -23,6 +29,7 @@ from jansky.rules.mozilla_transform_rules import (
     Winsock_LSPRule
 )
 from jansky.util import (
+    UTC,
     datetime_from_isodate_string
 )
 
@@ -284,6 +291,80 @@ class TestDatesAndTimesRule:
             ]
         )
 
+    @pytest.mark.parametrize('changes', [
+        {},
+        {'timestamp': 'hi there'},
+        {'timestamp': '1336519593'},
+        {'timestamp': float('nan')},
+        {'timestamp': True},
+        {'CrashTime': None},
+        {'CrashTime': '1336519593.454627'},
+        {'StartupTime': ' 1336499438 '},
+        {'StartupTime': 1336499438},
+        {'InstallTime': 'hi there'},
+        {'SecondsSinceLastCrash': 'feed the goats'},
+        {'SecondsSinceLastCrash': None},
+        {'SecondsSinceLastCrash': str(2 ** 64)},
+        {'submitted_timestamp': '2012-05-08 23:26:33'},
+        {'submitted_timestamp': datetime.datetime(2012, 5, 8, 23, 26, 33, tzinfo=UTC)},
+        {'submitted_timestamp': datetime.datetime(2012, 5, 8, 23, 26, 33)},
+        {'submitted_timestamp': datetime.date(2012, 5, 8)},
+    ])
+    def test_action_many_same_as_action(self, raw_crash, processed_crash, changes):
+        rule = DatesAndTimesRule()
+        raw_crash.update(changes)
+        for field in ('timestamp', 'CrashTime', 'StartupTime', 'SecondsSinceLastCrash'):
+            # and again without the field
+            missing = copy.deepcopy(raw_crash)
+            missing.pop(field, None)
+            # and next to a crash whose action raises
+            bad = copy.deepcopy(raw_crash)
+            bad['CrashTime'] = 'abc'
+
+            crashes = [
+                (_, copy.deepcopy(crash), _, copy.deepcopy(processed_crash))
+                for crash in (bad, raw_crash, missing)
+            ]
+            expected = copy.deepcopy(crashes)
+            expected_errors = []
+            for crash in expected:
+                try:
+                    rule.action(*crash)
+                    expected_errors.append(None)
+                except Exception as x:
+                    expected_errors.append(repr(x))
+            errors = rule.action_many(crashes)
+
+            assert crashes == expected
+            assert [error and repr(error) for error in errors] == expected_errors
+            assert expected_errors[0] is not None
+
+    @pytest.mark.parametrize('tz', ['UTC', 'America/New_York', 'Australia/Lord_Howe'])
+    def test_action_many_in_other_timezones(self, raw_crash, processed_crash, monkeypatch, tz):
+        # the submitted timestamp is read as local time, so this depends on
+        # the timezone
+        monkeypatch.setenv('TZ', tz)
+        time.tzset()
+        try:
+            rule = DatesAndTimesRule()
+            crashes = []
+            for submitted_timestamp in ('2012-03-11T02:30:00', '1969-12-31T23:59:59'):
+                crash = copy.deepcopy(raw_crash)
+                crash['submitted_timestamp'] = submitted_timestamp
+                del crash['timestamp']
+                del crash['CrashTime']
+                crashes.append((_, crash, _, copy.deepcopy(processed_crash)))
+
+            expected = copy.deepcopy(crashes)
+            for crash in expected:
+                rule.action(*crash)
+            rule.action_many(crashes)
+
+            assert crashes == expected
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
 
 class TestEnvironmentRule:
 
@@ -375,6 +456,22 @@ class TestFlashVersionRule:
 
         assert processed_crash['flash_version'] == '9.1.3.08'
 
+    def test_first_flash_module_wins(self):
+        processed_crash = {'json_dump': {'modules': [
+            {'filename': 'xul.dll'},
+            {'filename': 'libflashplayer1.2.so'},
+            {'filename': 'NPSWF32_3_4.dll'},
+        ]}}
+        FlashVersionRule()(_, _, _, processed_crash)
+
+        assert processed_crash['flash_version'] == '1.2'
+
+    def test_no_flash(self):
+        processed_crash = {'json_dump': {'modules': [{'filename': 'xul.dll'}]}}
+        FlashVersionRule()(_, _, _, processed_crash)
+
+        assert processed_crash['flash_version'] == '[blank]'
+
 
 class TestJavaProcessRule:
 
@@ -605,3 +702,42 @@ class TestWinsock_LSPRule:
 
         Winsock_LSPRule()(_, raw_crash, _, processed_crash)
         assert processed_crash['Winsock_LSP'] is None
+
+
+class TestCopyFieldMappings:
+
+    @pytest.mark.parametrize('extra', [
+        {},
+        {'JavaStackTrace': 'java.lang.NullPointerException'},
+    ])
+    def test_same_as_the_copy_rules(self, raw_crash, extra):
+        raw_crash.update(extra)
+        old_raw_crash = copy.deepcopy(raw_crash)
+        old_processed_crash = {}
+        for rule in (
+            ProductRule(), UserDataRule(), EnvironmentRule(),
+            JavaProcessRule(), Winsock_LSPRule()
+        ):
+            rule(_, old_raw_crash, _, old_processed_crash)
+
+        processed_crash = {}
+        FieldMappingRule(COPY_FIELD_MAPPINGS)(_, raw_crash, _, processed_crash)
+
+        assert raw_crash == old_raw_crash
+        assert processed_crash == old_processed_crash
+
+    def test_same_as_the_copy_rules_with_nothing_to_copy(self):
+        old_raw_crash = {}
+        old_processed_crash = {}
+        for rule in (
+            ProductRule(), UserDataRule(), EnvironmentRule(),
+            JavaProcessRule(), Winsock_LSPRule()
+        ):
+            rule(_, old_raw_crash, _, old_processed_crash)
+
+        raw_crash = {}
+        processed_crash = {}
+        FieldMappingRule(COPY_FIELD_MAPPINGS)(_, raw_crash, _, processed_crash)
+
+        assert raw_crash == old_raw_crash
+        assert processed_crash == old_processed_crash
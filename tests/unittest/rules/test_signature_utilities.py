@@ -0,0 +1,214 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+
+from jansky.jsondump import LazyJsonDump
+from jansky.rules.signature_utilities import (
+    CSignatureTool,
+    SignatureGenerationRule,
+    SigTrunc,
+    StackwalkerErrorSignatureRule
+)
+
+from tests.testlib import _
+
+
+def build_processed_crash(frames, crashing_thread=0, hang_type=0):
+    return {
+        'hang_type': hang_type,
+        'json_dump': {
+            'crash_info': {'crashing_thread': crashing_thread},
+            'threads': [{'frames': []}] * crashing_thread + [{'frames': frames}],
+        },
+        'metadata': {'processor_notes': []},
+    }
+
+
+class TestCSignatureTool:
+
+    def test_normalize_frame(self):
+        tool = CSignatureTool()
+        tests = [
+            ({'function': 'std::vector<int, std::allocator<int> >::push_back(int const &)'},
+                'std::vector<T>::push_back(int const&)'),
+            ({'function': 'foo(int,char *)'}, 'foo(int, char*)'),
+            ({'function': 'operator<<(a)'}, 'operator<<(a)'),
+            ({'function': 'nsCOMPtr<nsIFoo>::operator->() const'},
+                'nsCOMPtr<T>::operator->() const'),
+            ({'function': '<name omitted>'}, '<name omitted>'),
+            ({'function': 'js_Interpret', 'line': 42}, 'js_Interpret:42'),
+            ({'file': 'c:\\src\\foo.cpp', 'line': 12}, 'foo.cpp#12'),
+            ({'file': '/src/foo.cpp', 'line': 12}, 'foo.cpp#12'),
+            ({'module': 'xul.dll', 'module_offset': '0x1234'}, 'xul.dll@0x1234'),
+            ({'offset': '0x1234'}, '@0x1234'),
+            ({'normalized': 'already'}, 'already'),
+        ]
+        for frame, expected in tests:
+            assert tool.normalize_frame(frame) == expected
+
+    def test_generate(self):
+        tool = CSignatureTool()
+        tests = [
+            # prefixes pull in the next frame, irrelevant frames are skipped
+            (['@0x0', 'KiFastSystemCallRet', 'memcpy', 'foo', 'bar'], 0,
+                '@0x0 | memcpy | foo'),
+            (['foo', 'bar'], 0, 'foo'),
+            # sentinels skip the frames above them
+            (['foo', '_purecall', 'bar'], 0, '_purecall'),
+            (['foo', 'bar'], -1, 'hang | foo'),
+            (['foo', 'bar'], 1, 'chromehang | foo'),
+        ]
+        for frames, hang_type, expected in tests:
+            assert tool.generate(frames, hang_type, 0) == (expected, [])
+
+    def test_sentinel_conditions(self):
+        tool = CSignatureTool()
+        rpc = 'mozilla::ipc::RPCChannel::Call(IPC::Message*, IPC::Message*)'
+        paired = (
+            'CrashReporter::CreatePairedMinidumps(void*, unsigned long, '
+            'nsAString_internal*, nsILocalFile**, nsILocalFile**)'
+        )
+        # the frames above the RPC frame are skipped, and then the RPC frame
+        # itself as it's irrelevant
+        assert tool.generate(['foo', rpc, 'bar'])[0] == 'bar'
+        assert tool.generate(['foo', rpc, paired])[0] == 'foo'
+
+    def test_sentinels_in_list_order(self):
+        tool = CSignatureTool()
+        java = 'Java_org_mozilla_gecko_GeckoAppShell_reportJavaCrash'
+        # _purecall comes before the java sentinel in SIGNATURE_SENTINELS
+        assert tool.generate([java, 'foo', '_purecall'])[0] == '_purecall'
+        assert tool.generate(['foo', java, 'bar'])[0] == java
+
+    def test_empty_signatures(self):
+        tool = CSignatureTool()
+        signature, notes = tool.generate([], 0, None)
+        assert signature == 'EMPTY: no crashing thread identified'
+        assert len(notes) == 1
+
+        signature, notes = tool.generate(['@0xdeadbeef'], 0, 3)
+        assert signature == 'EMPTY: no frame data available'
+        assert '(3)' in notes[0]
+
+    def test_results_are_cached(self):
+        tool = CSignatureTool(signature_cache_size=2)
+        frames = [{'function': 'foo'}, {'function': 'bar'}]
+        for attempt in range(3):
+            signature_list = tool.normalize_frames(frames)
+            assert tool.generate(signature_list, 0, 0) == ('foo', [])
+        assert tool._normalize.cache_info().hits == 4
+        assert tool._generate.cache_info().hits == 2
+
+        # notes can be changed without changing the cached ones
+        tool.generate([], 0, None)[1].append('changed')
+        assert tool.generate([], 0, None)[1] == [
+            'CSignatureTool: No signature could be created because we do not '
+            'know which thread crashed'
+        ]
+
+    def test_only_the_top_frames_count(self):
+        tool = CSignatureTool()
+        frames = [{'function': 'malloc'}] * 50 + [{'function': 'foo'}]
+        signature_list = tool.normalize_frames(frames)
+        assert len(signature_list) == tool.max_frames
+        assert tool.generate(signature_list, 0, 0)[0] == ' | '.join(['malloc'] * 40)
+
+    def test_empty_lists_match_nothing(self):
+        tool = CSignatureTool(irrelevant=(), prefixes=(), with_line_numbers=())
+        assert tool.generate(['@0xdeadbeef', 'foo'], 0, 0)[0] == '@0xdeadbeef'
+        assert tool.normalize_frame({'function': 'foo', 'line': 1}) == 'foo'
+
+
+class TestSignatureGenerationRule:
+
+    def test_everything_we_hoped_for(self):
+        processed_crash = build_processed_crash([
+            {'function': 'memcpy'},
+            {'function': 'nsFoo::Bar(int,int)'},
+            {'module': 'xul.dll', 'module_offset': '0x10'},
+        ], crashing_thread=1)
+        SignatureGenerationRule()(_, _, _, processed_crash)
+
+        assert processed_crash['signature'] == 'memcpy | nsFoo::Bar(int, int)'
+        assert processed_crash['proto_signature'] == (
+            'memcpy | nsFoo::Bar(int, int) | xul.dll@0x10'
+        )
+        assert processed_crash['metadata']['processor_notes'] == []
+
+    def test_lazy_json_dump(self):
+        processed_crash = build_processed_crash([{'function': 'foo'}])
+        processed_crash['json_dump'] = LazyJsonDump(
+            json.dumps(processed_crash['json_dump'], sort_keys=True)
+        )
+        SignatureGenerationRule()(_, _, _, processed_crash)
+
+        assert processed_crash['signature'] == 'foo'
+
+    def test_no_crashing_thread(self):
+        processed_crash = build_processed_crash([])
+        processed_crash['json_dump'] = {}
+        SignatureGenerationRule()(_, _, _, processed_crash)
+
+        assert processed_crash['signature'] == 'EMPTY: no crashing thread identified'
+        assert processed_crash['proto_signature'] == ''
+
+    def test_missing_thread(self):
+        processed_crash = build_processed_crash([])
+        processed_crash['json_dump']['crash_info']['crashing_thread'] = 5
+        SignatureGenerationRule()(_, _, _, processed_crash)
+
+        assert processed_crash['signature'] == 'EMPTY: no frame data available'
+        notes = processed_crash['metadata']['processor_notes']
+        assert notes[0].startswith('No crashing frames found because of')
+
+    def test_no_json_dump(self):
+        processed_crash = {'signature': 'EMPTY: crash failed to process'}
+        SignatureGenerationRule()(_, _, _, processed_crash)
+
+        assert processed_crash == {'signature': 'EMPTY: crash failed to process'}
+
+
+class TestStackwalkerErrorSignatureRule:
+
+    def test_everything_we_hoped_for(self):
+        processed_crash = {
+            'signature': 'EMPTY: no frame data available',
+            'mdsw_status_string': 'ERROR_NO_MINIDUMP_HEADER',
+        }
+        StackwalkerErrorSignatureRule()(_, _, _, processed_crash)
+
+        assert processed_crash['signature'] == (
+            'EMPTY: no frame data available; ERROR_NO_MINIDUMP_HEADER'
+        )
+
+    def test_ok_status(self):
+        processed_crash = {
+            'signature': 'EMPTY: no frame data available',
+            'mdsw_status_string': 'OK',
+        }
+        StackwalkerErrorSignatureRule()(_, _, _, processed_crash)
+
+        assert processed_crash['signature'] == 'EMPTY: no frame data available'
+
+
+class TestSigTrunc:
+
+    def test_long_signatures_are_truncated(self):
+        processed_crash = {
+            'signature': 'x' * 300,
+            'metadata': {'processor_notes': []},
+        }
+        SigTrunc()(_, _, _, processed_crash)
+
+        assert processed_crash['signature'] == 'x' * 252 + '...'
+        assert processed_crash['metadata']['processor_notes'] == [
+            'SigTrunc: signature truncated due to length'
+        ]
+
+    def test_short_signatures(self):
+        processed_crash = {'signature': 'x' * 255}
+        SigTrunc()(_, _, _, processed_crash)
+
+        assert processed_crash['signature'] == 'x' * 255
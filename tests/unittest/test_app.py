@@ -0,0 +1,479 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import asyncio
+import copy
+import os
+import time
+from unittest import mock
+
+from everett.manager import ConfigManager
+import pytest
+
+from jansky.app import (
+    AsyncProcessor,
+    Prefetcher,
+    Processor,
+    SingleItemBatchAdapter,
+    WorkItem,
+    Worklist
+)
+from jansky.crash import Crash
+
+
+class FakeContext:
+    def __init__(self, acked):
+        self.acked = acked
+
+    def ack(self):
+        self.acked.append(self)
+
+
+class FakeGenerator:
+    '''Utility work generator that hands out a fixed list of crash ids, not
+    a testing class
+    '''
+
+    def __init__(self, crash_ids):
+        self.crash_ids = list(crash_ids)
+        self.acked = []
+        self.contexts = {}
+
+    def get_next(self):
+        if not self.crash_ids:
+            return None
+        crash_id = self.crash_ids.pop(0)
+        context = FakeContext(self.acked)
+        self.contexts[crash_id] = context
+        return WorkItem(context, crash_id)
+
+    def acked_crash_ids(self):
+        return sorted(
+            crash_id for crash_id, context in self.contexts.items()
+            if context in self.acked
+        )
+
+
+class PidProcessor(Processor):
+    '''Processor that records which process handled a crash instead of
+    running the pipeline, not a testing class
+    '''
+
+    def run_one(self, crash_id):
+        if crash_id == 'bad':
+            raise ValueError('bad crash')
+        if crash_id == 'die':
+            # like the OOM killer would
+            os._exit(1)
+        return os.getpid() != self.parent_pid
+
+
+class BatchGenerator:
+    '''Utility work generator with the batch protocol that records its calls,
+    not a testing class
+    '''
+
+    def __init__(self, crash_ids):
+        self.crash_ids = list(crash_ids)
+        self.batch_sizes = []
+        self.acked = []
+        self.nacked = []
+
+    def get_next_batch(self, size):
+        self.batch_sizes.append(size)
+        batch, self.crash_ids = self.crash_ids[:size], self.crash_ids[size:]
+        return [WorkItem(None, crash_id) for crash_id in batch]
+
+    def ack_batch(self, workitems):
+        self.acked.append([workitem.crash_id for workitem in workitems])
+
+    def nack_batch(self, workitems):
+        self.nacked.append([workitem.crash_id for workitem in workitems])
+
+
+def build_processor(crash_ids, cls=Processor, **config):
+    config = dict((key.upper(), str(val)) for key, val in config.items())
+    processor = cls(ConfigManager.from_dict(config))
+    processor.generator = FakeGenerator(crash_ids)
+    processor.worklist = Worklist(processor.generator, sleep_when_exhausted=0)
+    return processor
+
+
+class StopWorklist(BaseException):
+    """Raised by test doubles to break out of a worklist that would go on
+    forever; not an Exception so the worklist doesn't swallow it
+    """
+
+
+class ScriptedGenerator:
+    '''Utility work generator that returns a scripted sequence of crash ids
+    and Nones, not a testing class
+    '''
+
+    def __init__(self, script):
+        self.script = list(script)
+
+    def get_next(self):
+        if not self.script:
+            raise StopWorklist()
+        crash_id = self.script.pop(0)
+        if crash_id is None:
+            return None
+        return WorkItem(FakeContext([]), crash_id)
+
+
+class BlockingGenerator(FakeGenerator):
+
+    def __init__(self, crash_ids):
+        super().__init__([])
+        self.blocking_crash_ids = list(crash_ids)
+        self.timeouts = []
+
+    def get_next_blocking(self, timeout):
+        self.timeouts.append(timeout)
+        if not self.blocking_crash_ids:
+            raise StopWorklist()
+        return WorkItem(FakeContext(self.acked), self.blocking_crash_ids.pop(0))
+
+
+def run_worklist(worklist, limit):
+    """Collects crash ids and sleeps from a worklist, stopping after
+    ``limit`` sleeps or when a generator raises StopWorklist
+    """
+    crash_ids = []
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(round(seconds, 4))
+        if len(sleeps) >= limit:
+            raise StopWorklist()
+
+    with mock.patch('jansky.app.time.sleep', fake_sleep):
+        try:
+            for workitem in worklist:
+                crash_ids.append(workitem.crash_id)
+        except StopWorklist:
+            pass
+    return crash_ids, sleeps
+
+
+class TestWorklist:
+
+    def test_backoff_doubles_up_to_cap(self, randommock):
+        worklist = Worklist(
+            ScriptedGenerator([None] * 10),
+            sleep_when_exhausted=1,
+            min_sleep=0.1
+        )
+        with randommock(0.0):
+            crash_ids, sleeps = run_worklist(worklist, limit=6)
+        assert sleeps == [0.1, 0.2, 0.4, 0.8, 1, 1]
+
+    def test_backoff_resets_on_work(self, randommock):
+        worklist = Worklist(
+            ScriptedGenerator([None, None, None, 'a', None, None]),
+            sleep_when_exhausted=1,
+            min_sleep=0.1
+        )
+        with randommock(0.0):
+            crash_ids, sleeps = run_worklist(worklist, limit=5)
+        assert crash_ids == ['a']
+        assert sleeps == [0.1, 0.2, 0.4, 0.1, 0.2]
+
+    def test_jitter_shortens_sleeps(self, randommock):
+        worklist = Worklist(
+            ScriptedGenerator([None]),
+            sleep_when_exhausted=1,
+            min_sleep=0.1,
+            jitter=0.5
+        )
+        with randommock(1.0):
+            crash_ids, sleeps = run_worklist(worklist, limit=1)
+        assert sleeps == [0.05]
+
+    def test_blocking_generators_wait_instead_of_sleeping(self):
+        generator = BlockingGenerator(['a', 'b'])
+        worklist = Worklist(generator, sleep_when_exhausted=5)
+        crash_ids, sleeps = run_worklist(worklist, limit=1)
+        assert crash_ids == ['a', 'b']
+        assert sleeps == []
+        assert generator.timeouts == [5, 5, 5]
+
+    def test_errors_count_as_empty(self):
+        class BrokenGenerator:
+            def get_next(self):
+                raise ValueError('broker is down')
+
+        worklist = Worklist(BrokenGenerator(), sleep_when_exhausted=0)
+        assert list(worklist) == []
+
+    def test_on_idle_called_when_exhausted(self):
+        calls = []
+        worklist = Worklist(
+            FakeGenerator(['a']),
+            sleep_when_exhausted=0,
+            on_idle=lambda: calls.append(1)
+        )
+        assert [x.crash_id for x in worklist] == ['a']
+        assert calls == [1]
+
+
+class TestBatchProtocol:
+
+    def test_adapter_fills_batches_from_get_next(self):
+        adapter = SingleItemBatchAdapter(FakeGenerator(['a', 'b', 'c']))
+        assert [x.crash_id for x in adapter.get_next_batch(2)] == ['a', 'b']
+        assert [x.crash_id for x in adapter.get_next_batch(2)] == ['c']
+        assert adapter.get_next_batch(2) == []
+
+    def test_adapter_acks_each_context(self):
+        generator = FakeGenerator(['a', 'b'])
+        adapter = SingleItemBatchAdapter(generator)
+        adapter.ack_batch(adapter.get_next_batch(2))
+        assert generator.acked_crash_ids() == ['a', 'b']
+
+    def test_adapter_keeps_items_fetched_before_an_error(self):
+        class FlakyGenerator(FakeGenerator):
+            def get_next(self):
+                if not self.crash_ids:
+                    raise ValueError('broker is down')
+                return super().get_next()
+
+        adapter = SingleItemBatchAdapter(FlakyGenerator(['a']))
+        assert [x.crash_id for x in adapter.get_next_batch(5)] == ['a']
+        with pytest.raises(ValueError):
+            adapter.get_next_batch(5)
+
+    def test_worklist_pulls_batches(self):
+        generator = BatchGenerator(['a', 'b', 'c', 'd', 'e'])
+        worklist = Worklist(generator, sleep_when_exhausted=0, batch_size=2)
+        assert [x.crash_id for x in worklist] == ['a', 'b', 'c', 'd', 'e']
+        assert generator.batch_sizes == [2, 2, 2, 2]
+
+    def test_unhanded_items_are_nacked(self):
+        generator = BatchGenerator(['a', 'b', 'c'])
+        worklist = Worklist(generator, sleep_when_exhausted=0, batch_size=3)
+        for workitem in worklist:
+            break
+        assert generator.nacked == [['b', 'c']]
+
+    def test_processor_acks_in_batches(self):
+        class NoopProcessor(Processor):
+            def run_one(self, crash_id):
+                return crash_id != 'bad'
+
+        crash_ids = ['a', 'b', 'bad', 'c', 'd', 'e']
+        processor = build_processor([], NoopProcessor, ack_batch_size=2)
+        processor.generator = BatchGenerator(crash_ids)
+        processor.worklist = Worklist(
+            processor.generator, sleep_when_exhausted=0, batch_size=4
+        )
+        processor.run()
+
+        assert processor.generator.acked == [['a', 'b'], ['c', 'd'], ['e']]
+        assert processor.generator.nacked == []
+
+
+class TestProcessorPool:
+
+    def test_workers_process_and_parent_acks(self):
+        crash_ids = ['a', 'b', 'c', 'd', 'e']
+        processor = build_processor(crash_ids, PidProcessor, worker_count=2)
+        processor.parent_pid = os.getpid()
+
+        processor.run()
+
+        # every crash ran in a forked worker and was acked here
+        assert processor.generator.acked_crash_ids() == crash_ids
+
+    def test_errors_are_not_acked(self):
+        processor = build_processor(['a', 'bad', 'b'], PidProcessor, worker_count=2)
+        processor.parent_pid = os.getpid()
+
+        processor.run()
+
+        assert processor.generator.acked_crash_ids() == ['a', 'b']
+
+    def test_dead_workers_are_replaced(self):
+        crash_ids = ['c%s' % i for i in range(10)]
+        processor = build_processor([], PidProcessor, worker_count=2)
+        processor.parent_pid = os.getpid()
+        processor.generator = BatchGenerator(['a', 'die'] + crash_ids)
+        processor.worklist = Worklist(processor.generator, sleep_when_exhausted=0)
+
+        processor.run()
+
+        # the dead worker's crash and the others in flight with it are
+        # nacked, the ones after run in new workers
+        acked = sum(processor.generator.acked, [])
+        nacked = sum(processor.generator.nacked, [])
+        assert 'die' in nacked
+        assert sorted(acked + nacked) == sorted(['a', 'die'] + crash_ids)
+        assert crash_ids[-5:] == acked[-5:]
+
+
+class FakeAsyncStorage:
+    '''In-process async crash storage that tracks how many crashes are being
+    fetched or saved at once, not a testing class
+    '''
+
+    def __init__(self, raw_crashes, json_dump):
+        self.raw_crashes = raw_crashes
+        self.json_dump = json_dump
+        self.saved = {}
+        self.active = 0
+        self.max_active = 0
+
+    async def _io(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+
+    async def fetch(self, crash_id, raw_crash, dumps, processed_crash):
+        await self._io()
+        raw_crash.update(copy.deepcopy(self.raw_crashes[crash_id]))
+        processed_crash['json_dump'] = copy.deepcopy(self.json_dump)
+
+    async def save(self, crash_id, raw_crash, dumps, processed_crash):
+        await self._io()
+        self.saved[crash_id] = processed_crash
+
+
+class TestAsyncProcessor:
+
+    def build(self, storage, crash_ids, **config):
+        config = dict((key.upper(), str(val)) for key, val in config.items())
+        processor = AsyncProcessor(
+            ConfigManager.from_dict(config),
+            fetcher=storage.fetch,
+            saver=storage.save
+        )
+        processor.generator = FakeGenerator(crash_ids)
+        processor.worklist = Worklist(processor.generator, sleep_when_exhausted=0)
+        return processor
+
+    def test_crashes_overlap(self, raw_crash, processed_crash):
+        crash_ids = ['crash%d' % i for i in range(10)]
+        raw_crashes = {}
+        for crash_id in crash_ids:
+            raw_crashes[crash_id] = dict(raw_crash, uuid=crash_id)
+        storage = FakeAsyncStorage(raw_crashes, processed_crash['json_dump'])
+
+        processor = self.build(storage, crash_ids, max_in_flight=4)
+        processor.run()
+
+        assert sorted(storage.saved) == crash_ids
+        assert processor.generator.acked_crash_ids() == crash_ids
+        assert 1 < storage.max_active <= 4
+        for crash_id, processed_crash in storage.saved.items():
+            assert processed_crash['uuid'] == crash_id
+            assert processed_crash['success']
+
+    def test_failed_crashes_are_not_acked(self, raw_crash, processed_crash):
+        storage = FakeAsyncStorage(
+            {'good': dict(raw_crash, uuid='good')},
+            processed_crash['json_dump']
+        )
+
+        processor = self.build(storage, ['good', 'missing'])
+        processor.run()
+
+        assert processor.generator.acked_crash_ids() == ['good']
+
+
+class TestPrefetcher:
+
+    def fetch(self, crash_id):
+        self.fetched.append(crash_id)
+        crash = Crash(crash_id)
+        crash.dumps['upload_file_minidump'] = b'x' * 1000
+        return crash
+
+    def test_order_is_kept(self):
+        self.fetched = []
+        crash_ids = ['crash%d' % i for i in range(20)]
+        worklist = Worklist(FakeGenerator(crash_ids), sleep_when_exhausted=0)
+
+        results = [
+            (workitem.crash_id, future.result().crash_id)
+            for workitem, future in Prefetcher(worklist, self.fetch, max_items=4)
+        ]
+        assert results == [(crash_id, crash_id) for crash_id in crash_ids]
+
+    def test_read_ahead_is_bounded(self):
+        self.fetched = []
+        crash_ids = ['crash%d' % i for i in range(10)]
+        worklist = Worklist(FakeGenerator(crash_ids), sleep_when_exhausted=0)
+        prefetcher = Prefetcher(worklist, self.fetch, max_items=4, max_bytes=1500)
+
+        for consumed, (workitem, future) in enumerate(prefetcher, 1):
+            # give the producer a chance to run ahead as far as it may
+            time.sleep(0.01)
+            # two crashes of 1000 bytes go over the cap, so at most two
+            # crashes are fetched or being fetched beyond the consumed ones
+            assert len(self.fetched) <= consumed + 2
+        assert self.fetched == crash_ids
+
+    def test_fetch_errors_surface_on_result(self):
+        def fetch(crash_id):
+            raise ValueError(crash_id)
+
+        worklist = Worklist(FakeGenerator(['a']), sleep_when_exhausted=0)
+        for workitem, future in Prefetcher(worklist, fetch):
+            with pytest.raises(ValueError):
+                future.result()
+
+    def test_stopping_early_gives_back_what_was_read_ahead(self):
+        closed = []
+
+        class ClosingCrash(Crash):
+            def close(self):
+                closed.append(self.crash_id)
+
+        def fetch(crash_id):
+            return ClosingCrash(crash_id)
+
+        crash_ids = ['crash%d' % i for i in range(6)]
+        generator = BatchGenerator(crash_ids)
+        worklist = Worklist(generator, sleep_when_exhausted=0, batch_size=6)
+        prefetcher = Prefetcher(worklist, fetch, max_items=2)
+
+        with pytest.raises(ValueError):
+            for workitem, future in prefetcher:
+                # let the producer fill up the read-ahead
+                time.sleep(0.05)
+                raise ValueError(workitem.crash_id)
+
+        # wait for the producer to notice
+        with prefetcher._condition:
+            while not prefetcher._exhausted:
+                prefetcher._condition.wait()
+
+        # everything but the crash being processed went back to the source,
+        # and the crashes fetched for it were closed
+        nacked = sum(generator.nacked, [])
+        assert sorted(nacked) == crash_ids[1:]
+        assert set(closed) <= set(nacked)
+        assert closed
+
+
+class TestProcessorPrefetch:
+
+    def test_prefetching_run(self):
+        fetched = []
+
+        class FakeFetchProcessor(Processor):
+            def fetch(self, crash_id):
+                fetched.append(crash_id)
+                return Crash(crash_id)
+
+            def process(self, crash):
+                return crash.crash_id != 'b'
+
+        processor = build_processor(['a', 'b', 'c'], FakeFetchProcessor, prefetch_count=2)
+        processor.run()
+
+        assert fetched == ['a', 'b', 'c']
+        assert processor.generator.acked_crash_ids() == ['a', 'c']
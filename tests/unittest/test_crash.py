@@ -5,7 +5,8 @@
 
 import pytest
 
-from jansky.crash import Crash
+from jansky.crash import Crash, CrashBatch
+from jansky.pipeline import Pipeline
 from jansky.rule import Introspector, Rule
 
 from tests.unittest.test_rule import BadTransformRule
@@ -50,3 +51,88 @@ class Renamer(Rule):
 
     def __call__(self, crash_id, raw_crash, dumps, processed_crash):
         crash_id = self.new_name
+
+
+class BatchedRule(Rule):
+    '''Utility subclass that implements action_many and records how it was
+    called, not a testing class
+    '''
+
+    def __init__(self):
+        self.calls = []
+
+    def predicate(self, crash_id, raw_crash, dumps, processed_crash):
+        return crash_id != 'skipped'
+
+    def action(self, crash_id, raw_crash, dumps, processed_crash):
+        self.calls.append(crash_id)
+        processed_crash['seen'] = True
+
+    def action_many(self, crashes):
+        self.calls.append([crash[0] for crash in crashes])
+        for crash in crashes:
+            crash[3]['seen'] = True
+
+
+class BadBatchedRule(Rule):
+
+    def action_many(self, crashes):
+        1 / 0
+
+
+class OneBadBatchedRule(Rule):
+
+    def action_many(self, crashes):
+        return [ZeroDivisionError() if crash[0] == 'bad' else None for crash in crashes]
+
+
+class TestCrashBatch:
+
+    def test_action_many_gets_whole_batch(self):
+        rule = BatchedRule()
+        batch = CrashBatch(['a', 'skipped', 'b'])
+        batch.transform(rule)
+        assert rule.calls == [['a', 'b']]
+        assert [c.processed_crash for c in batch] == [
+            {'seen': True}, {}, {'seen': True}
+        ]
+
+    def test_fallback_to_per_crash_calls(self):
+        order = []
+
+        def rule(crash_id, raw_crash, dumps, processed_crash):
+            order.append(crash_id)
+
+        CrashBatch(['a', 'b']).pipeline(rule, rule)
+        assert order == ['a', 'b', 'a', 'b']
+
+    def test_rule_by_rule(self):
+        order = []
+
+        class Tracer(Rule):
+            def __init__(self, name):
+                self.name = name
+
+            def action(self, crash_id, raw_crash, dumps, processed_crash):
+                order.append((self.name, crash_id))
+
+        Pipeline(Tracer(1), Tracer(2)).apply(CrashBatch(['a', 'b']))
+        assert order == [(1, 'a'), (1, 'b'), (2, 'a'), (2, 'b')]
+
+    def test_action_many_error_suppressed(self):
+        batch = CrashBatch(['a', 'b'])
+        batch.transform(BadBatchedRule(), supress_errors=True)
+        for crash in batch:
+            assert isinstance(crash._errors[0], ZeroDivisionError)
+
+    def test_action_many_error_unsuppressed(self):
+        with pytest.raises(ZeroDivisionError):
+            CrashBatch(['a', 'b']).transform(BadBatchedRule())
+
+    def test_action_many_errors_per_crash(self):
+        batch = CrashBatch(['a', 'bad', 'b'])
+        batch.transform(OneBadBatchedRule(), supress_errors=True)
+        assert [len(crash._errors) for crash in batch] == [0, 1, 0]
+
+        with pytest.raises(ZeroDivisionError):
+            CrashBatch(['a', 'bad']).transform(OneBadBatchedRule())
@@ -0,0 +1,108 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import datetime
+
+import pytest
+
+from jansky import crashid
+from jansky.util import UTC, create_crash_id
+
+
+CRASH_ID = 'de1bb258-cbbf-4589-a673-34f800160918'
+
+
+class TestPacking:
+
+    def test_roundtrip(self):
+        packed = crashid.pack(CRASH_ID)
+        assert isinstance(packed, bytes)
+        assert len(packed) == crashid.PACKED_SIZE
+        assert crashid.unpack(packed) == CRASH_ID
+
+    def test_uppercase_unpacks_lowercase(self):
+        assert crashid.unpack(crashid.pack(CRASH_ID.upper())) == CRASH_ID
+
+    @pytest.mark.parametrize('bad', [
+        '',
+        CRASH_ID[:-1],
+        CRASH_ID.replace('-', ''),
+        CRASH_ID.replace('-', '_'),
+        'xe1bb258-cbbf-4589-a673-34f800160918',
+        'de1bb258-cbbf-4589-a673-34f8  160918',
+        'de1bb258-cbbf-4589-a673-34f80016091\n',
+    ])
+    def test_bad_crash_ids(self, bad):
+        assert not crashid.is_crash_id(bad)
+        with pytest.raises(ValueError):
+            crashid.pack(bad)
+
+    def test_is_crash_id(self):
+        assert crashid.is_crash_id(CRASH_ID)
+        assert crashid.is_crash_id(CRASH_ID.upper())
+        assert not crashid.is_crash_id(None)
+        assert not crashid.is_crash_id(crashid.pack(CRASH_ID))
+
+    def test_bad_packed(self):
+        with pytest.raises(ValueError):
+            crashid.unpack(b'\x00' * 15)
+
+    def test_packed_sort_like_strings(self):
+        crash_ids = sorted(create_crash_id() for i in range(50))
+        packed = sorted(crashid.pack(crash_id) for crash_id in crash_ids)
+        assert [crashid.unpack(item) for item in packed] == crash_ids
+
+    def test_many(self):
+        crash_ids = [create_crash_id() for i in range(5)]
+        blob = crashid.pack_many(crash_ids)
+        assert len(blob) == 5 * crashid.PACKED_SIZE
+        assert crashid.unpack_many(blob) == crash_ids
+        assert crashid.unpack_many(b'') == []
+
+        with pytest.raises(ValueError):
+            crashid.unpack_many(blob[:-1])
+        with pytest.raises(ValueError):
+            crashid.pack_many([crash_ids[0], 'de1bb258-cbbf-4589-a673-34f8  160918'])
+
+
+class TestDecoding:
+
+    def test_date_and_throttle(self):
+        expected = datetime.datetime(2016, 9, 18, tzinfo=UTC)
+        for crash_id in (CRASH_ID, crashid.pack(CRASH_ID)):
+            assert crashid.get_date(crash_id) == expected
+            assert crashid.get_throttle(crash_id) == 0
+
+        crash_id = create_crash_id(datetime.date(2009, 12, 31), throttle_result=1)
+        packed = crashid.pack(crash_id)
+        assert crashid.get_date(packed) == datetime.datetime(2009, 12, 31, tzinfo=UTC)
+        assert crashid.get_throttle(packed) == 1
+        assert crashid.get_date(packed, century='19').year == 1909
+
+    def test_dates_are_shared(self):
+        other = 'aaaaaaaa-bbbb-cccc-dddd-eeeeee160918'
+        assert crashid.get_date(CRASH_ID) is crashid.get_date(other)
+
+    def test_bad_dates(self):
+        with pytest.raises(ValueError):
+            crashid.get_date('de1bb258-cbbf-4589-a673-34f800161318')
+        with pytest.raises(ValueError):
+            crashid.get_throttle(crashid.pack('de1bb258-cbbf-4589-a673-34f80a160918'))
+
+    def test_batches(self):
+        crash_ids = [
+            create_crash_id(datetime.date(2017, 1, day % 3 + 1), throttle_result=day % 2)
+            for day in range(10)
+        ]
+        expected = [
+            (datetime.datetime(2017, 1, day % 3 + 1, tzinfo=UTC), day % 2)
+            for day in range(10)
+        ]
+        packed = [crashid.pack(crash_id) for crash_id in crash_ids]
+        blob = crashid.pack_many(crash_ids)
+
+        for ids in (crash_ids, packed, blob):
+            assert crashid.get_dates_and_throttles(ids) == expected
+        assert crashid.get_dates(crash_ids) == [date for date, _ in expected]
+        assert crashid.get_throttles(packed) == [throttle for _, throttle in expected]
@@ -0,0 +1,163 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import datetime
+import os
+
+from everett.manager import ConfigManager
+import pytest
+
+from jansky.app import Processor
+from jansky.crash import Crash
+from jansky.crashstorage import CrashIDNotFound, DumpsMapping, FSCrashStorage
+from jansky.util import UTC
+
+
+CRASH_ID = 'de1bb258-cbbf-4589-a673-34f800160918'
+
+
+def build_storage(tmpdir):
+    return FSCrashStorage(ConfigManager.from_dict({'FS_ROOT': str(tmpdir)}))
+
+
+class TestDumpsMapping:
+
+    def test_file_dumps_are_mapped(self, tmpdir):
+        path = tmpdir.join('dump')
+        path.write_binary(b'MDMP' + b'\x00' * 100)
+        dumps = DumpsMapping()
+        dumps.set_path('upload_file_minidump', str(path))
+
+        view = dumps['upload_file_minidump']
+        assert isinstance(view, memoryview)
+        assert view[:4] == b'MDMP'
+        assert dumps.path('upload_file_minidump') == str(path)
+        assert dumps.memory_nbytes() == 0
+
+        dumps.close()
+        assert len(dumps) == 0
+        # the file belongs to whoever put it there
+        assert path.check()
+
+    def test_empty_files(self, tmpdir):
+        path = tmpdir.join('dump')
+        path.write_binary(b'')
+        dumps = DumpsMapping()
+        dumps.set_path('upload_file_minidump', str(path))
+        assert dumps['upload_file_minidump'] == b''
+
+    def test_bytes_spill_to_temporary_files(self):
+        dumps = DumpsMapping()
+        dumps['upload_file_minidump'] = b'MDMP'
+        assert dumps.memory_nbytes() == 4
+
+        path = dumps.path('upload_file_minidump')
+        with open(path, 'rb') as fp:
+            assert fp.read() == b'MDMP'
+        assert dumps.memory_nbytes() == 0
+        assert dumps['upload_file_minidump'] == b'MDMP'
+
+        dumps.close()
+        assert not os.path.exists(path)
+
+    def test_replacing_a_dump_deletes_its_temporary_file(self):
+        dumps = DumpsMapping()
+        dumps['a'] = b'a'
+        path = dumps.path('a')
+        dumps['a'] = b'b'
+        assert not os.path.exists(path)
+        assert dict(dumps) == {'a': b'b'}
+
+
+class TestFSCrashStorage:
+
+    def test_raw_crash_round_trip(self, tmpdir):
+        storage = build_storage(tmpdir)
+        dumps = {'upload_file_minidump': b'\x00MDMP', 'flash1': b'flash'}
+        storage.save_raw_crash(CRASH_ID, {'ProductName': 'Firefox'}, dumps)
+
+        assert storage.get_raw_crash(CRASH_ID) == {'ProductName': 'Firefox'}
+        assert storage.get_dumps(CRASH_ID) == dumps
+
+        crash = Crash(CRASH_ID).fetch(storage=storage)
+        assert crash.dumps['flash1'] == b'flash'
+        crash.close()
+
+    def test_partitioned_by_crash_date(self, tmpdir):
+        storage = build_storage(tmpdir)
+        storage.save_raw_crash(CRASH_ID, {}, {'upload_file_minidump': b''})
+
+        day = tmpdir.join('20160918')
+        assert day.join('raw_crash', CRASH_ID + '.json').check()
+        assert day.join('dump', 'upload_file_minidump', CRASH_ID).check()
+        # nothing is left behind from the atomic writes
+        assert not [
+            name for _, _, names in os.walk(str(tmpdir))
+            for name in names if name.endswith('.tmp')
+        ]
+
+    def test_missing_crash(self, tmpdir):
+        storage = build_storage(tmpdir)
+        with pytest.raises(CrashIDNotFound):
+            storage.get_raw_crash(CRASH_ID)
+        with pytest.raises(CrashIDNotFound):
+            storage.get_processed(CRASH_ID)
+
+    @pytest.mark.parametrize('crash_id', [
+        '../../../escaped/x-160918',
+        CRASH_ID[:-6] + '/../..',
+        CRASH_ID + '\n',
+    ])
+    def test_bad_crash_ids(self, tmpdir, crash_id):
+        storage = build_storage(tmpdir.join('root'))
+        with pytest.raises(ValueError):
+            storage.save_raw_and_processed(crash_id, {}, {}, {})
+        with pytest.raises(ValueError):
+            storage.get_raw_crash(crash_id)
+        assert tmpdir.listdir() == []
+
+    def test_bad_dump_names(self, tmpdir):
+        storage = build_storage(tmpdir)
+        for name in ('../../escaped', '..', ''):
+            with pytest.raises(ValueError):
+                storage.save_raw_crash(CRASH_ID, {}, {name: b'MDMP'})
+        assert not tmpdir.join('escaped').check()
+
+    def test_processed_crash_datetimes(self, tmpdir):
+        storage = build_storage(tmpdir)
+        started = datetime.datetime(2016, 9, 18, 12, 0, 0, tzinfo=UTC)
+        storage.save_raw_and_processed(
+            CRASH_ID, {}, {}, {'started_datetime': started}
+        )
+        assert storage.get_processed(CRASH_ID) == {
+            'started_datetime': '2016-09-18T12:00:00+00:00'
+        }
+
+
+class TestCrashStorageIntegration:
+
+    def test_fetch_missing_crash_raises(self, tmpdir):
+        with pytest.raises(CrashIDNotFound):
+            Crash(CRASH_ID).fetch(storage=build_storage(tmpdir))
+
+    @pytest.mark.parametrize('rule_scheduler', ['sequential', 'scheduled'])
+    def test_processor_end_to_end(self, tmpdir, raw_crash, processed_crash, rule_scheduler):
+        crash_id = raw_crash['uuid']
+        storage = build_storage(tmpdir)
+        storage.save_raw_crash(crash_id, raw_crash, {'upload_file_minidump': b'dump'})
+        # stand in for the stackwalker output
+        storage.save_raw_and_processed(
+            crash_id, raw_crash, {}, {'json_dump': processed_crash['json_dump']}
+        )
+
+        processor = Processor(ConfigManager.from_dict({
+            'CRASHSTORAGE_FS_ROOT': str(tmpdir),
+            'RULE_SCHEDULER': rule_scheduler,
+        }))
+        assert processor.run_one(crash_id)
+
+        saved = storage.get_processed(crash_id)
+        assert saved['success']
+        assert saved['uuid'] == crash_id
+        assert 'metadata' not in saved
@@ -0,0 +1,184 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import copy
+import io
+import json
+
+import pytest
+
+from jansky.jsondump import LazyJsonArray, LazyJsonDump, read_capped_json_dump
+from jansky.rules.general_transform_rules import CPUInfoRule, OSInfoRule
+from jansky.rules.mozilla_transform_rules import (
+    ExploitabilityRule,
+    FlashVersionRule,
+    TopMostFilesRule
+)
+
+from tests.testlib import _
+
+
+# the stackwalker sorts its keys; threads is broken after the first thread
+BROKEN_THREADS = (
+    '{"crash_info": {"crashing_thread": 0}, '
+    '"system_info": {"os": "Windows NT"}, '
+    '"threads": [{"frames": [{"file": "a.cpp"}]}, {"frames": [BROKEN'
+)
+
+
+class TestLazyJsonDump:
+
+    def test_same_as_decoded(self, processed_crash):
+        raw = json.dumps(processed_crash['json_dump'], sort_keys=True).encode('utf-8')
+        json_dump = LazyJsonDump(raw)
+        assert json_dump == processed_crash['json_dump']
+        assert dict(json_dump) == processed_crash['json_dump']
+
+    def test_only_decodes_what_is_looked_at(self):
+        json_dump = LazyJsonDump(BROKEN_THREADS)
+        assert json_dump['system_info']['os'] == 'Windows NT'
+        threads = json_dump['threads']
+        assert isinstance(threads, LazyJsonArray)
+        assert threads[0]['frames'][0]['file'] == 'a.cpp'
+
+        with pytest.raises(ValueError):
+            threads[1]
+        with pytest.raises(ValueError):
+            json_dump.get('thread_count')
+
+    def test_not_an_object(self):
+        with pytest.raises(ValueError):
+            LazyJsonDump(b'[1, 2]')
+
+    def test_empty(self):
+        assert LazyJsonDump(b' {} ') == {}
+        assert LazyJsonDump(b'{"threads": []}')['threads'] == []
+
+    def test_read_only(self):
+        with pytest.raises(TypeError):
+            LazyJsonDump(b'{}')['status'] = 'OK'
+
+    def test_copies_are_plain(self):
+        json_dump = LazyJsonDump(b'{"status": "OK", "threads": [{"frames": []}]}')
+        copied = copy.deepcopy(json_dump)
+        assert type(copied) is dict
+        assert type(copied['threads']) is list
+        assert copied == {'status': 'OK', 'threads': [{'frames': []}]}
+
+    def test_rules_see_the_same_thing(self, processed_crash):
+        raw = json.dumps(processed_crash['json_dump'], sort_keys=True)
+        lazy_crash = copy.deepcopy(processed_crash)
+        lazy_crash['json_dump'] = LazyJsonDump(raw)
+
+        for rule in (
+            CPUInfoRule(),
+            OSInfoRule(),
+            ExploitabilityRule(),
+            FlashVersionRule(),
+            TopMostFilesRule()
+        ):
+            rule(_, _, _, processed_crash)
+            rule(_, _, _, lazy_crash)
+
+        assert lazy_crash == processed_crash
+
+    @pytest.mark.parametrize('json_dump, max_threads, max_frames', [
+        ({
+            'status': 'OK',
+            'crashing_thread': {'frames': [{'frame': i} for i in range(20)]},
+            'threads': [
+                {'frames': [{'frame': i} for i in range(count)]}
+                for count in (5, 15, 30, 1, 1, 1)
+            ],
+        }, 4, 10),
+        ({'threads': [{'frames': []}, {'frames': [{}] * 50}]}, 1, 10),
+        ({'threads': [{'frames': [{}] * 5}]}, 10, 10),
+    ])
+    def test_caps_same_as_read_capped(self, json_dump, max_threads, max_frames):
+        lazy = LazyJsonDump(json.dumps(json_dump, sort_keys=True), max_threads, max_frames)
+        notes = lazy.truncation_notes()
+        assert (dict(lazy), notes) == read_capped(json_dump, max_threads, max_frames)
+        # asking again doesn't add notes
+        assert lazy.truncation_notes() == notes
+
+    def test_caps_while_lazy(self):
+        json_dump = {
+            'crash_info': {'crashing_thread': 0},
+            'threads': [{'frames': [{'frame': i} for i in range(20)]}] * 3,
+        }
+        lazy = LazyJsonDump(json.dumps(json_dump, sort_keys=True), 2, 5)
+        assert len(lazy['threads'][0]['frames']) == 5
+        assert len(lazy['threads']) == 2
+        assert lazy['threads'].count == 3
+
+
+def read_capped(document, max_threads=10, max_frames=10, **kwargs):
+    raw = document if isinstance(document, bytes) else json.dumps(document).encode('utf-8')
+    # a tiny chunk size so that tokens straddle chunks
+    return read_capped_json_dump(
+        io.BytesIO(raw), max_threads, max_frames, chunk_size=7, **kwargs
+    )
+
+
+class TestReadCappedJsonDump:
+
+    def test_same_as_decoded_under_the_caps(self, processed_crash):
+        json_dump = processed_crash['json_dump']
+        assert read_capped(json_dump, 1000, 1000) == (json_dump, [])
+
+    def test_values(self):
+        document = {
+            'a': [1, -2.5, 3e2, True, False, None],
+            'b': {'c': 'caf\u00e9 \\ "quoted"', 'd': {}},
+            'e': [],
+        }
+        assert read_capped(document) == (document, [])
+
+    def test_threads_and_frames_are_truncated(self):
+        json_dump = {
+            'status': 'OK',
+            'crashing_thread': {'frames': [{'frame': i} for i in range(20)]},
+            'threads': [
+                {'frames': [{'frame': i} for i in range(count)]}
+                for count in (5, 15, 30, 1, 1, 1)
+            ],
+        }
+        capped, notes = read_capped(json_dump, max_threads=4, max_frames=10)
+
+        assert capped['status'] == 'OK'
+        assert [len(thread['frames']) for thread in capped['threads']] == [5, 10, 10, 1]
+        assert capped['threads'][1]['frames'][-1] == {'frame': 9}
+        assert len(capped['crashing_thread']['frames']) == 10
+        assert notes == [
+            'json_dump truncated to 4 threads from 6',
+            'json_dump truncated to 10 frames per thread in 2 places, up to 30',
+            'json_dump truncated to 10 crashing_thread frames from 20',
+        ]
+
+    def test_dropped_threads_are_not_built(self):
+        # frames in dropped threads don't count towards the frame cap
+        json_dump = {'threads': [{'frames': []}, {'frames': [{}] * 50}]}
+        assert read_capped(json_dump, max_threads=1) == (
+            {'threads': [{'frames': []}]},
+            ['json_dump truncated to 1 threads from 2'],
+        )
+
+    @pytest.mark.parametrize('raw', [
+        b'',
+        b'not json',
+        b'[1, 2]',
+        b'{"a": 1',
+        b'{"a": 1} {"b": 2}',
+        b'{"a" 1}',
+        b'{"a": [1 2]}',
+        b'[' * 200 + b']' * 200,
+    ])
+    def test_broken_output(self, raw):
+        with pytest.raises(ValueError):
+            read_capped(raw)
+
+    def test_tokens_are_bounded(self):
+        raw = json.dumps({'a': 'x' * 100}).encode('utf-8')
+        with pytest.raises(ValueError):
+            read_capped(raw, max_token_length=50)
@@ -0,0 +1,194 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from jansky.modules import (
+    Classification,
+    IntervalIndex,
+    KnownModule,
+    KnownModuleClassifier,
+    ModuleIndex,
+    get_module_index,
+    parse_address
+)
+
+
+MODULES = [
+    {
+        'filename': 'firefox.exe',
+        'debug_id': 'AAAA',
+        'base_addr': '0x1000',
+        'end_addr': '0x2000',
+    },
+    {
+        'filename': 'NPSWF32_1_2_3.dll',
+        'debug_id': 'BBBB',
+        'base_addr': '0x5000',
+        'end_addr': '0x8000',
+    },
+    {
+        'filename': 'xul.dll',
+        'debug_id': 'CCCC',
+        'base_addr': '0x3000',
+        'end_addr': '0x4000',
+    },
+    {
+        'filename': 'NPSWF32.dll',
+        'debug_id': 'BBBB',
+    },
+    {
+        'base_addr': 'garbage',
+    },
+]
+
+
+class TestModuleIndex:
+
+    def test_is_the_modules_in_order(self):
+        index = ModuleIndex(MODULES)
+        assert list(index) == MODULES
+        assert index[1] is MODULES[1]
+
+    def test_by_filename(self):
+        index = ModuleIndex(MODULES)
+        assert index.by_filename('xul.dll') == [MODULES[2]]
+        assert index.by_filename('libxul.so') == []
+
+    def test_by_debug_id(self):
+        index = ModuleIndex(MODULES)
+        assert index.by_debug_id('BBBB') == [MODULES[1], MODULES[3]]
+
+    def test_with_prefix(self):
+        index = ModuleIndex(MODULES)
+        assert index.with_prefix('NPSWF32') == [MODULES[1], MODULES[3]]
+        assert index.with_prefix('xul', 'firefox') == [MODULES[0], MODULES[2]]
+        assert index.with_prefix('NPSWF32_1_2_3.dll') == [MODULES[1]]
+        assert index.with_prefix('zzz') == []
+
+    def test_at_address(self):
+        index = ModuleIndex(MODULES)
+        assert index.at_address(0x1000) is MODULES[0]
+        assert index.at_address('0x1fff') is MODULES[0]
+        assert index.at_address('0x2000') is None
+        assert index.at_address('0x3500') is MODULES[2]
+        assert index.at_address('0x7fff') is MODULES[1]
+        assert index.at_address('0x0') is None
+        assert index.at_address('0x9000') is None
+        assert index.at_address(None) is None
+
+    def test_for_frames(self):
+        index = ModuleIndex(MODULES)
+        frames = [
+            {'frame': 0, 'offset': '0x3010'},
+            {'frame': 1, 'offset': '0x5010'},
+            {'frame': 2, 'offset': '0x9000'},
+            {'frame': 3},
+        ]
+        assert index.for_frames(frames) == [MODULES[2], MODULES[1], None, None]
+
+    def test_parse_address(self):
+        assert parse_address('0x12e0000') == 0x12e0000
+        assert parse_address(10) == 10
+        assert parse_address('') is None
+        assert parse_address(None) is None
+
+
+class TestIntervalIndex:
+
+    def test_disjoint(self):
+        index = IntervalIndex([(10, 20, 'a'), (0, 5, 'b'), (20, 30, 'c')])
+        assert index.lookup_many([-1, 0, 4, 5, 10, 19, 20, 29, 30]) == [
+            None, 'b', 'b', None, 'a', 'a', 'c', 'c', None
+        ]
+
+    def test_overlaps_go_to_the_first_added(self):
+        index = IntervalIndex([
+            (10, 20, 'a'),
+            (0, 100, 'outer'),
+            (15, 30, 'shadowed'),
+            (95, 110, 'b'),
+            (5, 5, 'empty'),
+        ])
+        assert [index.lookup(x) for x in (0, 9, 10, 19, 20, 29, 99, 100, 109, 110)] == [
+            'outer', 'outer', 'a', 'a', 'outer', 'outer', 'outer', 'b', 'b', None
+        ]
+
+    def test_same_as_a_linear_scan(self):
+        intervals = [
+            (start, start + length, rank)
+            for rank, (start, length) in enumerate(
+                [(7, 30), (0, 3), (50, 2), (12, 4), (1, 60), (40, 40), (90, 1)]
+            )
+        ]
+        index = IntervalIndex(intervals)
+        for address in range(-2, 100):
+            expected = next(
+                (value for start, end, value in intervals if start <= address < end),
+                None
+            )
+            assert index.lookup(address) == expected
+
+
+CLASSIFIER = KnownModuleClassifier([
+    KnownModule(
+        'flash', ['NPSWF32'], r'NPSWF32_?(?P<version>.*)\.dll',
+        version_separator='_', debug_ids={'BBBB': '9.0'}
+    ),
+    KnownModule('browser', ['firefox', 'xul'], r'(firefox\.exe|xul\.dll)$'),
+    # never reached for xul.dll, the entry above wins
+    KnownModule('xul', ['xul'], r'xul'),
+])
+
+
+class TestKnownModuleClassifier:
+
+    def test_classify_module(self):
+        assert CLASSIFIER.classify_module(MODULES[1]) == Classification('flash', '1.2.3')
+        assert CLASSIFIER.classify_module(MODULES[2]) == Classification('browser', None)
+        assert CLASSIFIER.classify_module({'filename': 'libxul.so'}) is None
+        assert CLASSIFIER.classify_module({'filename': 'xulrunner'}) == (
+            Classification('xul', None)
+        )
+        assert CLASSIFIER.classify_module({'filename': 'firefox'}) is None
+        assert CLASSIFIER.classify_module({}) is None
+
+    def test_version_precedence(self):
+        classify = CLASSIFIER.classify_module
+        module = {'filename': 'NPSWF32_1_2.dll', 'version': '3.4', 'debug_id': 'BBBB'}
+        assert classify(module).version == '3.4'
+        module = {'filename': 'NPSWF32_1_2.dll', 'debug_id': 'BBBB'}
+        assert classify(module).version == '1.2'
+        module = {'filename': 'NPSWF32.dll', 'debug_id': 'BBBB'}
+        assert classify(module).version == '9.0'
+        module = {'filename': 'NPSWF32.dll', 'debug_id': 'CCCC'}
+        assert classify(module).version is None
+
+    def test_classify_in_module_order(self):
+        expected = [
+            (MODULES[0], Classification('browser', None)),
+            (MODULES[1], Classification('flash', '1.2.3')),
+            (MODULES[2], Classification('browser', None)),
+            (MODULES[3], Classification('flash', '9.0')),
+        ]
+        assert CLASSIFIER.classify(MODULES) == expected
+
+        index = ModuleIndex(MODULES)
+        assert index.classify(CLASSIFIER) == expected
+        # worked out once per index
+        assert index.classify(CLASSIFIER) is index.classify(CLASSIFIER)
+
+
+class TestGetModuleIndex:
+
+    def test_kept_in_metadata(self):
+        processed_crash = {'json_dump': {'modules': MODULES}, 'metadata': {}}
+        index = get_module_index(processed_crash)
+        assert get_module_index(processed_crash) is index
+
+        # a new modules list gets a new index
+        processed_crash['json_dump'] = {'modules': MODULES[:1]}
+        assert list(get_module_index(processed_crash)) == MODULES[:1]
+
+    def test_without_metadata(self):
+        assert list(get_module_index({'json_dump': {'modules': MODULES}})) == MODULES
+        assert list(get_module_index({})) == []
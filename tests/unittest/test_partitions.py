@@ -0,0 +1,65 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import datetime
+
+from freezegun import freeze_time
+import pytest
+
+from jansky import crashid
+from jansky.partitions import WeeklyPartitions
+from jansky.util import create_crash_id
+
+
+def slow_partition(date):
+    # what datestring_to_weekly_partition used to do
+    return (date + datetime.timedelta(0 - date.weekday())).strftime('%Y%m%d')
+
+
+class TestWeeklyPartitions:
+
+    def test_dates_in_and_out_of_the_window(self):
+        partitions = WeeklyPartitions(days_back=10, days_ahead=2)
+        partitions.refresh(datetime.date(2015, 1, 9))
+        first = datetime.date(2014, 12, 1)
+        for days in range(60):
+            date = first + datetime.timedelta(days=days)
+            expected = slow_partition(date)
+            assert partitions.for_date(date) == expected
+            noon = datetime.datetime(date.year, date.month, date.day, 12)
+            assert partitions.for_date(noon) == expected
+            assert partitions.for_date(date.strftime('%Y-%m-%d')) == expected
+            crash_id = create_crash_id(date)
+            assert partitions.for_crash_id(crash_id) == expected
+            assert partitions.for_crash_id(crashid.pack(crash_id)) == expected
+
+    def test_bad_input(self):
+        partitions = WeeklyPartitions()
+        with pytest.raises(ValueError):
+            partitions.for_date('2015-13-01')
+        with pytest.raises(ValueError):
+            partitions.for_crash_id('de1bb258-cbbf-4589-a673-34f800161318')
+
+    def test_now_moves_the_window(self):
+        partitions = WeeklyPartitions(days_back=3, days_ahead=0)
+        with freeze_time('2015-01-09 12:00:00'):
+            assert partitions.for_date('now') == '20150105'
+            assert partitions.today == datetime.date(2015, 1, 9)
+        with freeze_time('2015-03-02 12:00:00'):
+            assert partitions.for_date('now') == '20150302'
+            assert partitions.today == datetime.date(2015, 3, 2)
+            assert '2015-02-28' in partitions._by_string
+            assert '2015-01-09' not in partitions._by_string
+
+    def test_group_crash_ids(self):
+        crash_ids = [
+            create_crash_id(datetime.date(2015, 1, 1)),
+            create_crash_id(datetime.date(2015, 1, 9)),
+            create_crash_id(datetime.date(2014, 12, 29)),
+            create_crash_id(datetime.date(2015, 1, 5)),
+        ]
+        assert WeeklyPartitions().group_crash_ids(crash_ids) == {
+            '20141229': [crash_ids[0], crash_ids[2]],
+            '20150105': [crash_ids[1], crash_ids[3]],
+        }
@@ -0,0 +1,181 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from concurrent.futures import ThreadPoolExecutor
+import copy
+
+from everett import InvalidValueError
+from everett.manager import ConfigManager
+import pytest
+
+from jansky.app import Processor
+from jansky.crash import Crash
+from jansky.pipeline import Pipeline, PipelineError, ScheduledPipeline
+from jansky.rule import Identity, Rule
+
+from tests.unittest.test_rule import BadTransformRule
+
+
+class CountingRule(Rule):
+    '''Utility subclass that records the crashes it was applied to, not a
+    testing class
+    '''
+
+    def __init__(self):
+        self.seen = []
+
+    def action(self, crash_id, raw_crash, dumps, processed_crash):
+        self.seen.append(crash_id)
+        processed_crash.setdefault('order', []).append(self)
+
+
+class TestPipeline:
+
+    def test_rules_are_reused_across_crashes(self):
+        first, second = CountingRule(), CountingRule()
+        pipeline = Pipeline(first, second)
+
+        crashes = [Crash('crash1'), Crash('crash2')]
+        for crash in crashes:
+            assert pipeline.apply(crash) is crash
+
+        assert first.seen == ['crash1', 'crash2']
+        assert second.seen == ['crash1', 'crash2']
+        assert crashes[0].processed_crash['order'] == [first, second]
+
+    def test_rule_classes_are_rejected(self):
+        with pytest.raises(PipelineError):
+            Pipeline(Identity)
+
+    def test_non_callables_are_rejected(self):
+        with pytest.raises(PipelineError):
+            Pipeline(Identity(), 'not a rule')
+
+    def test_error_suppressed(self):
+        after = CountingRule()
+        crash = Pipeline(BadTransformRule(), after).apply(
+            Crash('crash1'),
+            suppress_errors=True
+        )
+        assert isinstance(crash._errors[0], ZeroDivisionError)
+        assert after.seen == ['crash1']
+
+    def test_error_unsuppressed(self):
+        with pytest.raises(ZeroDivisionError):
+            Pipeline(BadTransformRule()).apply(Crash('crash1'))
+
+
+class TestProcessorPipeline:
+
+    def test_pipeline_built_once(self):
+        processor = Processor(ConfigManager.from_dict({}))
+        assert len(processor.pipeline) == len(processor.build_rules())
+        assert all(not isinstance(rule, type) for rule in processor.pipeline)
+
+    def test_stackwalker_rule_when_configured(self):
+        processor = Processor(ConfigManager.from_dict({
+            'STACKWALKER_COMMAND': 'stackwalk_server /symbols'
+        }))
+        names = [rule.__class__.__name__ for rule in processor.pipeline]
+        stackwalker = names.index('BreakpadStackwalkerRule')
+        assert names[stackwalker - 1] == 'FennecBetaError20150430'
+        assert names[stackwalker + 1] == 'FieldMappingRule'
+        assert processor.stackwalker_pool.size == 1
+
+    def test_scheduled_rules_when_configured(self):
+        processor = Processor(ConfigManager.from_dict({}))
+        assert type(processor.pipeline) is Pipeline
+
+        processor = Processor(ConfigManager.from_dict({
+            'RULE_SCHEDULER': 'scheduled',
+            'RULE_THREADS': '2',
+        }))
+        assert isinstance(processor.pipeline, ScheduledPipeline)
+        assert processor.pipeline.executor is not None
+        assert processor.pipeline.rules == processor.batch_pipeline.rules
+        # batches can't skip rules per crash
+        assert type(processor.batch_pipeline) is Pipeline
+        processor.pipeline.executor.shutdown()
+
+        with pytest.raises(InvalidValueError):
+            Processor(ConfigManager.from_dict({'RULE_SCHEDULER': 'parallel'}))
+
+
+class FieldRule(Rule):
+    '''Utility subclass with declared fields that copies one processed key
+    into another, not a testing class
+    '''
+
+    def __init__(self, source, target, requires=()):
+        self.source, self.target = source, target
+        self.reads = frozenset(['processed_crash.' + source])
+        self.writes = frozenset(['processed_crash.' + target])
+        self.requires = frozenset('processed_crash.' + x for x in requires)
+
+    def action(self, crash_id, raw_crash, dumps, processed_crash):
+        processed_crash[self.target] = processed_crash.get(self.source, 0) + 1
+
+
+class TestScheduledPipeline:
+
+    def test_independent_rules_share_a_stage(self):
+        a_to_b = FieldRule('a', 'b')
+        c_to_d = FieldRule('c', 'd')
+        b_to_e = FieldRule('b', 'e')
+        pipeline = ScheduledPipeline(a_to_b, b_to_e, c_to_d)
+        assert pipeline.stages == ((a_to_b, c_to_d), (b_to_e,))
+
+    def test_write_after_read_is_ordered(self):
+        reads_a = FieldRule('a', 'b')
+        writes_a = FieldRule('x', 'a')
+        pipeline = ScheduledPipeline(reads_a, writes_a)
+        assert pipeline.stages == ((reads_a,), (writes_a,))
+
+    def test_undeclared_rules_are_barriers(self):
+        first = FieldRule('a', 'b')
+        barrier = CountingRule()
+        last = FieldRule('c', 'd')
+        pipeline = ScheduledPipeline(first, barrier, last)
+        assert pipeline.stages == ((first,), (barrier,), (last,))
+
+    def test_missing_requirements_skip_downstream(self):
+        crash = Crash('crash1')
+        crash.processed_crash['a'] = 1
+        pipeline = ScheduledPipeline(
+            FieldRule('missing', 'b', requires=['missing']),
+            FieldRule('b', 'c', requires=['b']),
+            FieldRule('a', 'd', requires=['a']),
+        )
+        pipeline.apply(crash)
+        assert crash.processed_crash == {'a': 1, 'd': 2}
+
+    def test_concurrent_stages_match_serial(self, raw_crash, processed_crash):
+        rules = Processor(ConfigManager.from_dict({})).build_rules()
+        del processed_crash['metadata']
+
+        serial = Crash(raw_crash['uuid'])
+        serial.raw_crash = copy.deepcopy(raw_crash)
+        serial.processed_crash = copy.deepcopy(processed_crash)
+        Pipeline(*rules).apply(serial)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            concurrent = Crash(raw_crash['uuid'])
+            concurrent.raw_crash = copy.deepcopy(raw_crash)
+            concurrent.processed_crash = copy.deepcopy(processed_crash)
+            ScheduledPipeline(*rules, executor=executor).apply(concurrent)
+
+        for key in ('started_datetime', 'completed_datetime'):
+            del serial.processed_crash[key]
+            del concurrent.processed_crash[key]
+        assert concurrent.raw_crash == serial.raw_crash
+        assert concurrent.processed_crash == serial.processed_crash
+
+    def test_theme_rule_runs_after_addons(self):
+        pipeline = ScheduledPipeline(*Processor(ConfigManager.from_dict({})).build_rules())
+        levels = {}
+        for level, stage in enumerate(pipeline.stages):
+            for rule in stage:
+                levels[rule.__class__.__name__] = level
+        assert levels['ThemePrettyNameRule'] > levels['AddonsRule']
+        assert levels['SaveMetadata'] == len(pipeline.stages) - 1
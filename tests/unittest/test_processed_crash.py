@@ -0,0 +1,88 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import copy
+import json
+import pickle
+
+from everett.manager import ConfigManager
+import pytest
+
+from jansky.app import Processor
+from jansky.crash import Crash, CrashBatch
+from jansky.crashstorage import _json_default
+from jansky.pipeline import Pipeline
+from jansky.processed_crash import ProcessedCrash
+
+
+class TestProcessedCrash:
+
+    def test_acts_like_a_dict(self):
+        record = ProcessedCrash({'product': 'Firefox', 'unknown': 1})
+        record['version'] = '12.0'
+        record['other'] = [1]
+
+        expected = {'product': 'Firefox', 'unknown': 1, 'version': '12.0', 'other': [1]}
+        assert record == expected
+        assert expected == record
+        assert len(record) == 4
+        assert 'product' in record
+        assert 'signature' not in record
+        assert record.get('signature') is None
+        assert record.get('signature', 'x') == 'x'
+        assert record.setdefault('signature', 'EMPTY') == 'EMPTY'
+        assert record.pop('unknown') == 1
+        assert list(record) == ['product', 'signature', 'version', 'other']
+
+        del record['product']
+        del record['other']
+        assert dict(record) == {'signature': 'EMPTY', 'version': '12.0'}
+        with pytest.raises(KeyError):
+            record['product']
+        with pytest.raises(KeyError):
+            del record['product']
+        with pytest.raises(KeyError):
+            record['other']
+
+    def test_small_domains_are_interned(self):
+        first = ProcessedCrash()
+        second = ProcessedCrash()
+        first['product'] = ''.join(['Fire', 'fox'])
+        second['product'] = ''.join(['Fire', 'fox'])
+        assert first['product'] is second['product']
+
+        first['signature'] = ''.join(['fo', 'o'])
+        second['signature'] = ''.join(['fo', 'o'])
+        assert first['signature'] is not second['signature']
+
+    def test_copies_and_serializes(self):
+        record = ProcessedCrash({'product': 'Firefox', 'metadata': {'notes': []}, 'x': 1})
+        assert record.copy() == record
+        assert record.copy()['metadata'] is record['metadata']
+        assert copy.deepcopy(record) == record
+        assert copy.deepcopy(record)['metadata'] is not record['metadata']
+        assert pickle.loads(pickle.dumps(record)) == record
+        assert json.loads(json.dumps(record, default=_json_default)) == dict(record)
+
+    def test_rules_give_the_same_result(self, raw_crash, processed_crash):
+        rules = Processor(ConfigManager.from_dict({})).build_rules()
+        del processed_crash['metadata']
+
+        results = []
+        for processed_crash_class in (dict, ProcessedCrash):
+            crash = Crash(raw_crash['uuid'], processed_crash_class)
+            crash.raw_crash = copy.deepcopy(raw_crash)
+            crash.processed_crash.update(copy.deepcopy(processed_crash))
+            Pipeline(*rules).apply(crash)
+            assert isinstance(crash.processed_crash, processed_crash_class)
+            for key in ('started_datetime', 'completed_datetime'):
+                del crash.processed_crash[key]
+            results.append(crash)
+
+        assert results[0].raw_crash == results[1].raw_crash
+        assert results[0].processed_crash == results[1].processed_crash
+
+    def test_batches(self):
+        batch = CrashBatch(['crash1', 'crash2'], processed_crash_class=ProcessedCrash)
+        assert all(isinstance(crash.processed_crash, ProcessedCrash) for crash in batch)
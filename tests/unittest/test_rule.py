@@ -4,9 +4,12 @@
 
 import pytest
 
+from jansky.crash import Crash, CrashBatch
+from jansky.jsondump import LazyJsonDump
 from jansky.rule import (
     CreateMetadata,
     Identity,
+    InstrumentedRule,
     Introspector,
     Rule,
     SaveMetadata,
@@ -127,5 +130,111 @@ class TestSaveMetadata:
             processed_crash.get('processor_notes') ==
             'dwight; wilma; Processor2015; earlier processing: Unknown Date'
         )
+
+    def test_notes_what_json_dump_caps_dropped(self):
+        processed_crash = {
+            'json_dump': LazyJsonDump(
+                '{"threads": [{"frames": [1, 2, 3]}, {"frames": [1]}]}',
+                max_threads=1, max_frames=2
+            ),
+            'metadata': {'processor_notes': ['dwight']},
+        }
+
+        SaveMetadata()(_, _, _, processed_crash)
+        assert processed_crash['processor_notes'] == (
+            'dwight; json_dump truncated to 1 threads from 2; '
+            'json_dump truncated to 2 frames per thread from 3'
+        )
         assert processed_crash.get('completed_datetime', None)  # TODO: freezegun
         assert processed_crash.get('success')
+
+
+class MetricsRecorder:
+    '''Utility stand-in for a markus metrics interface, not a testing class
+    '''
+
+    def __init__(self):
+        self.records = []
+
+    def incr(self, stat, value=1, tags=None):
+        self.records.append(('incr', stat, value, tags))
+
+    def timing(self, stat, value, tags=None):
+        self.records.append(('timing', stat, value, tags))
+
+    def filter_records(self, fun_name, stat):
+        return [x for x in self.records if x[0] == fun_name and x[1] == stat]
+
+
+class TestInstrumentedRule:
+
+    def test_predicate_hit(self):
+        metrics = MetricsRecorder()
+        raw_crash = {}
+        InstrumentedRule(UUIDCorrection(), metrics)('Wilma', raw_crash, _, _)
+        assert raw_crash == {'uuid': 'Wilma'}
+        assert metrics.filter_records('incr', 'predicate') == [
+            ('incr', 'predicate', 1, ['rule:UUIDCorrection', 'result:hit'])
+        ]
+        timings = metrics.filter_records('timing', 'timing')
+        assert len(timings) == 1
+        assert timings[0][3] == ['rule:UUIDCorrection']
+
+    def test_predicate_miss(self):
+        metrics = MetricsRecorder()
+        raw_crash = {'uuid': 'Dwight'}
+        InstrumentedRule(UUIDCorrection(), metrics)('Wilma', raw_crash, _, _)
+        assert raw_crash == {'uuid': 'Dwight'}
+        assert metrics.filter_records('incr', 'predicate') == [
+            ('incr', 'predicate', 1, ['rule:UUIDCorrection', 'result:miss'])
+        ]
+
+    def test_declarations_pass_through(self):
+        r = InstrumentedRule(UUIDCorrection(), MetricsRecorder())
+        assert r.reads == UUIDCorrection.reads
+        assert r.writes == UUIDCorrection.writes
+
+    def test_suppressed_errors_counted(self):
+        metrics = MetricsRecorder()
+        crash = Crash('Wilma')
+        crash.transform(
+            InstrumentedRule(BadTransformRule(), metrics),
+            supress_errors=True
+        )
+        assert metrics.filter_records('incr', 'errors_suppressed') == [
+            (
+                'incr',
+                'errors_suppressed',
+                1,
+                ['rule:BadTransformRule', 'error:ZeroDivisionError']
+            )
+        ]
+        # the timing is emitted even though the rule blew up
+        assert len(metrics.filter_records('timing', 'timing')) == 1
+
+    def test_batches_keep_action_many(self):
+        class BatchRule(Rule):
+            def __init__(self):
+                self.batches = []
+
+            def predicate(self, crash_id, raw_crash, dumps, processed_crash):
+                return crash_id != 'skipped'
+
+            def action_many(self, crashes):
+                self.batches.append([crash[0] for crash in crashes])
+
+        metrics = MetricsRecorder()
+        rule = BatchRule()
+        instrumented = InstrumentedRule(rule, metrics)
+        CrashBatch(['Wilma', 'skipped', 'Dwight']).transform(instrumented)
+
+        assert rule.batches == [['Wilma', 'Dwight']]
+        assert len(metrics.filter_records('timing', 'batch_timing')) == 1
+        assert [record[3] for record in metrics.filter_records('incr', 'predicate')] == [
+            ['rule:BatchRule', 'result:hit'],
+            ['rule:BatchRule', 'result:miss'],
+            ['rule:BatchRule', 'result:hit'],
+        ]
+
+        # rules without action_many are still called a crash at a time
+        assert not hasattr(InstrumentedRule(UUIDCorrection(), metrics), 'action_many')
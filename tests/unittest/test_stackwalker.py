@@ -0,0 +1,188 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+from pathlib import Path
+import sys
+
+import pytest
+
+from jansky.stackwalker import (
+    StackwalkerCache,
+    StackwalkerError,
+    StackwalkerPool,
+    StackwalkerProcess,
+    StackwalkerResult,
+    StackwalkerTimeout
+)
+
+
+FAKE_STACKWALKER = [
+    sys.executable,
+    str(Path(__file__).parent.parent / 'testlib' / 'fake_stackwalker.py')
+]
+
+
+@pytest.fixture
+def make_request(tmpdir):
+    """Returns a function that writes a dump and builds a request for it"""
+    def _make_request(crash_id, dump=b'MDMP'):
+        path = tmpdir.join(crash_id)
+        path.write_binary(dump)
+        return {'crash_id': crash_id, 'dump_path': str(path), 'raw_crash': {}}
+    return _make_request
+
+
+def output(result):
+    return json.loads(result.output.decode('utf-8'))
+
+
+class TestStackwalkerProcess:
+
+    def test_pipelined_requests_come_back_in_order(self, make_request):
+        process = StackwalkerProcess(FAKE_STACKWALKER, timeout=10)
+        try:
+            requests = [make_request('crash%d' % i, b'x' * i) for i in range(20)]
+            results = process.walk_many(requests)
+        finally:
+            process.kill()
+
+        assert [output(x)['crash_id'] for x in results] == [
+            'crash%d' % i for i in range(20)
+        ]
+        assert [output(x)['dump_size'] for x in results] == list(range(20))
+        # all of them were walked by the same process
+        assert len(set(output(x)['pid'] for x in results)) == 1
+
+    def test_restarts_after_a_crash(self, make_request):
+        process = StackwalkerProcess(FAKE_STACKWALKER, timeout=10)
+        try:
+            results = process.walk_many([
+                make_request('before'),
+                make_request('bad', b'crash'),
+                make_request('after'),
+            ])
+        finally:
+            process.kill()
+
+        assert output(results[0])['crash_id'] == 'before'
+        assert isinstance(results[1], StackwalkerError)
+        assert output(results[2])['crash_id'] == 'after'
+        assert output(results[0])['pid'] != output(results[2])['pid']
+
+    def test_timeout_kills_the_process(self, make_request):
+        process = StackwalkerProcess(FAKE_STACKWALKER, timeout=0.5)
+        try:
+            results = process.walk_many([
+                make_request('slow', b'hang'),
+                make_request('after'),
+            ])
+        finally:
+            process.kill()
+
+        assert isinstance(results[0], StackwalkerTimeout)
+        assert output(results[1])['crash_id'] == 'after'
+
+    def test_nonzero_returncode(self, make_request):
+        process = StackwalkerProcess(FAKE_STACKWALKER, timeout=10)
+        try:
+            result, = process.walk_many([make_request('bad', b'garbage')])
+        finally:
+            process.kill()
+        assert result.returncode == 1
+        assert result.output == b'not json'
+
+    def test_big_output_is_spooled(self, make_request):
+        process = StackwalkerProcess(FAKE_STACKWALKER, timeout=10, max_output_bytes=10)
+        try:
+            results = process.walk_many([
+                make_request('crash1'),
+                make_request('crash2'),
+            ])
+        finally:
+            process.kill()
+
+        for crash_id, result in zip(['crash1', 'crash2'], results):
+            assert not isinstance(result.output, bytes)
+            with result.output as fp:
+                assert json.loads(fp.read().decode('utf-8'))['crash_id'] == crash_id
+
+
+class TestStackwalkerPool:
+
+    def test_processes_are_reused(self, make_request):
+        pool = StackwalkerPool(FAKE_STACKWALKER, size=2, timeout=10)
+        try:
+            pids = set(
+                output(pool.walk(make_request('crash%d' % i)))['pid']
+                for i in range(5)
+            )
+        finally:
+            pool.close()
+        # serial requests keep going to the warm process
+        assert len(pids) == 1
+
+    def test_walk_raises_errors(self, make_request):
+        pool = StackwalkerPool(FAKE_STACKWALKER, timeout=10)
+        try:
+            with pytest.raises(StackwalkerError):
+                pool.walk(make_request('bad', b'crash'))
+            assert output(pool.walk(make_request('good')))['crash_id'] == 'good'
+        finally:
+            pool.close()
+
+
+class TestStackwalkerCache:
+
+    def test_key_depends_on_dump_and_version(self):
+        cache = StackwalkerCache(version='1')
+        assert cache.key(b'MDMP') == cache.key(memoryview(b'MDMP'))
+        assert cache.key(b'MDMP') != cache.key(b'MDMQ')
+        assert cache.key(b'MDMP') != StackwalkerCache(version='2').key(b'MDMP')
+
+    def test_memory_tier_is_lru(self):
+        cache = StackwalkerCache(max_memory_bytes=10)
+        cache.put('a', StackwalkerResult(0, b'aaaa'))
+        cache.put('b', StackwalkerResult(0, b'bbbb'))
+        assert cache.get('a').output == b'aaaa'
+        cache.put('c', StackwalkerResult(0, b'cccc'))
+
+        assert cache.get('b') is None
+        assert cache.get('a').output == b'aaaa'
+        assert cache.get('c').output == b'cccc'
+
+    def test_failures_are_not_cached(self):
+        cache = StackwalkerCache()
+        cache.put('a', StackwalkerResult(1, b'not json'))
+        assert cache.get('a') is None
+
+    def test_spooled_output_is_not_cached(self, tmpdir):
+        cache = StackwalkerCache()
+        with tmpdir.join('output').open('w+b') as fp:
+            cache.put('key', StackwalkerResult(0, fp))
+        assert cache.get('key') is None
+
+    def test_disk_tier(self, tmpdir):
+        cache = StackwalkerCache(max_memory_bytes=0, directory=str(tmpdir))
+        cache.put('abcd', StackwalkerResult(0, b'{"status": "OK"}'))
+
+        fresh = StackwalkerCache(max_memory_bytes=0, directory=str(tmpdir))
+        assert fresh.get('abcd') == StackwalkerResult(0, b'{"status": "OK"}')
+        assert fresh.get('dcba') is None
+
+    def test_disk_tier_evicts_least_recently_used(self, tmpdir):
+        cache = StackwalkerCache(
+            max_memory_bytes=0, directory=str(tmpdir), max_disk_bytes=250
+        )
+        for index, key in enumerate(['aa', 'bb', 'cc']):
+            cache.put(key, StackwalkerResult(0, b'x' * 98))
+            # make the write order visible in the mtimes
+            path = tmpdir.join(key[:2], key)
+            os.utime(str(path), (index, index))
+
+        cache.put('dd', StackwalkerResult(0, b'x' * 98))
+        assert cache.get('aa') is None
+        assert cache.get('bb') is None
+        assert cache.get('dd') is not None
@@ -14,6 +14,7 @@ from jansky.util import (
     date_to_string,
     get_date_from_crash_id,
     string_to_datetime,
+    strings_to_datetimes,
     utc_now
 )
 
@@ -138,6 +139,57 @@ def test_string_datetime_with_timezone():
         assert isinstance(res, datetime.datetime)
 
 
+@pytest.mark.parametrize('date', [
+    '2012-01-10T12:13:14',
+    '2012-01-10T12:13:14.98765',
+    '2012-01-10T12:13:14.1234567',
+    '2012-01-10T12:13:14.98765+03:00',
+    '2012-01-10T12:13:14-0130',
+    '2012-01-10T12:13:14+00:00',
+    '2012-01-10T12:13:14+03',
+    '2012-01-10T12:13:14Z',
+    '2012-01-10 12:13:14.98765Z',
+    '20120110T121314Z',
+    # the old way rejected these
+    '2012-01-10\n',
+    '2012-01-10T12:13:14Z\n',
+])
+def test_string_to_datetime_same_as_isodate(date):
+    try:
+        expected = isodate.parse_datetime(date.replace(' ', 'T'))
+    except isodate.ISO8601Error:
+        with pytest.raises(isodate.ISO8601Error):
+            string_to_datetime(date)
+        return
+    if not expected.tzinfo:
+        expected = expected.replace(tzinfo=UTC)
+
+    res = string_to_datetime(date)
+    assert res == expected
+    assert res.utcoffset() == expected.utcoffset()
+    assert res.tzname() == expected.tzname()
+
+
+def test_string_to_datetime_is_cached():
+    date = '2012-01-10T12:13:14.987654+03:00'
+    assert string_to_datetime(date) is string_to_datetime(date)
+
+    with pytest.raises(ValueError):
+        string_to_datetime('2012-02-30T12:13:14')
+
+
+def test_strings_to_datetimes():
+    dates = [
+        '2012-01-10T12:13:14Z',
+        None,
+        ['2012-01-10', '12:13:14'],
+        '2012-01-10T12:13:14Z',
+        '2012-01-10',
+    ]
+    assert strings_to_datetimes(dates) == [string_to_datetime(x) for x in dates]
+    assert strings_to_datetimes([]) == []
+
+
 def test_date_to_string():
     # Datetime with timezone
     date = datetime.datetime(2012, 1, 3, 12, 23, 34, tzinfo=UTC)